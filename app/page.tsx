@@ -22,7 +22,6 @@ import { Collapsible, CollapsibleContent, CollapsibleTrigger } from "@/component
 import { Checkbox } from "@/components/ui/checkbox"
 import { cn } from "@/lib/utils"
 import {
-  blobToBase64,
   compressImage,
   createImagePreview,
   createThumbnailDataUrl,
@@ -209,16 +208,14 @@ export default function IngrediScanAI() {
       setProgress(40)
       setProcessingStage("uploading")
 
-      // 转换为 Base64
-      const base64 = await blobToBase64(compressedBlob)
-      const imageType = file.type || 'image/jpeg'
+      const imageType = compressedBlob.type || file.type || 'image/jpeg'
 
       setProgress(60)
       setProcessingStage("analyzing")
       setCurrentPage("processing")
 
       // 调用分析 API
-      const result = await analyzeImage(base64, imageType)
+      const result = await analyzeImage(compressedBlob, imageType)
       
       setAnalysisResult(result)
       setProgress(100)
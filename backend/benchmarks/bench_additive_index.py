@@ -0,0 +1,163 @@
+"""
+添加剂索引基准：Aho-Corasick 自动机 vs 逐个名称 str.find 扫描，词典规模 1k-50k
+
+用法（在 backend 目录下）：
+    python benchmarks/bench_additive_index.py
+    python benchmarks/bench_additive_index.py --sizes 1000 50000 --iterations 200
+    python benchmarks/bench_additive_index.py --regressions-only
+
+词典 = 内置 additives.json 的全部条目 + 随机生成的中英文合成名称，补足到指定规模（模式数，含 E 编号写法）。
+扫描文本是 benchmarks/corpus/ocr_texts/ 下全部 OCR 文字；consistent 检查自动机命中的条目都能被 naive 扫描找到。
+- automaton：AdditiveKnowledgeBase.scan（规范化 + 自动机扫描 + 词边界过滤 + 最长匹配）
+- naive：每个名称在规范化文本上循环 str.find（旧版 AdditiveKnowledgeBase.match 的做法）
+build_peak_mb 为构建自动机时 tracemalloc 记录的 Python 内存峰值。
+
+计时之前先跑 benchmarks/corpus/known_risks_cases.json 中的回归用例（否定 / 无添加声明、储存说明、exclusions 短语等误报场景），
+每个用例输出一行：known_risks 命中的条目（E 编号或第一个名称）应包含 present、不包含 absent；
+带 model_ingredients 的用例另检查 merge_risks 的结果（模型配料中没有的过敏原不应加入）。有用例不通过时最后以退出码 1 结束。
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from services.additive_index import AdditiveKnowledgeBase, KBEntry, _is_word_match, _normalize  # noqa: E402
+from services.vlm_service import AnalyzeResponse  # noqa: E402
+
+CORPUS_DIR = Path(__file__).resolve().parent / "corpus" / "ocr_texts"
+CASES_PATH = Path(__file__).resolve().parent / "corpus" / "known_risks_cases.json"
+CJK_CHARS = "".join(chr(code) for code in range(0x4E00, 0x4E00 + 3000))
+
+
+def synthetic_entries(base: AdditiveKnowledgeBase, size: int, seed: int) -> list[KBEntry]:
+    """补足到 size 个模式；一半拉丁字母（1-3 个词），一半 2-6 个汉字"""
+    rng = random.Random(seed)
+    entries = list(base.entries)
+    patterns = len(base.automaton)
+    index = 0
+    while patterns < size:
+        if index % 2:
+            name = "".join(rng.choice(CJK_CHARS) for _ in range(rng.randint(2, 6)))
+        else:
+            name = " ".join(
+                "".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(rng.randint(4, 10)))
+                for _ in range(rng.randint(1, 3))
+            )
+        entries.append(KBEntry(code="", names=(name,), level="Low", category="synthetic", desc=""))
+        patterns += 1
+        index += 1
+    return entries
+
+
+def naive_scan(names: list[tuple[str, KBEntry]], text: str) -> set[KBEntry]:
+    normalized, _ = _normalize(text)
+    found = set()
+    for name, entry in names:
+        start = normalized.find(name)
+        while start >= 0:
+            if _is_word_match(normalized, name, start, start + len(name)):
+                found.add(entry)
+            start = normalized.find(name, start + 1)
+    return found
+
+
+def entry_keys(kb: AdditiveKnowledgeBase, names: list[str]) -> set[str]:
+    return {entry.code or entry.names[0] for name in names for entry in kb.match(name)}
+
+
+def check_case(kb: AdditiveKnowledgeBase, case: dict) -> dict:
+    known_risks = kb.known_risks(case["text"])
+    found = entry_keys(kb, [risk.name for risk in known_risks])
+    failures = [f"missing {key}" for key in case.get("present", []) if key not in found]
+    failures += [f"unexpected {key}" for key in case.get("absent", []) if key in found]
+    result = {"case": case["name"], "known": sorted(found)}
+    if "model_ingredients" in case:
+        model_result = AnalyzeResponse(
+            health_score="C",
+            summary="-",
+            full_ingredients=case["model_ingredients"],
+            risks=[],
+            alternatives=[],
+        )
+        merged = entry_keys(kb, [risk.name for risk in kb.merge_risks(model_result, known_risks).risks])
+        failures += [f"merged missing {key}" for key in case.get("merged_present", []) if key not in merged]
+        failures += [f"merged unexpected {key}" for key in case.get("merged_absent", []) if key in merged]
+        result["merged"] = sorted(merged)
+    return {**result, "pass": not failures, "failures": failures}
+
+
+def timed(func, iterations: int) -> list[float]:
+    latencies = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func()
+        latencies.append((time.perf_counter() - start) * 1e6)
+    latencies.sort()
+    return latencies
+
+
+def bench(size: int, text: str, iterations: int) -> dict:
+    base = AdditiveKnowledgeBase.load()
+    entries = synthetic_entries(base, size, seed=size)
+
+    tracemalloc.start()
+    build_start = time.perf_counter()
+    kb = AdditiveKnowledgeBase(entries, base.alternatives, base.version, base.exclusions)
+    build_ms = (time.perf_counter() - build_start) * 1000
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    # 与自动机相同的模式集合（E 编号写法 + 规范化名称）
+    names = [value for _, value in kb.automaton._values]
+    automaton_entries = {match.entry for match in kb.scan(text)}
+    naive_entries = naive_scan(names, text)
+    automaton_us = timed(lambda: kb.scan(text), iterations)
+    naive_us = timed(lambda: naive_scan(names, text), max(1, iterations // 10))
+    return {
+        "patterns": len(kb.automaton),
+        "nodes": kb.automaton.node_count,
+        "text_chars": len(text),
+        "build_ms": round(build_ms, 1),
+        "build_peak_mb": round(peak / 1024 / 1024, 1),
+        "automaton_p50_us": round(statistics.median(automaton_us), 1),
+        "naive_p50_us": round(statistics.median(naive_us), 1),
+        "speedup": round(statistics.median(naive_us) / statistics.median(automaton_us), 1),
+        "matched_entries": len(automaton_entries),
+        # 自动机取最长匹配，被更长名称覆盖的短名称不计入，因此是 naive 结果的子集
+        "consistent": automaton_entries <= naive_entries,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 5000, 10000, 50000])
+    parser.add_argument("--iterations", type=int, default=100)
+    parser.add_argument("--regressions-only", action="store_true", help="只跑回归用例，不计时")
+    args = parser.parse_args()
+
+    kb = AdditiveKnowledgeBase.load()
+    failed = 0
+    for case in json.loads(CASES_PATH.read_text(encoding="utf-8")):
+        result = check_case(kb, case)
+        failed += not result["pass"]
+        print(json.dumps(result, ensure_ascii=False), flush=True)
+
+    if not args.regressions_only:
+        text = "\n".join(path.read_text(encoding="utf-8") for path in sorted(CORPUS_DIR.glob("*.txt")))
+        for size in args.sizes:
+            print(json.dumps(bench(size, text, args.iterations)), flush=True)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+"""
+准入控制压测：过载时有效吞吐（goodput）是否保持平稳
+
+用法（在 backend 目录下）：
+    python benchmarks/bench_admission.py
+    python benchmarks/bench_admission.py --clients 4 16 64 --duration 15
+
+每个配置启动一个独立的 uvicorn 子进程（结果缓存和近似重复索引关闭），VLM 调用替换为一个容量有限的假上游：
+同时最多处理 --upstream-capacity 个请求，每个耗时 --service-seconds，超出的请求在上游排队，并且在调用期间持有解码后的图片。
+客户端为闭环并发：每个客户端收到响应后立即发下一张（每张图片内容不同），--client-timeout 秒内没有响应就断开重发，
+收到 429 / 503 时等待 min(Retry-After, 0.2) 秒后重发。
+
+- off：准入上限设为极大值，相当于没有准入控制；过载时所有请求都被接收、解码后在上游排队，排队时间吃掉客户端超时，
+  超时断开的请求要到下一次断开检测（DISCONNECT_POLL_SECONDS）才被取消，期间仍占着上游位置和解码内存，
+  goodput（客户端超时前拿到 200 的请求数 / 秒）下降、RSS 随并发上涨
+- on：ADMISSION_MAX_IN_FLIGHT = 上游容量，排队超时小于客户端超时，超出的请求快速得到 429 / 503
+peak_rss_mb 为服务进程的 VmHWM。
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import io
+import json
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import httpx
+from PIL import Image
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND_DIR))
+
+
+def serve(port: int, service_seconds: float, upstream_capacity: int) -> None:
+    """子进程：假上游替换 VLM 调用后启动服务"""
+    import uvicorn
+
+    import main
+
+    upstream = asyncio.Semaphore(upstream_capacity)
+
+    async def fake_analyze(image, ocr_text="", request_id="-", image_bytes=None, known_risks=None):
+        pixels = await asyncio.to_thread(image.convert, "RGB")
+        async with upstream:
+            await asyncio.sleep(service_seconds)
+        return main.AnalyzeResponse(
+            health_score="B",
+            summary=f"{pixels.size}",
+            risks=[],
+            full_ingredients=["water"],
+            alternatives=[],
+        )
+
+    main.vlm_service.analyze_ingredients = fake_analyze
+    uvicorn.run(main.app, host="127.0.0.1", port=port, log_level="warning")
+
+
+def make_images(count: int, size: int) -> list[bytes]:
+    rng = random.Random(0)
+    images = []
+    for _ in range(count):
+        image = Image.new("RGB", (size, size), tuple(rng.randrange(256) for _ in range(3)))
+        image.putpixel((0, 0), (rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+        buffer = io.BytesIO()
+        image.save(buffer, format="JPEG", quality=90)
+        images.append(buffer.getvalue())
+    return images
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def peak_rss_mb(pid: int) -> float:
+    with open(f"/proc/{pid}/status", "r", encoding="utf-8") as status_file:
+        for line in status_file:
+            if line.startswith("VmHWM:"):
+                return round(int(line.split()[1]) / 1024, 1)
+    return 0.0
+
+
+async def drive(port: int, images: list[bytes], clients: int, duration: float, client_timeout: float) -> dict:
+    counts = {"ok": 0, "429": 0, "503": 0, "timeout": 0, "other": 0}
+    latencies: list[float] = []
+    deadline = time.perf_counter() + duration
+    sequence = iter(range(10**9))
+    limits = httpx.Limits(max_connections=clients * 2, max_keepalive_connections=clients)
+
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", limits=limits) as client:
+
+        async def run_client() -> None:
+            while time.perf_counter() < deadline:
+                index = next(sequence)
+                start = time.perf_counter()
+                try:
+                    response = await client.post(
+                        "/api/v1/analyze/upload",
+                        content=images[index % len(images)],
+                        headers={"content-type": "image/jpeg", "x-request-id": f"load-{index}"},
+                        timeout=client_timeout,
+                    )
+                except httpx.TimeoutException:
+                    counts["timeout"] += 1
+                    continue
+                elapsed = time.perf_counter() - start
+                if response.status_code == 200:
+                    counts["ok"] += 1
+                    latencies.append(elapsed * 1000)
+                elif response.status_code in (429, 503):
+                    counts[str(response.status_code)] += 1
+                    await asyncio.sleep(min(float(response.headers.get("retry-after", "1")), 0.2))
+                else:
+                    counts["other"] += 1
+
+        await asyncio.gather(*(run_client() for _ in range(clients)))
+
+    latencies.sort()
+    return {
+        **counts,
+        "goodput_rps": round(counts["ok"] / duration, 2),
+        "ok_p50_ms": round(statistics.median(latencies)) if latencies else None,
+        "ok_p95_ms": round(latencies[int(len(latencies) * 0.95) - 1]) if latencies else None,
+    }
+
+
+def run_config(mode: str, clients: int, args, images: list[bytes]) -> dict:
+    port = free_port()
+    env = {
+        **os.environ,
+        "RESULT_CACHE_MAX_ENTRIES": "0",
+        "NEAR_DUPLICATE_MAX_ENTRIES": "0",
+        "OCR_MODE": "off",
+        "INGREDIENT_DESCRIPTION_MODE": "inline",
+    }
+    if mode == "on":
+        env.update(
+            ADMISSION_MAX_IN_FLIGHT=str(args.upstream_capacity),
+            ADMISSION_MAX_QUEUE=str(args.upstream_capacity * 2),
+            ADMISSION_QUEUE_TIMEOUT_SECONDS=str(args.client_timeout / 2),
+        )
+    else:
+        env.update(ADMISSION_MAX_IN_FLIGHT="100000", ADMISSION_MAX_QUEUE="100000", ADMISSION_RSS_HIGH_WATER_MB="0")
+    server = subprocess.Popen(
+        [
+            sys.executable,
+            __file__,
+            "--serve",
+            str(port),
+            "--service-seconds",
+            str(args.service_seconds),
+            "--upstream-capacity",
+            str(args.upstream_capacity),
+        ],
+        cwd=BACKEND_DIR,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        for _ in range(200):
+            try:
+                if httpx.get(f"http://127.0.0.1:{port}/health", timeout=1).status_code == 200:
+                    break
+            except httpx.HTTPError:
+                time.sleep(0.1)
+        result = asyncio.run(drive(port, images, clients, args.duration, args.client_timeout))
+        rss = peak_rss_mb(server.pid)
+    finally:
+        server.terminate()
+        server.wait()
+    return {"admission": mode, "clients": clients, **result, "peak_rss_mb": rss}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, nargs="+", default=[4, 16, 64])
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--service-seconds", type=float, default=0.2)
+    parser.add_argument("--upstream-capacity", type=int, default=4)
+    parser.add_argument("--client-timeout", type=float, default=2.0)
+    parser.add_argument("--image-size", type=int, default=1200, help="测试图片边长（像素），决定每个请求持有的内存")
+    parser.add_argument("--modes", nargs="+", default=["off", "on"], choices=["off", "on"])
+    parser.add_argument("--serve", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve, args.service_seconds, args.upstream_capacity)
+        return
+
+    images = make_images(256, args.image_size)
+    print(
+        json.dumps(
+            {
+                "upstream_capacity_rps": round(args.upstream_capacity / args.service_seconds, 1),
+                "client_timeout_s": args.client_timeout,
+                "image_bytes": len(images[0]),
+            }
+        ),
+        flush=True,
+    )
+    for clients in args.clients:
+        for mode in args.modes:
+            print(json.dumps(run_config(mode, clients, args, images)), flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+成分说明缓存对 VLM 输出 token 的影响：inline（模型为每个成分写说明）vs cache（只返回成分名）
+
+用法（在 backend 目录下）：
+    python benchmarks/bench_description_cache.py
+    OPENROUTER_API_KEY=... python benchmarks/bench_description_cache.py --live 3
+
+离线部分：取 benchmarks/corpus/model_outputs/ 中的完整模型输出，按两种提示词的格式重新序列化，
+比较输出长度和估算 token（汉字按 1 token、其余字符按 4 字符 1 token 估算，仅用于相对比较）。
+cold 行额外计入缓存全部未命中时补充说明请求的输出（即首次见到这些成分时的开销）。
+
+--live N 真实调用 OpenRouter：同一张标签图各以 inline / cache 模式分析 N 次，
+输出 response.usage 中的 completion_tokens 与端到端耗时（需要 API Key，会消耗配额）。
+cache 模式使用临时的空缓存：第一次调用包含补充说明请求，之后的调用全部命中缓存。
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from services.description_cache import IngredientDescriptionCache  # noqa: E402
+from services.tolerant_json import parse_model_json  # noqa: E402
+
+CORPUS_DIR = Path(__file__).resolve().parent / "corpus" / "model_outputs"
+CASES = ("clean_bare", "long_output")
+
+
+def estimate_tokens(text: str) -> int:
+    cjk = sum(1 for ch in text if "㐀" <= ch <= "鿿")
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def offline_rows() -> list[dict]:
+    rows = []
+    for case in CASES:
+        data, _, _ = parse_model_json((CORPUS_DIR / f"{case}.txt").read_text(encoding="utf-8"))
+        items = data.get("full_ingredients", [])
+        names = [item["name"] if isinstance(item, dict) else str(item) for item in items]
+        descriptions = {
+            item["name"]: item.get("description", "") for item in items if isinstance(item, dict)
+        }
+        inline_text = json.dumps(data, ensure_ascii=False, indent=2)
+        compact_text = json.dumps({**data, "full_ingredients": names}, ensure_ascii=False, indent=2)
+        describe_text = json.dumps(descriptions, ensure_ascii=False, indent=2)
+        inline_tokens = estimate_tokens(inline_text)
+        compact_tokens = estimate_tokens(compact_text)
+        rows.append(
+            {
+                "case": case,
+                "ingredients": len(names),
+                "inline_chars": len(inline_text),
+                "compact_chars": len(compact_text),
+                "inline_est_tokens": inline_tokens,
+                "warm_est_tokens": compact_tokens,
+                "cold_est_tokens": compact_tokens + estimate_tokens(describe_text),
+                "warm_reduction": round(1 - compact_tokens / inline_tokens, 3),
+            }
+        )
+    return rows
+
+
+async def live_rows(calls: int) -> list[dict]:
+    from benchmarks.bench_rule_engine import CORPUS_DIR as OCR_DIR, render_label
+    from services.vlm_service import VLMService
+
+    image, image_data = render_label((OCR_DIR / "en_soda.txt").read_text(encoding="utf-8"))
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode in ("inline", "cache"):
+            cache = IngredientDescriptionCache(Path(tmp) / "descriptions.sqlite3") if mode == "cache" else None
+            service = VLMService(description_cache=cache)
+            usage_log: list[tuple[str, object]] = []
+            service._log_usage = lambda request_id, call, usage, model=None: usage_log.append((call, usage))
+            try:
+                for i in range(calls):
+                    usage_log.clear()
+                    start = time.perf_counter()
+                    result = await service.analyze_ingredients(image, request_id=f"bench-{mode}-{i}", image_bytes=image_data)
+                    rows.append(
+                        {
+                            "mode": mode,
+                            "call": i,
+                            "error_type": result.error_type,
+                            "elapsed_ms": round((time.perf_counter() - start) * 1000),
+                            "described": len(result.ingredients_detail or []),
+                            "completion_tokens": {
+                                call: getattr(usage, "completion_tokens", None) for call, usage in usage_log
+                            },
+                        }
+                    )
+            finally:
+                await service.aclose()
+                if cache is not None:
+                    cache.close()
+    return rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--live", type=int, default=0, help="每种模式真实调用 OpenRouter 的次数（默认 0 不调用）")
+    args = parser.parse_args()
+
+    for row in offline_rows():
+        print(json.dumps(row, ensure_ascii=False), flush=True)
+    if args.live:
+        for row in asyncio.run(live_rows(args.live)):
+            print(json.dumps(row, ensure_ascii=False), flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+对冲请求基准：模拟长尾延迟的模型，对比只用主模型与 ModelRouter 对冲时的延迟分位数和额外调用量
+
+用法（在 backend 目录下）：
+    python benchmarks/bench_hedging.py
+    python benchmarks/bench_hedging.py --requests 2000 --quantiles 0.8 0.9 0.95
+
+每个模拟模型的耗时 = 对数正态分布的基础耗时，以 --straggler-rate 的概率乘以 --straggler-factor（模拟免费模型排队 / 冷启动）。
+时间按 --time-scale 缩小（默认 1 秒 → 10 毫秒），输出换算回秒。并发 --concurrency 个请求同时进行。
+- single：只调用主模型
+- hedged@q：主模型超过其 q 分位数耗时仍未返回时对冲到第二个模型（前 min_samples 个请求使用 default_delay）
+extra_calls 为平均每个请求多发出的模型调用数。
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import math
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from services.model_router import ModelRouter  # noqa: E402
+
+# (中位数秒, 对数标准差)；次模型中位数略慢，长尾与主模型相互独立
+MODELS = {
+    "primary": (4.0, 0.35),
+    "secondary": (5.0, 0.35),
+}
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(len(ordered) * fraction) - 1))]
+
+
+async def run(mode: str, quantile: float, args) -> dict:
+    rng = random.Random(args.seed)
+    models = ["primary"] if mode == "single" else list(MODELS)
+    router: ModelRouter[bool] = ModelRouter(
+        models,
+        hedge_quantile=quantile,
+        default_delay=10.0 * args.time_scale,
+        min_delay=0.0,
+        min_samples=20,
+    )
+    calls = 0
+
+    async def call(model: str) -> bool:
+        nonlocal calls
+        calls += 1
+        median, sigma = MODELS[model]
+        seconds = median * math.exp(rng.gauss(0, sigma))
+        if rng.random() < args.straggler_rate:
+            seconds *= args.straggler_factor
+        await asyncio.sleep(seconds * args.time_scale)
+        return True
+
+    latencies: list[float] = []
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def one(index: int) -> None:
+        async with semaphore:
+            start = time.perf_counter()
+            await router.run(call, is_valid=bool, request_id=str(index))
+            latencies.append((time.perf_counter() - start) / args.time_scale)
+
+    await asyncio.gather(*(one(index) for index in range(args.requests)))
+    stats = router.stats()
+    return {
+        "mode": mode if mode == "single" else f"hedged@{quantile}",
+        "requests": args.requests,
+        "p50_s": round(statistics.median(latencies), 2),
+        "p90_s": round(percentile(latencies, 0.9), 2),
+        "p99_s": round(percentile(latencies, 0.99), 2),
+        "max_s": round(max(latencies), 2),
+        "extra_calls": round(calls / args.requests - 1, 3),
+        "hedge_rate": stats["primary"]["hedge_rate"],
+        "win_rate": {model: stats[model]["win_rate"] for model in models},
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--quantiles", type=float, nargs="+", default=[0.9, 0.95])
+    parser.add_argument("--straggler-rate", type=float, default=0.05)
+    parser.add_argument("--straggler-factor", type=float, default=6.0)
+    parser.add_argument("--time-scale", type=float, default=0.01)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    print(json.dumps(asyncio.run(run("single", 0.9, args))), flush=True)
+    for quantile in args.quantiles:
+        print(json.dumps(asyncio.run(run("hedged", quantile, args))), flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+VLM 图片编码路径基准：JPEG 透传 vs 解码 + 重新编码
+
+用法（在 backend 目录下）：
+    python benchmarks/bench_image_encode.py
+    python benchmarks/bench_image_encode.py --sizes 512 1024 --iterations 200
+
+每次迭代都从原始字节重新 Image.open，模拟一次请求的完整编码开销；
+统计的是进程 CPU 时间（time.process_time），不受调度抖动影响。
+"""
+
+from __future__ import annotations
+
+import argparse
+import io
+import json
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from services.vlm_service import VLMService  # noqa: E402
+
+
+def make_label_jpeg(size: int, quality: int = 65) -> bytes:
+    """生成带纹理的测试 JPEG（纯色图压缩过于理想，不具代表性）"""
+    rng = np.random.default_rng(size)
+    pixels = rng.integers(0, 255, (size, int(size * 0.75), 3), dtype=np.uint8)
+    buffered = io.BytesIO()
+    Image.fromarray(pixels).save(buffered, format="JPEG", quality=quality)
+    return buffered.getvalue()
+
+
+def cpu_ms_per_call(func, iterations: int) -> float:
+    start = time.process_time()
+    for _ in range(iterations):
+        func()
+    return (time.process_time() - start) * 1000 / iterations
+
+
+def run(size: int, iterations: int) -> dict:
+    service = VLMService()
+    image_bytes = make_label_jpeg(size)
+
+    def transcode() -> None:
+        image = Image.open(io.BytesIO(image_bytes))
+        service._image_to_base64(image, max_dimension=service.passthrough_max_dimension)
+
+    def passthrough() -> None:
+        image = Image.open(io.BytesIO(image_bytes))
+        _, path = service._encode_image(image, image_bytes)
+        assert path == "passthrough", "测试图片超出透传限制，请调整 VLM_PASSTHROUGH_* 环境变量"
+
+    transcode_ms = cpu_ms_per_call(transcode, iterations)
+    passthrough_ms = cpu_ms_per_call(passthrough, iterations)
+    return {
+        "max_side_px": size,
+        "image_bytes": len(image_bytes),
+        "iterations": iterations,
+        "transcode_cpu_ms": round(transcode_ms, 3),
+        "passthrough_cpu_ms": round(passthrough_ms, 3),
+        "saved_cpu_ms": round(transcode_ms - passthrough_ms, 3),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[512, 1024])
+    parser.add_argument("--iterations", type=int, default=100)
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        print(json.dumps(run(size, args.iterations)), flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+模型输出 JSON 解析基准：旧的正则修复级联 vs 单遍容错解析器
+
+用法（在 backend 目录下）：
+    python benchmarks/bench_json_parse.py
+    python benchmarks/bench_json_parse.py --iterations 500
+
+语料位于 benchmarks/corpus/model_outputs/，每个文件是一种模型输出形态
+（代码块、说明文字、尾随逗号、注释、单引号、截断等）。
+成功的定义：得到 dict，且包含 health_score（正常结果）或 error_type（模型主动报错），
+并且不是解析失败时的 parse_error 兜底。有同名 <case>.expected.json 的语料还要求解析结果与之完全相同
+（例如注释紧跟在字符串值后面时，值不能吞掉注释和之后的内容）；这些语料上容错解析器或流式解析不满足时退出码为 1。
+"""
+
+from __future__ import annotations
+
+import argparse
+import ast
+import json
+import re
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from services.tolerant_json import TolerantJSONParser, parse_model_json  # noqa: E402
+
+CORPUS_DIR = Path(__file__).resolve().parent / "corpus" / "model_outputs"
+
+
+def legacy_parse(text: str) -> dict:
+    """旧版 VLMService._parse_json_response 的解析逻辑（去掉日志），作为对比基线"""
+    text = re.sub(r'```json\s*', '', text)
+    text = re.sub(r'```\s*$', '', text)
+    text = text.strip()
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        pass
+    json_match = re.search(r'\{[\s\S]*\}', text)
+    json_str = json_match.group(0) if json_match else text
+    json_str = re.sub(r'//.*?$', '', json_str, flags=re.MULTILINE)
+    json_str = re.sub(r'/\*[\s\S]*?\*/', '', json_str)
+    json_str = re.sub(r',(\s*[}\]])', r'\1', json_str)
+    try:
+        return json.loads(json_str)
+    except json.JSONDecodeError:
+        pass
+
+    def fix_quotes(match):
+        content = match.group(1).replace('"', '\\"')
+        return f'"{content}"'
+
+    json_str = re.sub(r"'([^']*)'", fix_quotes, json_str)
+    json_str = re.sub(r',(\s*[}\]])', r'\1', json_str)
+    try:
+        return json.loads(json_str)
+    except json.JSONDecodeError:
+        if text.replace("'", '"').strip().startswith('{'):
+            try:
+                result = ast.literal_eval(text.replace('true', 'True').replace('false', 'False').replace('null', 'None'))
+                return json.loads(json.dumps(result))
+            except Exception:
+                pass
+        return {"error": "数据解析失败", "error_type": "parse_error"}
+
+
+def tolerant_parse(text: str) -> object:
+    try:
+        return parse_model_json(text)[0]
+    except ValueError:
+        return None
+
+
+def streaming_parse(text: str, chunk_size: int = 16) -> object:
+    """模拟流式输出：按固定大小分块喂入"""
+    parser = TolerantJSONParser()
+    for i in range(0, len(text), chunk_size):
+        parser.feed(text[i:i + chunk_size])
+    try:
+        return parser.close()
+    except ValueError:
+        return None
+
+
+def is_success(result: object, expected: object = None) -> bool:
+    if not isinstance(result, dict):
+        return False
+    if result.get("error_type") == "parse_error":
+        return False
+    if expected is not None and result != expected:
+        return False
+    return "health_score" in result or "error_type" in result
+
+
+def time_us(func, text: str, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func(text)
+    return (time.perf_counter() - start) * 1e6 / iterations
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    parsers = {"legacy": legacy_parse, "tolerant": tolerant_parse, "streaming": streaming_parse}
+    totals = {name: {"ok": 0, "us": 0.0} for name in parsers}
+    files = sorted(CORPUS_DIR.glob("*.txt"))
+    failures = []
+    for path in files:
+        text = path.read_text(encoding="utf-8")
+        expected_path = path.with_suffix(".expected.json")
+        expected = json.loads(expected_path.read_text(encoding="utf-8")) if expected_path.exists() else None
+        row = {"case": path.stem, "chars": len(text), "expected": expected is not None}
+        for name, func in parsers.items():
+            ok = is_success(func(text), expected)
+            if not ok and expected is not None and name != "legacy":
+                failures.append(f"{path.stem}:{name}")
+            elapsed = time_us(func, text, args.iterations)
+            totals[name]["ok"] += ok
+            totals[name]["us"] += elapsed
+            row[f"{name}_ok"] = ok
+            row[f"{name}_us"] = round(elapsed, 1)
+        print(json.dumps(row, ensure_ascii=False), flush=True)
+
+    summary = {
+        name: {
+            "success_rate": f"{values['ok']}/{len(files)}",
+            "total_us": round(values["us"], 1),
+        }
+        for name, values in totals.items()
+    }
+    print(json.dumps({"summary": summary, "failures": failures}, ensure_ascii=False))
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
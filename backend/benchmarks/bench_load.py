@@ -0,0 +1,348 @@
+"""
+离线压测：本地假 OpenRouter + 真实服务进程，测量 /api/v1/analyze 的吞吐、延迟分位数和峰值 RSS
+
+用法（在 backend 目录下）：
+    python benchmarks/bench_load.py
+    python benchmarks/bench_load.py --clients 1 8 32 --duration 30 --latency-median 4 --tokens-per-second 60
+    python benchmarks/bench_load.py --error-rate 0.05 --error-status 429 --output /tmp/after.json --compare /tmp/before.json
+    python benchmarks/bench_load.py --endpoint stream --images ~/label_photos
+    python benchmarks/bench_load.py --images ~/label_photos --replay .cache/vlm_recordings.jsonl
+
+与 test_openrouter.py 不同，这里不访问真实服务：脚本在子进程中启动 benchmarks/fake_openrouter.py
+（按 --latency-* / --straggler-* / --tokens-per-second 配置延迟分布和生成速度，按 --error-* 注入错误），
+再为每个并发级别启动一个独立的 uvicorn 服务进程（OPENROUTER_BASE_URL 指向假服务；OCR 关闭；
+结果缓存和近似重复索引默认关闭，--cache 时保留；配料说明缓存使用临时文件），整条请求路径（解码、转码、
+模型调用、JSON 解析、配料说明补全）与线上相同。
+--replay 时服务进程以 VLM_BACKEND_MODE=replay 运行，模型响应取自录制文件（需配合录制时使用的 --images），
+用真实的模型输出测量除模型以外的全部开销；此时假服务收到的请求数应为 0。
+
+客户端为闭环并发：每个客户端收到响应后立即发下一张图片（被准入控制拒绝时按 Retry-After 退避，最多 --reject-backoff 秒），图片轮流取自 label_images.py 生成的合成标签
+（--sizes / --count）或 --images 目录中的真实照片。stream 端点另外记录首个事件的延迟。
+每个并发级别输出一行 JSON：状态码和 error_type 计数、throughput_rps（成功且无 error_type 的请求数 / 秒）、
+p50 / p95 / p99 毫秒（未被准入控制拒绝的响应）、服务进程的 peak_rss_mb（VmHWM）和假服务收到的请求数。
+完整结果（含环境信息和参数）写入 --output（默认 benchmarks/results/load_<时间>.json）；
+--compare 指定之前的结果文件时按端点和并发级别打印吞吐和延迟的变化。
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import base64
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+
+import httpx
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from label_images import LABEL_SIZES, load_images, render_label  # noqa: E402
+
+RESULTS_DIR = BACKEND_DIR / "benchmarks" / "results"
+COMPARED_FIELDS = ("throughput_rps", "p50_ms", "p95_ms", "p99_ms", "peak_rss_mb")
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def peak_rss_mb(pid: int) -> float:
+    with open(f"/proc/{pid}/status", "r", encoding="utf-8") as status_file:
+        for line in status_file:
+            if line.startswith("VmHWM:"):
+                return round(int(line.split()[1]) / 1024, 1)
+    return 0.0
+
+
+def wait_ready(url: str, process: subprocess.Popen) -> None:
+    for _ in range(300):
+        if process.poll() is not None:
+            raise RuntimeError(f"{url} 启动失败，退出码 {process.returncode}")
+        try:
+            httpx.get(url, timeout=1)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    raise RuntimeError(f"{url} 启动超时")
+
+
+def percentile(sorted_values: list[float], fraction: float):
+    if not sorted_values:
+        return None
+    return round(sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))], 1)
+
+
+def fake_faults(args) -> dict:
+    fault = {
+        "latency_median": args.latency_median,
+        "latency_sigma": args.latency_sigma,
+        "straggler_rate": args.straggler_rate,
+        "straggler_factor": args.straggler_factor,
+    }
+    if args.tokens_per_second:
+        fault["tokens_per_second"] = args.tokens_per_second
+    if args.error_rate:
+        fault.update(status=args.error_status, rate=args.error_rate)
+    return {"*": fault}
+
+
+async def post_analyze(client: httpx.AsyncClient, image: bytes, request_id: str, timings: dict) -> tuple[str, str]:
+    response = await client.post(
+        "/api/v1/analyze",
+        json={"image_base64": base64.b64encode(image).decode("ascii"), "image_type": "image/jpeg"},
+        headers={"x-request-id": request_id},
+    )
+    if response.status_code != 200:
+        timings["retry_after"] = float(response.headers.get("retry-after", "1"))
+        return str(response.status_code), "-"
+    return "200", response.json().get("error_type") or "-"
+
+
+async def post_stream(client: httpx.AsyncClient, image: bytes, request_id: str, timings: dict) -> tuple[str, str]:
+    start = time.perf_counter()
+    error_type = "no_result"
+    async with client.stream(
+        "POST",
+        "/api/v1/analyze/stream",
+        content=image,
+        headers={"content-type": "image/jpeg", "x-request-id": request_id},
+    ) as response:
+        if response.status_code != 200:
+            await response.aread()
+            timings["retry_after"] = float(response.headers.get("retry-after", "1"))
+            return str(response.status_code), "-"
+        event = None
+        async for line in response.aiter_lines():
+            if line.startswith("event: "):
+                event = line[7:]
+                timings.setdefault("first_event_ms", (time.perf_counter() - start) * 1000)
+            elif line.startswith("data: ") and event in ("result", "error"):
+                data = json.loads(line[6:])
+                error_type = (data.get("error_type") if event == "result" else data.get("error_type", "stream_error")) or "-"
+    return "200", error_type
+
+
+async def drive(port: int, images: list[bytes], clients: int, args) -> dict:
+    send = post_stream if args.endpoint == "stream" else post_analyze
+    statuses: Counter = Counter()
+    error_types: Counter = Counter()
+    latencies: list[float] = []
+    first_events: list[float] = []
+    succeeded = 0
+    sequence = iter(range(10**9))
+    limits = httpx.Limits(max_connections=clients * 2, max_keepalive_connections=clients)
+
+    async with httpx.AsyncClient(
+        base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=args.client_timeout
+    ) as client:
+
+        async def run_client(deadline: float, record: bool) -> None:
+            nonlocal succeeded
+            while time.perf_counter() < deadline:
+                index = next(sequence)
+                timings: dict = {}
+                start = time.perf_counter()
+                try:
+                    status, error_type = await send(client, images[index % len(images)], f"load-{index}", timings)
+                except httpx.TimeoutException:
+                    status, error_type = "timeout", "-"
+                except httpx.HTTPError as exc:
+                    status, error_type = type(exc).__name__, "-"
+                elapsed_ms = (time.perf_counter() - start) * 1000
+                if record:
+                    statuses[status] += 1
+                if status in ("429", "503"):
+                    # 准入控制拒绝：按 Retry-After 退避（最多 --reject-backoff 秒），不计入延迟分位数
+                    await asyncio.sleep(min(timings.get("retry_after", 1.0), args.reject_backoff))
+                    continue
+                if not record or not status.isdigit():
+                    continue
+                latencies.append(elapsed_ms)
+                if "first_event_ms" in timings:
+                    first_events.append(timings["first_event_ms"])
+                if status == "200":
+                    error_types[error_type] += 1
+                    succeeded += error_type == "-"
+
+        if args.warmup:
+            await asyncio.gather(*(run_client(time.perf_counter() + args.warmup, False) for _ in range(clients)))
+        started = time.perf_counter()
+        await asyncio.gather(*(run_client(started + args.duration, True) for _ in range(clients)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    first_events.sort()
+    result = {
+        "requests": sum(statuses.values()),
+        "statuses": dict(statuses),
+        "error_types": dict(error_types),
+        "throughput_rps": round(succeeded / elapsed, 2),
+        "p50_ms": percentile(latencies, 0.50),
+        "p95_ms": percentile(latencies, 0.95),
+        "p99_ms": percentile(latencies, 0.99),
+    }
+    if args.endpoint == "stream":
+        result["first_event_p50_ms"] = percentile(first_events, 0.50)
+        result["first_event_p95_ms"] = percentile(first_events, 0.95)
+    return result
+
+
+def run_level(clients: int, fake_port: int, images: list[bytes], args) -> dict:
+    port = free_port()
+    description_cache = tempfile.mkstemp(prefix="bench_load_descriptions_", suffix=".json")[1]
+    os.unlink(description_cache)
+    env = {
+        **os.environ,
+        "OPENROUTER_BASE_URL": f"http://127.0.0.1:{fake_port}",
+        "OPENROUTER_API_KEY": "fake",
+        "OCR_MODE": "off",
+        "INGREDIENT_DESCRIPTION_CACHE_PATH": description_cache,
+        "LANGSMITH_TRACING": "false",
+        "SENTRY_DSN": "",
+    }
+    if not args.cache:
+        env.update(RESULT_CACHE_MAX_ENTRIES="0", NEAR_DUPLICATE_MAX_ENTRIES="0")
+    if args.replay:
+        env.update(
+            VLM_BACKEND_MODE="replay",
+            VLM_RECORDING_PATH=str(args.replay.resolve()),
+            VLM_REPLAY_LATENCY_SCALE=str(args.replay_latency_scale),
+        )
+    fake_before = httpx.get(f"http://127.0.0.1:{fake_port}/_stats").json()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        wait_ready(f"http://127.0.0.1:{port}/health", server)
+        result = asyncio.run(drive(port, images, clients, args))
+        rss = peak_rss_mb(server.pid)
+    finally:
+        server.terminate()
+        server.wait()
+        if os.path.exists(description_cache):
+            os.unlink(description_cache)
+    fake_after = httpx.get(f"http://127.0.0.1:{fake_port}/_stats").json()
+    upstream = {
+        key: sum(fake_after[key].values()) - sum(fake_before[key].values()) for key in ("requests", "injected")
+    }
+    return {"clients": clients, **result, "peak_rss_mb": rss, "upstream": upstream}
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "-"
+
+
+def print_comparison(results: list[dict], baseline_path: Path) -> None:
+    baseline = {
+        (item["endpoint"], item["clients"]): item
+        for item in json.loads(baseline_path.read_text(encoding="utf-8"))["results"]
+    }
+    for item in results:
+        before = baseline.get((item["endpoint"], item["clients"]))
+        if before is None:
+            continue
+        delta = {}
+        for field in COMPARED_FIELDS:
+            if item.get(field) is not None and before.get(field):
+                delta[field] = f"{before[field]} -> {item[field]} ({(item[field] - before[field]) / before[field]:+.1%})"
+        print(json.dumps({"compare": str(baseline_path), "clients": item["clients"], **delta}, ensure_ascii=False), flush=True)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--duration", type=float, default=15)
+    parser.add_argument("--warmup", type=float, default=2, help="每个并发级别开始计数前的预热秒数")
+    parser.add_argument("--client-timeout", type=float, default=120)
+    parser.add_argument("--reject-backoff", type=float, default=1.0, help="收到 429 / 503 后最多等待的秒数")
+    parser.add_argument("--endpoint", choices=["analyze", "stream"], default="analyze")
+    parser.add_argument("--cache", action="store_true", help="保留结果缓存和近似重复索引（默认关闭，测量缓存未命中路径）")
+    parser.add_argument("--sizes", nargs="+", default=["1mp", "3mp"], choices=list(LABEL_SIZES))
+    parser.add_argument("--count", type=int, default=8, help="每种尺寸生成的图片数")
+    parser.add_argument("--images", type=Path, help="使用该目录中的图片代替合成标签")
+    parser.add_argument("--latency-median", type=float, default=1.0, help="假服务响应延迟的中位数（秒）")
+    parser.add_argument("--latency-sigma", type=float, default=0.3, help="对数正态分布的对数标准差")
+    parser.add_argument("--straggler-rate", type=float, default=0.02)
+    parser.add_argument("--straggler-factor", type=float, default=5.0)
+    parser.add_argument("--tokens-per-second", type=float, default=0, help="假服务的生成速度，0 表示不模拟")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--replay", type=Path, help="VLM_BACKEND_MODE=replay：模型响应取自该录制文件，不经过假服务")
+    parser.add_argument("--replay-latency-scale", type=float, default=0.0, help="回放时按录制耗时的倍数等待，0 表示立即返回")
+    parser.add_argument("--output", type=Path)
+    parser.add_argument("--compare", type=Path, help="之前的结果文件，打印与之相比的变化")
+    args = parser.parse_args()
+
+    if args.images:
+        images = load_images(args.images)
+        image_source = str(args.images)
+    else:
+        images = [render_label(size, index) for size in args.sizes for index in range(args.count)]
+        image_source = "synthetic:" + ",".join(args.sizes)
+    if not images:
+        parser.error("没有可用的图片")
+
+    fake_port = free_port()
+    fake = subprocess.Popen(
+        [
+            sys.executable,
+            str(BACKEND_DIR / "benchmarks" / "fake_openrouter.py"),
+            "--port",
+            str(fake_port),
+            "--faults",
+            json.dumps(fake_faults(args)),
+        ],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    meta = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "git_commit": git_commit(),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "images": {"source": image_source, "count": len(images), "mean_bytes": sum(map(len, images)) // len(images)},
+        "faults": fake_faults(args),
+        "args": {key: str(value) if isinstance(value, Path) else value for key, value in vars(args).items()},
+    }
+    print(json.dumps({"meta": meta}, ensure_ascii=False), flush=True)
+    results = []
+    try:
+        wait_ready(f"http://127.0.0.1:{fake_port}/_stats", fake)
+        for clients in args.clients:
+            result = {"endpoint": args.endpoint, **run_level(clients, fake_port, images, args)}
+            results.append(result)
+            print(json.dumps(result, ensure_ascii=False), flush=True)
+    finally:
+        fake.terminate()
+        fake.wait()
+
+    output = args.output or RESULTS_DIR / f"load_{time.strftime('%Y%m%d_%H%M%S')}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps({"meta": meta, "results": results}, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(json.dumps({"output": str(output)}, ensure_ascii=False), flush=True)
+    if args.compare:
+        print_comparison(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+"""
+日志开销基准：按一次缓存未命中的同步分析实际输出的日志行（约 23 行 INFO，含两处 700 字符的模型输出预览）回放，
+对比 LOG_MODE / LOG_DETAIL_SAMPLE_RATE 组合下事件循环线程上每个请求花在日志上的时间
+
+用法（在 backend 目录下）：
+    python benchmarks/bench_logging.py
+    python benchmarks/bench_logging.py --requests 2000 --gap-ms 2 --output /dev/null
+
+baseline 为改动前的行为（logging.basicConfig，无采样、无 request_summary）。每个组合在独立子进程中运行，日志写入 --output（默认临时文件，模拟写 stderr 管道）。
+请求之间空闲 --gap-ms 毫秒（真实请求大部分时间在等待 OpenRouter），queued 模式的监听线程在空闲时写出。
+输出每行一个 JSON：us_per_request 为调用线程上的中位数 / p99 耗时，lines_per_request 为实际写出的行数，
+cpu_us_per_request 为包含监听线程在内的进程 CPU 时间（按请求平均）。
+"""
+
+from __future__ import annotations
+
+import argparse
+import contextvars
+import json
+import logging
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+CONFIGS = (("baseline", 1.0), ("sync", 1.0), ("queued", 1.0), ("sync", 0.1), ("queued", 0.1))
+
+MODEL_OUTPUT = json.dumps(
+    {
+        "health_score": "C",
+        "summary": "含有人工色素和防腐剂，适量食用。" * 3,
+        "risks": [{"level": "High", "name": f"Additive {i}", "desc": "人工色素，可能引起儿童多动。"} for i in range(6)],
+        "full_ingredients": [f"Ingredient {i}" for i in range(20)],
+        "alternatives": ["无添加色素的果汁饮料"],
+    },
+    ensure_ascii=False,
+)
+
+
+def emit_request(request_id: str, summary: bool = True) -> None:
+    """与 main / VLMService 在一次缓存未命中时的日志调用相同（格式串和参数形态）"""
+    from services.logging_setup import begin_request, detail_enabled, log_request_summary
+    from services.runtime_logging import memory_snapshot, text_preview
+
+    main_log = logging.getLogger("main")
+    vlm_log = logging.getLogger("services.vlm_service")
+    http_log = logging.getLogger("httpx")
+    begin_request(request_id, "sync")
+    main_log.info(
+        "analyze_start request_id=%s origin=%s content_type=%s content_length=%s user_agent=%s %s",
+        request_id, "https://app.example.com", "image/jpeg", 412345,
+        text_preview("Mozilla/5.0 (iPhone; CPU iPhone OS 17_0 like Mac OS X) AppleWebKit/605.1.15", 180), memory_snapshot(),
+    )
+    main_log.info("analyze_upload_received request_id=%s image_type=%s image_bytes=%s %s", request_id, "image/jpeg", 412345, memory_snapshot())
+    main_log.info(
+        "analyze_image_decoded request_id=%s image_bytes=%s size=%s mode=%s format=%s %s",
+        request_id, 412345, (3024, 4032), "RGB", "JPEG", memory_snapshot(),
+    )
+    main_log.info("analyze_decode_done request_id=%s elapsed_ms=%s size=%s %s", request_id, 12, (3024, 4032), memory_snapshot())
+    main_log.info("analyze_vlm_start request_id=%s %s", request_id, memory_snapshot())
+    main_log.info("analyze_ocr_skipped request_id=%s reason=%s", request_id, "disabled")
+    vlm_log.info(
+        "vlm_image_encoded request_id=%s elapsed_ms=%s encode_path=%s image_base64_len=%s image_size=%s ocr_text_len=%s ocr_preview=%s %s",
+        request_id, 35, "transcode", 180000, (1200, 1600), 0, text_preview("") if detail_enabled() else "-", memory_snapshot(),
+    )
+    vlm_log.info(
+        "vlm_prompt_ready request_id=%s prompt_len=%s known_risks=%s model=%s base_url=%s %s",
+        request_id, 1615, 0, "nvidia/nemotron-nano-12b-v2-vl:free", "https://openrouter.ai/api/v1", memory_snapshot(),
+    )
+    vlm_log.info("vlm_openrouter_start request_id=%s model=%s %s", request_id, "nvidia/nemotron-nano-12b-v2-vl:free", memory_snapshot())
+    http_log.info('HTTP Request: %s %s "%s %d %s"', "POST", "https://openrouter.ai/api/v1/chat/completions", "HTTP/1.1", 200, "OK")
+    vlm_log.info(
+        "vlm_openrouter_done request_id=%s model=%s elapsed_ms=%s response_id=%s response_model=%s finish_reason=%s usage=%s %s",
+        request_id, "nvidia/nemotron-nano-12b-v2-vl:free", 4200, "gen-123", "nvidia/nemotron-nano-12b-v2-vl:free", "stop",
+        "CompletionUsage(completion_tokens=180, prompt_tokens=1000, total_tokens=1180)", memory_snapshot(),
+    )
+    vlm_log.info(
+        "vlm_usage request_id=%s call=%s descriptions=%s prompt_tokens=%s completion_tokens=%s total_tokens=%s",
+        request_id, "analyze", "cache", 1000, 180, 1180,
+    )
+    vlm_log.info(
+        "vlm_response_text_ready request_id=%s text_len=%s text_preview=%s %s",
+        request_id, len(MODEL_OUTPUT), text_preview(MODEL_OUTPUT, 700) if detail_enabled() else "-", memory_snapshot(),
+    )
+    vlm_log.info("vlm_json_parse_done request_id=%s method=%s repairs=%s %s", request_id, "direct", "-", memory_snapshot())
+    vlm_log.info(
+        "vlm_parse_done request_id=%s elapsed_ms=%s keys=%s %s",
+        request_id, 1, ["health_score", "summary", "risks", "full_ingredients", "alternatives"], memory_snapshot(),
+    )
+    vlm_log.info(
+        "vlm_done request_id=%s total_elapsed_ms=%s score=%s risks=%s ingredients=%s alternatives=%s %s",
+        request_id, 4250, "C", 6, 20, 1, memory_snapshot(),
+    )
+    http_log.info('HTTP Request: %s %s "%s %d %s"', "POST", "https://openrouter.ai/api/v1/chat/completions", "HTTP/1.1", 200, "OK")
+    vlm_log.info(
+        "vlm_usage request_id=%s call=%s descriptions=%s prompt_tokens=%s completion_tokens=%s total_tokens=%s",
+        request_id, "describe", "cache", 300, 90, 390,
+    )
+    vlm_log.info("vlm_describe_done request_id=%s elapsed_ms=%s names=%s described=%s", request_id, 900, 2, 2)
+    vlm_log.info(
+        "vlm_descriptions_filled request_id=%s elapsed_ms=%s ingredients=%s cached=%s provided=%s generated=%s missing=%s",
+        request_id, 905, 20, 18, 0, 2, 0,
+    )
+    main_log.info(
+        "analyze_stage_timings request_id=%s engine=%s pipeline=%s %s",
+        request_id, "vlm", "sequential", "ocr_ms=0 index_ms=0 vlm_ms=5160",
+    )
+    main_log.info(
+        "analyze_vlm_done request_id=%s elapsed_ms=%s error_type=%s has_error=%s coalesced_with=%s %s",
+        request_id, 5160, None, False, "-", memory_snapshot(),
+    )
+    main_log.info(
+        "analyze_done request_id=%s total_elapsed_ms=%s result_error_type=%s result_score=%s peak_rss_delta_kb=%s %s",
+        request_id, 5175, None, "C", 2048, memory_snapshot(),
+    )
+    if summary:
+        log_request_summary(main_log, cache="MISS", error_type=None, health_score="C", total_ms=5175, peak_rss_delta_kb=2048)
+
+
+def run_child(mode: str, rate: float, args) -> dict:
+    from services.logging_setup import configure_logging, logging_stats, stop_logging
+    from services.runtime_logging import MemorySampler
+
+    handler = logging.StreamHandler(open(args.output, "a", encoding="utf-8"))
+    handler.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
+    logging.getLogger().addHandler(handler)
+    if mode == "baseline":
+        logging.getLogger().setLevel(logging.INFO)
+    else:
+        configure_logging(mode=mode, detail_sample_rate=rate)
+    sampler = MemorySampler(interval_seconds=0.5)
+    sampler.start()
+    size_before = os.path.getsize(args.output)
+    durations = []
+    cpu_start = time.process_time()
+    for index in range(args.requests):
+        start = time.perf_counter_ns()
+        contextvars.copy_context().run(emit_request, f"req{index:06d}", mode != "baseline")
+        durations.append((time.perf_counter_ns() - start) / 1000)
+        time.sleep(args.gap_ms / 1000)
+    stop_logging()
+    handler.flush()
+    cpu_us = (time.process_time() - cpu_start) * 1e6
+    sampler.stop()
+    with open(args.output, "rb") as output:
+        output.seek(size_before)
+        lines = output.read().count(b"\n")
+    durations.sort()
+    return {
+        "mode": mode,
+        "detail_sample_rate": rate,
+        "requests": args.requests,
+        "us_per_request_p50": round(statistics.median(durations), 1),
+        "us_per_request_p99": round(durations[int(len(durations) * 0.99) - 1], 1),
+        "lines_per_request": round(lines / args.requests, 1),
+        "cpu_us_per_request": round(cpu_us / args.requests, 1),
+        "dropped": logging_stats()["dropped"],
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--gap-ms", type=float, default=2.0)
+    parser.add_argument("--output", default="")
+    parser.add_argument("--child", nargs=2, metavar=("MODE", "RATE"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_child(args.child[0], float(args.child[1]), args)), flush=True)
+        return
+
+    output = args.output or tempfile.mkstemp(prefix="bench_logging_", suffix=".log")[1]
+    try:
+        for mode, rate in CONFIGS:
+            command = [
+                sys.executable, __file__, "--child", mode, str(rate),
+                "--requests", str(args.requests), "--gap-ms", str(args.gap_ms), "--output", output,
+            ]
+            result = subprocess.run(command, capture_output=True, text=True, check=True)
+            print(result.stdout.strip(), flush=True)
+    finally:
+        if not args.output:
+            os.unlink(output)
+
+
+if __name__ == "__main__":
+    main()
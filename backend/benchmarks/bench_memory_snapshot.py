@@ -0,0 +1,93 @@
+"""
+内存快照开销基准：每行日志直接读取 /proc（旧行为）与读取后台采样缓存值的对比
+
+用法（在 backend 目录下）：
+    python benchmarks/bench_memory_snapshot.py
+    python benchmarks/bench_memory_snapshot.py --calls-per-request 20 --interval 0.5
+
+输出每行一个 JSON：
+- direct / sampled：单次 memory_snapshot() 的微秒数，以及按 --calls-per-request 次（一次分析请求的日志行数）折算的每请求耗时
+- sampler：后台线程单次采样的耗时和按 --interval 折算的 CPU 占比（与请求数无关的固定开销）
+- watch：一次请求的 watch() + peak_delta_kb() + unwatch() 耗时
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from services.runtime_logging import MemorySampler, memory_snapshot  # noqa: E402
+
+
+def per_call_us(func, iterations: int) -> float:
+    start = time.perf_counter_ns()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter_ns() - start) / iterations / 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=20_000)
+    parser.add_argument("--calls-per-request", type=int, default=18, help="一次缓存未命中的分析请求中带 memory_snapshot() 的日志行数")
+    parser.add_argument("--interval", type=float, default=0.5, help="采样间隔（秒），用于折算后台线程的 CPU 占比")
+    args = parser.parse_args()
+
+    direct_us = per_call_us(memory_snapshot, args.iterations)
+    print(
+        json.dumps(
+            {
+                "case": "direct",
+                "us_per_call": round(direct_us, 2),
+                "us_per_request": round(direct_us * args.calls_per_request, 1),
+            }
+        ),
+        flush=True,
+    )
+
+    sampler = MemorySampler(interval_seconds=args.interval)
+    sampler.start()
+    try:
+        sampled_us = per_call_us(memory_snapshot, args.iterations * 10)
+        print(
+            json.dumps(
+                {
+                    "case": "sampled",
+                    "us_per_call": round(sampled_us, 3),
+                    "us_per_request": round(sampled_us * args.calls_per_request, 2),
+                    "saved_us_per_request": round((direct_us - sampled_us) * args.calls_per_request, 1),
+                }
+            ),
+            flush=True,
+        )
+
+        sample_us = per_call_us(sampler.sample, args.iterations)
+        print(
+            json.dumps(
+                {
+                    "case": "sampler",
+                    "us_per_sample": round(sample_us, 2),
+                    "interval_s": args.interval,
+                    "cpu_fraction": f"{sample_us / (args.interval * 1e6):.2e}",
+                }
+            ),
+            flush=True,
+        )
+
+        def one_watch() -> None:
+            watch = sampler.watch()
+            sampler.peak_delta_kb(watch)
+            sampler.unwatch(watch)
+
+        print(json.dumps({"case": "watch", "us_per_request": round(per_call_us(one_watch, args.iterations * 10), 3)}), flush=True)
+    finally:
+        sampler.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+指标开销基准：单次记录的耗时、一次请求全部记录的耗时，以及 /metrics 输出（render）的耗时
+
+用法（在 backend 目录下）：
+    python benchmarks/bench_metrics.py
+    python benchmarks/bench_metrics.py --iterations 500000 --request-ms 300
+
+每项输出一行 JSON：
+- counter_inc / gauge_inc_dec / histogram_observe：单次操作的纳秒数（已减去空循环开销）
+- per_request：一次缓存未命中的同步分析记录的全部指标（约 15 次：各阶段直方图、计数器、在途仪表、token），
+  以及占 --request-ms 的比例
+- render：按一次请求产生的序列数预先填充后，REGISTRY 输出一次文本的毫秒数和字节数
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from services.metrics import (  # noqa: E402
+    ANALYSES,
+    IN_FLIGHT,
+    JSON_PARSE,
+    OPENROUTER_CALLS,
+    OPENROUTER_TOKENS,
+    REGISTRY,
+    Counter,
+    Gauge,
+    Histogram,
+    observe_ms,
+)
+
+STAGES = ("decode", "encode", "prompt", "openrouter", "parse", "describe", "ocr", "index", "validate", "vlm", "total")
+
+
+def per_iteration_ns(func, iterations: int) -> float:
+    start = time.perf_counter_ns()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter_ns() - start) / iterations
+
+
+def record_request() -> None:
+    """与 main.run_analysis + VLMService 在一次缓存未命中时的记录相同"""
+    IN_FLIGHT.inc("analysis")
+    observe_ms("decode", 12)
+    observe_ms("encode", 35)
+    observe_ms("prompt", 1)
+    IN_FLIGHT.inc("openrouter")
+    IN_FLIGHT.dec("openrouter")
+    OPENROUTER_CALLS.inc("fake/model", "analyze", "ok")
+    OPENROUTER_TOKENS.inc("fake/model", "analyze", "prompt", amount=1000)
+    OPENROUTER_TOKENS.inc("fake/model", "analyze", "completion", amount=180)
+    observe_ms("openrouter", 4200)
+    JSON_PARSE.inc("direct")
+    observe_ms("parse", 1)
+    observe_ms("vlm", 4300)
+    ANALYSES.inc("sync", "MISS", "none")
+    observe_ms("total", 4350)
+    IN_FLIGHT.dec("analysis")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=200_000)
+    parser.add_argument("--request-ms", type=float, default=300.0, help="对比用的请求耗时（缓存命中约数毫秒，未命中为数秒）")
+    parser.add_argument("--render-rounds", type=int, default=200)
+    args = parser.parse_args()
+
+    counter = Counter("bench_counter", "bench", ("label",))
+    gauge = Gauge("bench_gauge", "bench", ("label",))
+    histogram = Histogram("bench_histogram", "bench", ("label",))
+    baseline = per_iteration_ns(lambda: None, args.iterations)
+
+    def gauge_inc_dec() -> None:
+        gauge.inc("a")
+        gauge.dec("a")
+
+    for name, func in (
+        ("counter_inc", lambda: counter.inc("a")),
+        ("gauge_inc_dec", gauge_inc_dec),
+        ("histogram_observe", lambda: histogram.observe(0.42, "a")),
+    ):
+        ns = per_iteration_ns(func, args.iterations) - baseline
+        print(json.dumps({"case": name, "ns_per_op": round(ns, 1)}), flush=True)
+
+    request_ns = per_iteration_ns(record_request, args.iterations // 10) - baseline
+    print(
+        json.dumps(
+            {
+                "case": "per_request",
+                "records": 16,
+                "us_per_request": round(request_ns / 1000, 2),
+                "fraction_of_request": f"{request_ns / (args.request_ms * 1e6):.2e}",
+                "request_ms": args.request_ms,
+            }
+        ),
+        flush=True,
+    )
+
+    for stage in STAGES:
+        observe_ms(stage, 100)
+    start = time.perf_counter_ns()
+    for _ in range(args.render_rounds):
+        text = REGISTRY.render()
+    render_ms = (time.perf_counter_ns() - start) / args.render_rounds / 1e6
+    print(
+        json.dumps({"case": "render", "ms": round(render_ms, 3), "bytes": len(text.encode()), "lines": text.count("\n")}),
+        flush=True,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""
+近似重复索引基准：查找延迟，以及 dHash 距离能否区分「同一标签的再次拍摄」与「不同标签」
+
+用法（在 backend 目录下）：
+    python benchmarks/bench_near_duplicate_index.py
+    python benchmarks/bench_near_duplicate_index.py --sizes 10000 100000 --distance 6
+    python benchmarks/bench_near_duplicate_index.py --sizes --labels 30 --label-sizes 512px 1mp 3mp
+    python benchmarks/bench_near_duplicate_index.py --sizes --images /path/to/photos
+
+延迟：随机 64 位指纹在汉明空间中分布均匀，各段哈希桶大小接近；
+真实商品照片的指纹会聚集，同段桶内的候选数可能偏多。--sizes 不带值时跳过。
+
+准确性（--labels 0 时跳过）：用 label_images 渲染 --labels 张内容不同的标签，
+- different：两两之间的指纹距离，距离不超过阈值即误匹配（会把另一件商品的分析结果返回给用户）；
+- 每种「再次拍摄」变体（重新编码、缩放、亮度、裁边、轻微旋转）与原图的距离，距离不超过阈值即正确复用。
+对 0..--max-threshold 的每个阈值输出 recall（各变体合计）与 false_match_rate，
+safe_threshold 为没有任何误匹配的最大阈值（-1 表示阈值 0 也会误匹配）。
+--images 目录中的图片按文件名排序后视为互不相同的商品，与合成标签一起参与 different 统计。
+"""
+
+from __future__ import annotations
+
+import argparse
+import io
+import itertools
+import json
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+from PIL import Image, ImageEnhance
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from label_images import render_label, load_images  # noqa: E402
+from services.perceptual_hash import NearDuplicateIndex, dhash_fingerprint, hamming_distance  # noqa: E402
+
+
+def _jpeg(image: Image.Image, quality: int = 85) -> bytes:
+    buffer = io.BytesIO()
+    image.convert("RGB").save(buffer, format="JPEG", quality=quality)
+    return buffer.getvalue()
+
+
+# 同一标签再次拍摄 / 再次上传时常见的变化
+RESHOOT_VARIANTS = {
+    "reencode_q60": lambda image: _jpeg(image, 60),
+    "resize_75pct": lambda image: _jpeg(image.resize((image.width * 3 // 4, image.height * 3 // 4))),
+    "brightness_110pct": lambda image: _jpeg(ImageEnhance.Brightness(image).enhance(1.1)),
+    "crop_2pct": lambda image: _jpeg(image.crop((image.width // 50, image.height // 50, image.width, image.height))),
+    "rotate_1deg": lambda image: _jpeg(image.rotate(1, resample=Image.Resampling.BILINEAR, fillcolor=(210, 210, 210))),
+}
+
+
+def _flip_bits(fingerprint: int, count: int, rng: random.Random) -> int:
+    for bit in rng.sample(range(64), count):
+        fingerprint ^= 1 << bit
+    return fingerprint
+
+
+def run(size: int, distance: int, queries: int, seed: int) -> dict:
+    rng = random.Random(seed)
+    index = NearDuplicateIndex(max_entries=size, max_distance=distance)
+    fingerprints = [rng.getrandbits(64) for _ in range(size)]
+
+    build_start = time.perf_counter()
+    for i, fingerprint in enumerate(fingerprints):
+        index.add(fingerprint, f"key-{i}")
+    build_seconds = time.perf_counter() - build_start
+
+    # 一半查询是已存指纹的近似副本（应命中），一半是随机指纹（应未命中）
+    probes = []
+    for i in range(queries):
+        if i % 2 == 0:
+            probes.append(_flip_bits(rng.choice(fingerprints), rng.randint(0, distance), rng))
+        else:
+            probes.append(rng.getrandbits(64))
+
+    latencies_us = []
+    hits = 0
+    for probe in probes:
+        start = time.perf_counter()
+        matches = index.search(probe)
+        latencies_us.append((time.perf_counter() - start) * 1e6)
+        hits += bool(matches)
+
+    latencies_us.sort()
+    return {
+        "size": size,
+        "distance": distance,
+        "build_seconds": round(build_seconds, 3),
+        "queries": queries,
+        "hit_ratio": round(hits / queries, 3),
+        "p50_us": round(statistics.median(latencies_us), 1),
+        "p99_us": round(latencies_us[int(len(latencies_us) * 0.99) - 1], 1),
+        "mean_us": round(statistics.fmean(latencies_us), 1),
+    }
+
+
+def _summary(distances: list[int]) -> dict:
+    distances = sorted(distances)
+    return {
+        "count": len(distances),
+        "min": distances[0],
+        "p5": distances[int(len(distances) * 0.05)],
+        "p50": distances[len(distances) // 2],
+        "max": distances[-1],
+    }
+
+
+def accuracy(label_size: str, labels: int, extra_images: list[bytes], max_threshold: int) -> dict:
+    originals = [render_label(label_size, index) for index in range(labels)] + extra_images
+    fingerprints = [dhash_fingerprint(data) for data in originals]
+    different = [hamming_distance(a, b) for a, b in itertools.combinations(fingerprints, 2)]
+
+    same: dict[str, list[int]] = {}
+    for name, variant in RESHOOT_VARIANTS.items():
+        same[name] = [
+            hamming_distance(fingerprint, dhash_fingerprint(variant(Image.open(io.BytesIO(data)))))
+            for data, fingerprint in zip(originals, fingerprints)
+        ]
+    all_same = [distance for distances in same.values() for distance in distances]
+
+    thresholds = []
+    for threshold in range(max_threshold + 1):
+        thresholds.append(
+            {
+                "threshold": threshold,
+                "recall": round(sum(d <= threshold for d in all_same) / len(all_same), 3),
+                "false_match_rate": round(sum(d <= threshold for d in different) / len(different), 4),
+            }
+        )
+    safe_threshold = min(different) - 1
+    return {
+        "label_size": label_size,
+        "labels": len(originals),
+        "different": _summary(different),
+        "same": {name: _summary(distances) for name, distances in same.items()},
+        "thresholds": thresholds,
+        "safe_threshold": safe_threshold,
+        "recall_at_safe_threshold": round(sum(d <= safe_threshold for d in all_same) / len(all_same), 3),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="*", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--distance", type=int, default=4)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--labels", type=int, default=20, help="准确性测试渲染的不同标签数，0 跳过")
+    parser.add_argument("--label-sizes", nargs="+", default=["512px", "1mp"])
+    parser.add_argument("--images", type=Path, help="额外的真实照片目录，每张视为不同商品")
+    parser.add_argument("--max-threshold", type=int, default=12)
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        print(json.dumps(run(size, args.distance, args.queries, args.seed)), flush=True)
+    if args.labels > 0:
+        extra_images = load_images(args.images) if args.images else []
+        for label_size in args.label_sizes:
+            print(json.dumps(accuracy(label_size, args.labels, extra_images, args.max_threshold)), flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""
+OCR 进程池吞吐基准：每核吞吐、延迟分位数和事件循环阻塞时间
+
+用法（在 backend 目录下）：
+    python benchmarks/bench_ocr_pool.py
+    python benchmarks/bench_ocr_pool.py --workers 1 2 4 --jobs 64
+    python benchmarks/bench_ocr_pool.py --engine synthetic
+
+对比两种执行方式：
+- inline：在事件循环中直接同步调用引擎（旧的 get_ocr_service() 路径）
+- pool：OCRProcessPool，工作进程数由 --workers 指定
+loop_max_lag_ms 是事件循环心跳的最大延迟，反映 OCR 期间其他请求被阻塞的时间。
+
+--engine synthetic 使用纯 numpy 的 CPU 负载代替 RapidOCR（未安装 rapidocr-onnxruntime 时用于验证进程池本身的开销与扩展性）。
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import io
+import json
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from services.ocr_pool import OCRProcessPool  # noqa: E402
+from services.ocr_service import OCRService  # noqa: E402
+
+LABEL_LINES = [
+    "Ingredients: water, sugar, wheat flour, palm oil,",
+    "glucose syrup, salt, emulsifier (E471, E322),",
+    "raising agents (E500, E450), flavouring, E102, E129,",
+    "preservative (E211), antioxidant (E320).",
+    "May contain traces of milk, soy and nuts.",
+]
+
+
+class SyntheticEngine:
+    """按像素数消耗 CPU 的替身引擎，耗时量级与 RapidOCR 单张推理相近"""
+
+    available = True
+
+    def extract_text_sync(self, image: Image.Image, request_id: str = "-") -> str:
+        pixels = np.asarray(image.convert("L"), dtype=np.float32)
+        for _ in range(80):
+            pixels = np.sqrt(pixels * pixels + 1.0)
+            pixels = (pixels[:-1, :-1] + pixels[1:, 1:]) * 0.5
+        return "\n".join(LABEL_LINES)
+
+
+def make_label_jpeg(width: int = 1000, height: int = 750) -> bytes:
+    image = Image.new("RGB", (width, height), "white")
+    draw = ImageDraw.Draw(image)
+    for i, line in enumerate(LABEL_LINES):
+        draw.text((40, 60 + i * 40), line, fill="black")
+    buffered = io.BytesIO()
+    image.save(buffered, format="JPEG", quality=85)
+    return buffered.getvalue()
+
+
+async def measure_loop_lag(stop: asyncio.Event, interval: float = 0.01) -> float:
+    max_lag = 0.0
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        max_lag = max(max_lag, time.perf_counter() - start - interval)
+    return max_lag * 1000
+
+
+def summarize(mode: str, workers: int, latencies: list[float], wall: float, loop_lag_ms: float, extra: dict) -> dict:
+    latencies.sort()
+    throughput = len(latencies) / wall
+    return {
+        "mode": mode,
+        "workers": workers,
+        "jobs": len(latencies),
+        "throughput_per_s": round(throughput, 2),
+        "throughput_per_worker_per_s": round(throughput / workers, 2),
+        "p50_ms": round(statistics.median(latencies) * 1000, 1),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1] * 1000, 1),
+        "loop_max_lag_ms": round(loop_lag_ms, 1),
+        **extra,
+    }
+
+
+async def run_inline(engine, image_data: bytes, jobs: int) -> dict:
+    stop = asyncio.Event()
+    lag_task = asyncio.ensure_future(measure_loop_lag(stop))
+    await asyncio.sleep(0.05)
+
+    async def one() -> float:
+        start = time.perf_counter()
+        engine.extract_text_sync(Image.open(io.BytesIO(image_data)).convert("RGB"))
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    latencies = []
+    for _ in range(jobs):
+        latencies.append(await one())
+        await asyncio.sleep(0)
+    wall = time.perf_counter() - start
+    stop.set()
+    return summarize("inline", 1, latencies, wall, await lag_task, {})
+
+
+async def run_pool(engine_factory, workers: int, image_data: bytes, jobs: int) -> dict:
+    pool = OCRProcessPool(
+        workers=workers,
+        max_queue=jobs,
+        timeout_seconds=120,
+        engine_factory=engine_factory,
+    )
+    warm_start = time.perf_counter()
+    await pool.start()
+    warmup_s = time.perf_counter() - warm_start
+    if not pool.ready:
+        raise SystemExit("OCR 进程池启动失败（RapidOCR 未安装？可使用 --engine synthetic）")
+
+    stop = asyncio.Event()
+    lag_task = asyncio.ensure_future(measure_loop_lag(stop))
+
+    async def one(i: int) -> float:
+        start = time.perf_counter()
+        await pool.extract_text(image_data, request_id=f"bench-{i}")
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    latencies = list(await asyncio.gather(*(one(i) for i in range(jobs))))
+    wall = time.perf_counter() - start
+    stop.set()
+    result = summarize("pool", workers, latencies, wall, await lag_task, {"warmup_s": round(warmup_s, 2)})
+    await pool.close()
+    return result
+
+
+async def main_async(args: argparse.Namespace) -> None:
+    engine_factory = SyntheticEngine if args.engine == "synthetic" else OCRService
+    image_data = make_label_jpeg()
+    print(json.dumps({"engine": args.engine, "cpu_count": os.cpu_count(), "image_bytes": len(image_data)}), flush=True)
+
+    engine = engine_factory()
+    if not engine.available:
+        raise SystemExit("RapidOCR 未安装，可使用 --engine synthetic")
+    print(json.dumps(await run_inline(engine, image_data, args.jobs)), flush=True)
+    for workers in args.workers:
+        print(json.dumps(await run_pool(engine_factory, workers, image_data, args.jobs)), flush=True)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--engine", choices=("rapidocr", "synthetic"), default="rapidocr")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2])
+    parser.add_argument("--jobs", type=int, default=32)
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
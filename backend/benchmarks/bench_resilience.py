@@ -0,0 +1,153 @@
+"""
+重试 + 熔断状态转换检查：VLMService 连接本地假 OpenRouter（benchmarks/fake_openrouter.py），逐阶段注入故障
+
+用法（在 backend 目录下）：
+    python benchmarks/bench_resilience.py
+    python benchmarks/bench_resilience.py --help
+
+没有可调参数：各阶段的预期依赖下面固定的阈值和时间，--help 只显示本说明，不会启动检查。
+
+每个阶段输出一行 JSON：阶段名、本阶段调用结果、假服务收到的请求数、熔断器状态、耗时，以及 expected 与 pass。
+任一阶段不符合预期时退出码为 1。参数（缩短以便快速运行）：熔断阈值 3、恢复时间 1 秒、最多 3 次尝试、退避基数 50 ms、总预算 1.5 秒。
+
+阶段：
+1. healthy：正常响应，熔断器保持 closed
+2. outage：持续 503，一次调用内重试 3 次后熔断器打开（closed → open）
+3. fail_fast：打开状态下的调用不发出请求，立即失败
+4. probe_failed：恢复时间过后半开探测仍然失败（open → half_open → open），只发出 1 个请求
+5. recovered：服务恢复，半开探测成功（half_open → closed）
+6. flaky：50% 的请求返回 503，重试掩盖大部分错误
+7. rate_limited：429 + Retry-After: 0.2，退避按 Retry-After 等待
+8. slow：响应慢于总预算，调用在预算内以 api_error 结束
+9. reopen：再次持续 503，熔断器打开
+10. client_error_probe：恢复时间过后半开探测返回 400，不重试，熔断器保持 half_open（非瞬时错误不计成功也不计失败）
+11. probe_after_client_error：下一个调用重新探测并成功（half_open → closed）
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import sys
+import time
+from pathlib import Path
+
+from PIL import Image
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from benchmarks.fake_openrouter import FakeOpenRouter  # noqa: E402
+
+MODEL = "fake/vision-model"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def run_phases(fake: FakeOpenRouter) -> list[dict]:
+    from services.vlm_service import VLMService
+
+    service = VLMService()
+    breaker = service.breakers[MODEL]
+    image = Image.new("RGB", (64, 64), "white")
+    rows = []
+
+    async def phase(name: str, faults: dict, calls: int, expected: dict, wait: float = 0.0) -> None:
+        fake.faults = faults
+        if wait:
+            await asyncio.sleep(wait)
+        before = fake.requests[MODEL]
+        states = [breaker.state]
+        errors = []
+        start = time.perf_counter()
+        for i in range(calls):
+            result = await service.analyze_ingredients(image, request_id=f"{name}-{i}")
+            errors.append(result.error_type)
+            states.append(breaker.state)
+        elapsed_ms = round((time.perf_counter() - start) * 1000)
+        row = {
+            "phase": name,
+            "calls": calls,
+            "ok": errors.count(None),
+            "error_types": sorted({error for error in errors if error}),
+            "server_requests": fake.requests[MODEL] - before,
+            "states": list(dict.fromkeys(states)),
+            "final_state": breaker.state,
+            "elapsed_ms": elapsed_ms,
+            "expected": expected,
+        }
+        row["pass"] = all(
+            (row[key] >= value[1] and row[key] <= value[2]) if isinstance(value, list) and value and value[0] == "range" else row[key] == value
+            for key, value in expected.items()
+        )
+        rows.append(row)
+        print(json.dumps(row, ensure_ascii=False), flush=True)
+
+    await phase("healthy", {}, 3, {"ok": 3, "server_requests": 3, "final_state": "closed"})
+    await phase("outage", {"*": {"status": 503}}, 1, {"ok": 0, "server_requests": 3, "final_state": "open"})
+    await phase("fail_fast", {"*": {"status": 503}}, 5, {"ok": 0, "server_requests": 0, "final_state": "open", "elapsed_ms": ["range", 0, 200]})
+    await phase("probe_failed", {"*": {"status": 503}}, 1, {"server_requests": 1, "states": ["open"], "final_state": "open"}, wait=1.1)
+    await phase("recovered", {}, 3, {"ok": 3, "server_requests": 3, "final_state": "closed"}, wait=1.1)
+    await phase("flaky", {"*": {"status": 503, "rate": 0.5}}, 20, {"ok": ["range", 12, 20]})
+    fake.faults = {}
+    await asyncio.sleep(1.1)
+    await service.analyze_ingredients(image, request_id="reset")
+    await phase(
+        "rate_limited",
+        {"*": {"status": 429, "retry_after": 0.2}},
+        1,
+        {"ok": 0, "server_requests": 3, "elapsed_ms": ["range", 400, 1500]},
+    )
+    fake.faults = {}
+    await asyncio.sleep(1.1)
+    await service.analyze_ingredients(image, request_id="reset")
+    await phase("slow", {"*": {"delay": 5}}, 1, {"ok": 0, "error_types": ["api_error"], "elapsed_ms": ["range", 1400, 2000]})
+    fake.faults = {}
+    await asyncio.sleep(1.1)
+    await service.analyze_ingredients(image, request_id="reset")
+    await phase("reopen", {"*": {"status": 503}}, 1, {"ok": 0, "server_requests": 3, "final_state": "open"})
+    await phase(
+        "client_error_probe",
+        {"*": {"status": 400}},
+        1,
+        {"ok": 0, "server_requests": 1, "final_state": "half_open"},
+        wait=1.1,
+    )
+    await phase("probe_after_client_error", {}, 1, {"ok": 1, "server_requests": 1, "final_state": "closed"})
+    await service.aclose()
+    print(json.dumps({"retries": service.retry_policy.retries, "circuit": breaker.stats()}), flush=True)
+    return rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.parse_args()
+
+    port = free_port()
+    os.environ.update(
+        OPENROUTER_API_KEY="fake",
+        OPENROUTER_BASE_URL=f"http://127.0.0.1:{port}",
+        OPENROUTER_MODEL=MODEL,
+        OPENROUTER_MODELS="",
+        VLM_BREAKER_FAILURE_THRESHOLD="3",
+        VLM_BREAKER_RECOVERY_SECONDS="1",
+        VLM_RETRY_MAX_ATTEMPTS="3",
+        VLM_RETRY_BASE_DELAY_SECONDS="0.05",
+        VLM_RETRY_BUDGET_SECONDS="1.5",
+    )
+    fake = FakeOpenRouter().start(port)
+    try:
+        rows = asyncio.run(run_phases(fake))
+    finally:
+        fake.stop()
+    sys.exit(0 if all(row["pass"] for row in rows) else 1)
+
+
+if __name__ == "__main__":
+    main()
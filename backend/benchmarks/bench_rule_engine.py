@@ -0,0 +1,120 @@
+"""
+规则引擎与 VLM 分析路径的延迟对比
+
+用法（在 backend 目录下）：
+    python benchmarks/bench_rule_engine.py
+    python benchmarks/bench_rule_engine.py --iterations 2000
+    OPENROUTER_API_KEY=... python benchmarks/bench_rule_engine.py --vlm 5
+
+规则引擎的输入是 benchmarks/corpus/ocr_texts/ 下的 OCR 文字，只统计分析本身（OCR 耗时见 bench_ocr_pool.py）。
+--vlm N 会把同一批标签渲染成图片，真实调用 N 次 OpenRouter 作对比（需要 API Key，会消耗配额）。
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import io
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+
+from PIL import Image, ImageDraw
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from services.additive_index import AdditiveKnowledgeBase  # noqa: E402
+from services.rule_engine import RuleEngine  # noqa: E402
+
+CORPUS_DIR = Path(__file__).resolve().parent / "corpus" / "ocr_texts"
+
+
+def percentile(sorted_values: list[float], fraction: float) -> float:
+    return sorted_values[max(0, int(len(sorted_values) * fraction) - 1)]
+
+
+def bench_rules(iterations: int) -> list[dict]:
+    load_start = time.perf_counter()
+    engine = RuleEngine(AdditiveKnowledgeBase.load())
+    load_ms = (time.perf_counter() - load_start) * 1000
+    rows = []
+    for path in sorted(CORPUS_DIR.glob("*.txt")):
+        text = path.read_text(encoding="utf-8")
+        result = engine.analyze(text)
+        latencies = []
+        for _ in range(iterations):
+            start = time.perf_counter()
+            engine.analyze(text)
+            latencies.append((time.perf_counter() - start) * 1e6)
+        latencies.sort()
+        rows.append(
+            {
+                "engine": "rules",
+                "case": path.stem,
+                "kb_load_ms": round(load_ms, 2),
+                "score": result.health_score or result.error_type,
+                "ingredients": len(result.full_ingredients),
+                "risks": len(result.risks),
+                "p50_us": round(statistics.median(latencies), 1),
+                "p99_us": round(percentile(latencies, 0.99), 1),
+            }
+        )
+    return rows
+
+
+def render_label(text: str) -> tuple[Image.Image, bytes]:
+    lines = text.splitlines()
+    image = Image.new("RGB", (900, 60 + 36 * len(lines)), "white")
+    draw = ImageDraw.Draw(image)
+    for i, line in enumerate(lines):
+        draw.text((30, 30 + i * 36), line, fill="black")
+    buffered = io.BytesIO()
+    image.save(buffered, format="JPEG", quality=90)
+    data = buffered.getvalue()
+    return Image.open(io.BytesIO(data)), data
+
+
+async def bench_vlm(calls: int) -> dict:
+    from services.vlm_service import VLMService
+
+    service = VLMService()
+    # 默认字体只能渲染拉丁字母，使用英文标签
+    image, image_data = render_label((CORPUS_DIR / "en_soda.txt").read_text(encoding="utf-8"))
+    latencies = []
+    errors = 0
+    try:
+        for i in range(calls):
+            start = time.perf_counter()
+            result = await service.analyze_ingredients(image, request_id=f"bench-{i}", image_bytes=image_data)
+            latencies.append((time.perf_counter() - start) * 1e6)
+            errors += bool(result.error)
+    finally:
+        await service.aclose()
+    latencies.sort()
+    return {
+        "engine": "vlm",
+        "case": "en_soda",
+        "model": service.model_name,
+        "calls": calls,
+        "errors": errors,
+        "p50_us": round(statistics.median(latencies), 1),
+        "max_us": round(latencies[-1], 1),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=500)
+    parser.add_argument("--vlm", type=int, default=0, help="真实调用 OpenRouter 的次数（默认 0 不调用）")
+    args = parser.parse_args()
+
+    for row in bench_rules(args.iterations):
+        print(json.dumps(row, ensure_ascii=False), flush=True)
+    if args.vlm:
+        print(json.dumps(asyncio.run(bench_vlm(args.vlm)), ensure_ascii=False), flush=True)
+
+
+if __name__ == "__main__":
+    main()
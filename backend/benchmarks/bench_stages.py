@@ -0,0 +1,264 @@
+"""
+请求路径各阶段的微基准：图片解码、重新编码、模型输出文本提取、JSON 解析、AnalyzeResponse 构建
+
+用法（在 backend 目录下）：
+    python benchmarks/bench_stages.py
+    python benchmarks/bench_stages.py --stages decode encode --sizes 512px 12mp --iterations 20
+    python benchmarks/bench_stages.py --output /tmp/stages_before.json
+
+阶段（都直接调用服务中的函数）：
+- decode：main.decode_base64_image（data URL 前缀处理、Base64 解码、读取文件头；像素延迟解码）
+- decode_pixels：decode_base64_image 之后再 image.load()，即转码 / 指纹计算时实际付出的解码开销
+- encode：VLMService._image_to_base64(image, max_dimension=VLM_PASSTHROUGH_MAX_DIMENSION)，输入为已解码的图片
+  （RGB 转换、超过上限时等比缩小、JPEG 编码、Base64）
+- extract：VLMService._extract_response_text，内容为字符串、内容块字典列表和带 text 属性的对象列表三种形态
+- parse：VLMService._parse_json_response
+- build：VLMService._build_analyze_response（analyze_ingredients 末尾由解析结果构建 AnalyzeResponse）
+
+图片为 label_images.py 按 512px / 1MP / 3MP / 12MP 生成的标签 JPEG（确定性生成，内容与大小接近手机照片），
+另有一张 1MP 的 RGBA PNG（截图类上传，encode 需要先转换为 RGB）；--images 可改用目录中的真实照片。
+模型输出为 benchmarks/corpus/model_outputs/ 中的语料（代码块、说明文字、尾随逗号、注释、单引号、截断、BOM + CRLF 等）。
+
+每个（阶段, 输入）输出一行 JSON：
+- ms_p50 / ms_mean：--iterations 次调用的耗时（墙钟）
+- py_alloc_peak_kb / py_alloc_blocks：单独一次调用在 tracemalloc 下的 Python 分配峰值和调用结束时仍存活的新分配块数
+  （Pillow 的像素缓冲区不经过 Python 分配器，不计入）
+- rss_peak_delta_kb（图片阶段）：在新进程中准备好输入后，用 /proc/self/clear_refs 重置 VmHWM，调用一次后 VmHWM 减去调用前的 VmRSS，
+  包含像素缓冲区；文本阶段的分配都经过 Python 分配器，以 py_alloc_peak_kb 为准，该字段为 null
+INFO 日志默认关闭（--with-logging 保留），只测量函数本身。--output 把全部结果连同环境信息写成 JSON 作为基线。
+"""
+
+from __future__ import annotations
+
+import argparse
+import base64
+import io
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Callable, Optional
+
+from PIL import Image
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND_DIR))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+os.environ.setdefault("OCR_MODE", "off")
+os.environ.setdefault("INGREDIENT_DESCRIPTION_CACHE_PATH", ":memory:")
+
+from label_images import LABEL_SIZES, load_images, render_label  # noqa: E402
+
+MODEL_OUTPUTS_DIR = Path(__file__).resolve().parent / "corpus" / "model_outputs"
+STAGES = ("decode", "decode_pixels", "encode", "extract", "parse", "build")
+
+
+def _status_kb(field: str) -> Optional[int]:
+    with open("/proc/self/status", "r", encoding="utf-8") as status_file:
+        for line in status_file:
+            if line.startswith(field):
+                return int(line.split()[1])
+    return None
+
+
+def rss_peak_delta_kb(func: Callable[[], object]) -> Optional[int]:
+    """重置 VmHWM 后调用一次；不支持 clear_refs 的系统返回 None"""
+    try:
+        with open("/proc/self/clear_refs", "w", encoding="ascii") as clear_refs:
+            clear_refs.write("5")
+    except OSError:
+        return None
+    before = _status_kb("VmRSS:")
+    result = func()
+    peak = _status_kb("VmHWM:")
+    del result
+    return peak - before if peak is not None and before is not None else None
+
+
+def py_allocations(func: Callable[[], object]) -> tuple[float, int]:
+    """单次调用的 tracemalloc 峰值（KB）和调用结束时仍存活的新分配块数（含返回值）"""
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        tracemalloc.reset_peak()
+        result = func()
+        _, peak = tracemalloc.get_traced_memory()
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    blocks = sum(stat.count_diff for stat in after.compare_to(before, "filename") if stat.count_diff > 0)
+    del result
+    return round(peak / 1024, 1), blocks
+
+
+def measure(
+    stage: str, case: str, input_bytes: int, func: Callable[[], object], iterations: int, rss_kb: Optional[int] = None
+) -> dict:
+    func()
+    durations = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func()
+        durations.append((time.perf_counter() - start) * 1000)
+    alloc_peak_kb, alloc_blocks = py_allocations(func)
+    return {
+        "stage": stage,
+        "case": case,
+        "input_bytes": input_bytes,
+        "iterations": iterations,
+        "ms_p50": round(statistics.median(durations), 4),
+        "ms_mean": round(statistics.fmean(durations), 4),
+        "py_alloc_peak_kb": alloc_peak_kb,
+        "py_alloc_blocks": alloc_blocks,
+        "rss_peak_delta_kb": rss_kb,
+    }
+
+
+def image_stage(stage: str, case: str, data: bytes, app_main, service) -> tuple[Callable[[], object], str, int]:
+    """返回 (被测调用, 输入名称, 输入字节数)"""
+    if stage == "encode":
+        image = Image.open(io.BytesIO(data))
+        image.load()
+        return (
+            lambda: service._image_to_base64(image, max_dimension=service.passthrough_max_dimension),
+            f"{case}_{image.size[0]}x{image.size[1]}",
+            len(data),
+        )
+    payload = "data:image/jpeg;base64," + base64.b64encode(data).decode("ascii")
+    if stage == "decode":
+        return lambda: app_main.decode_base64_image(payload), case, len(payload)
+
+    def decode_pixels():
+        image, _ = app_main.decode_base64_image(payload)
+        image.load()
+        return image
+
+    return decode_pixels, case, len(payload)
+
+
+def rss_in_child(stage: str, image_path: str) -> Optional[int]:
+    """
+    在新进程中准备好输入后只调用一次，返回 VmHWM 增量
+
+    同一进程中前面的输入释放的内存留在 malloc 的空闲链表里（RSS 不回落），后面的调用直接复用，
+    在进程内测得的增量接近 0，所以图片阶段的峰值内存在子进程中测量。
+    """
+    result = subprocess.run(
+        [sys.executable, __file__, "--rss-child", stage, image_path],
+        capture_output=True,
+        text=True,
+        env={**os.environ, "LOG_MODE": "sync"},
+    )
+    return json.loads(result.stdout) if result.returncode == 0 and result.stdout.strip() else None
+
+
+def image_corpus(args) -> list[tuple[str, bytes]]:
+    if args.images:
+        return [(f"file{index}", data) for index, data in enumerate(load_images(args.images))]
+    corpus = [(f"{size}_jpeg", render_label(size)) for size in args.sizes]
+    screenshot = Image.open(io.BytesIO(render_label("1mp"))).convert("RGBA")
+    buffer = io.BytesIO()
+    screenshot.save(buffer, format="PNG")
+    corpus.append(("1mp_rgba_png", buffer.getvalue()))
+    return corpus
+
+
+def content_forms(text: str) -> dict[str, object]:
+    """模型返回内容的三种形态：字符串、内容块字典列表、带 text 属性的对象列表（按约 200 字符切块）"""
+    pieces = [text[start:start + 200] for start in range(0, len(text), 200)] or [""]
+    return {
+        "str": text,
+        "dict_parts": [{"type": "text", "text": piece} for piece in pieces],
+        "object_parts": [SimpleNamespace(type="text", text=piece) for piece in pieces],
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stages", nargs="+", default=list(STAGES), choices=STAGES)
+    parser.add_argument("--sizes", nargs="+", default=list(LABEL_SIZES), choices=list(LABEL_SIZES))
+    parser.add_argument("--images", type=Path, help="使用该目录中的图片代替合成标签")
+    parser.add_argument("--iterations", type=int, default=0, help="每个输入的调用次数（默认图片阶段 10 次，文本阶段 200 次）")
+    parser.add_argument("--with-logging", action="store_true", help="保留 INFO 日志（默认关闭，只测函数本身）")
+    parser.add_argument("--output", type=Path)
+    parser.add_argument("--rss-child", nargs=2, metavar=("STAGE", "IMAGE"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if not args.with_logging or args.rss_child:
+        logging.disable(logging.INFO)
+    import main as app_main
+    from services.vlm_service import VLMService
+
+    service = VLMService()
+    if args.rss_child:
+        stage, image_path = args.rss_child
+        func, _, _ = image_stage(stage, "-", Path(image_path).read_bytes(), app_main, service)
+        print(json.dumps(rss_peak_delta_kb(func)))
+        return
+    image_iterations = args.iterations or 10
+    text_iterations = args.iterations or 200
+    results = []
+
+    def emit(result: dict) -> None:
+        results.append(result)
+        print(json.dumps(result, ensure_ascii=False), flush=True)
+
+    if {"decode", "decode_pixels", "encode"} & set(args.stages):
+        for case, data in image_corpus(args):
+            with tempfile.NamedTemporaryFile(prefix="bench_stages_", delete=False) as image_file:
+                image_file.write(data)
+            try:
+                for stage in ("decode", "decode_pixels", "encode"):
+                    if stage not in args.stages:
+                        continue
+                    func, label, input_bytes = image_stage(stage, case, data, app_main, service)
+                    emit(measure(stage, label, input_bytes, func, image_iterations, rss_in_child(stage, image_file.name)))
+                    del func
+            finally:
+                os.unlink(image_file.name)
+
+    outputs = [(path.stem, path.read_text(encoding="utf-8")) for path in sorted(MODEL_OUTPUTS_DIR.glob("*.txt"))]
+    for case, text in outputs:
+        if "extract" in args.stages:
+            for form, content in content_forms(text).items():
+                emit(
+                    measure(
+                        "extract", f"{case}:{form}", len(text), lambda: service._extract_response_text(content), text_iterations
+                    )
+                )
+        if "parse" in args.stages:
+            emit(measure("parse", case, len(text), lambda: service._parse_json_response(text), text_iterations))
+        if "build" in args.stages:
+            result_data = service._parse_json_response(text)
+            emit(
+                measure(
+                    "build",
+                    case,
+                    len(text),
+                    lambda: service._build_analyze_response(result_data, "-", 0),
+                    text_iterations,
+                )
+            )
+
+    if args.output:
+        meta = {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "pillow": Image.__version__,
+            "cpu_count": os.cpu_count(),
+            "args": {key: str(value) if isinstance(value, Path) else value for key, value in vars(args).items()},
+        }
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        args.output.write_text(json.dumps({"meta": meta, "results": results}, ensure_ascii=False, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
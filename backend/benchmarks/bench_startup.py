@@ -0,0 +1,254 @@
+"""
+冷启动耗时：main 模块的逐项导入耗时（python -X importtime）、服务进程从启动到 /health 可用的时间、首个请求的延迟
+
+用法（在 backend 目录下）：
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --runs 10 --top 15 --output /tmp/startup_after.json
+    python benchmarks/bench_startup.py --budget-ms 600 --forbid-modules openai numpy sentry_sdk
+
+三部分，每部分输出 JSON 行：
+- import：在新进程中 --runs 次执行 python -X importtime -c "import main"，取 main 累计导入耗时的中位数（import_ms）、
+  进程墙钟耗时，以及 main 直接触发的导入中累计耗时最大的 --top 项（取各次运行的中位数；已被 site 等先行导入的模块不计入）；
+  同时记录 --forbid-modules 中在导入 main 后已出现在 sys.modules 中的模块。-X importtime 本身有开销，数值比不带该选项时略大
+- ready：启动 uvicorn 服务进程，轮询 /health 直到返回，记录 ready_ms（从创建进程起）以及服务日志中的 startup_ready / startup_warm_up_done
+- first_request（--skip-first-request 时跳过）：/health 可用后立即向 /api/v1/analyze 发一张 512px 标签图片，
+  上游为线程中启动的本地假 OpenRouter（延迟约 50 毫秒），记录首个和第二个请求的延迟；两者之差约等于首个请求付出的初始化开销（预热尚未完成时包括等待预热），
+  spawn_to_first_response_ms 为 ready_ms 加首个请求的延迟，即缩容到零后第一个用户实际等待的时间
+
+服务进程的环境：OCR 关闭、配料说明缓存使用内存数据库、不启用 Sentry 和 LangSmith、OPENROUTER_API_KEY 为假值（与线上一样会创建客户端）。
+仓库没有测试套件，这里兼作回归检查：import_ms 超过 --budget-ms，或 --forbid-modules 中的模块在导入 main 时就被加载，
+则输出 violations 并以退出码 1 结束，可以直接放进 CI。--output 把全部结果连同环境信息写成 JSON。
+"""
+
+from __future__ import annotations
+
+import argparse
+import base64
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from bench_load import free_port, wait_ready  # noqa: E402
+from fake_openrouter import FakeOpenRouter  # noqa: E402
+from label_images import render_label  # noqa: E402
+
+# 默认禁止在导入 main 时加载的模块：都只在首次使用时（或预热线程中）导入
+DEFAULT_FORBIDDEN = ("openai", "httpx", "numpy", "sentry_sdk", "langsmith", "rapidocr_onnxruntime")
+MODULES_MARKER = "__bench_startup_modules__"
+
+
+def service_env() -> dict:
+    return {
+        **os.environ,
+        "OPENROUTER_API_KEY": "fake",
+        "OCR_MODE": "off",
+        "INGREDIENT_DESCRIPTION_CACHE_PATH": ":memory:",
+        "LANGSMITH_TRACING": "false",
+        "SENTRY_DSN": "",
+        "LOG_MODE": "sync",
+    }
+
+
+def parse_importtime(stderr: str) -> tuple[float, dict[str, float]]:
+    """返回 (main 的累计导入耗时毫秒, main 直接触发的各项导入的累计耗时毫秒)"""
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) != 3 or not fields[1].strip().isdigit():
+            continue
+        name = fields[2][1:]
+        depth = (len(name) - len(name.lstrip(" "))) // 2
+        entries.append((depth, name.strip(), int(fields[1]) / 1000))
+    # -X importtime 按导入完成的顺序输出，子项在父项之前：main 之前、上一个顶层项之后的 depth 1 项即 main 直接触发的导入
+    children: dict[str, float] = {}
+    for depth, name, cumulative_ms in entries:
+        if depth == 0:
+            if name == "main":
+                return cumulative_ms, children
+            children = {}
+        elif depth == 1:
+            children[name] = cumulative_ms
+    raise RuntimeError("importtime 输出中没有 main")
+
+
+def measure_imports(args) -> dict:
+    code = (
+        "import json, sys, main; "
+        f"print({MODULES_MARKER!r}, json.dumps(sorted(name for name in {list(args.forbid_modules)!r} if name in sys.modules)))"
+    )
+    totals, walls = [], []
+    children_runs: dict[str, list[float]] = {}
+    loaded: set[str] = set()
+    for _ in range(args.runs):
+        start = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", code],
+            cwd=BACKEND_DIR,
+            env=service_env(),
+            capture_output=True,
+            text=True,
+        )
+        walls.append((time.perf_counter() - start) * 1000)
+        if result.returncode != 0:
+            raise RuntimeError(f"导入 main 失败：{result.stderr[-2000:]}")
+        total_ms, children = parse_importtime(result.stderr)
+        totals.append(total_ms)
+        for name, cumulative_ms in children.items():
+            children_runs.setdefault(name, []).append(cumulative_ms)
+        for line in result.stdout.splitlines():
+            if line.startswith(MODULES_MARKER):
+                loaded.update(json.loads(line[len(MODULES_MARKER):]))
+    top = sorted(
+        ((name, round(statistics.median(values), 1)) for name, values in children_runs.items()),
+        key=lambda item: item[1],
+        reverse=True,
+    )[: args.top]
+    return {
+        "phase": "import",
+        "runs": args.runs,
+        "import_ms": round(statistics.median(totals), 1),
+        "import_ms_min": round(min(totals), 1),
+        "process_wall_ms": round(statistics.median(walls), 1),
+        "top_imports_ms": dict(top),
+        "forbidden_loaded": sorted(loaded),
+    }
+
+
+def startup_log_fields(log_text: str, event: str) -> dict:
+    """从服务日志中取出 event 行的 key=value 字段"""
+    for line in log_text.splitlines():
+        if f"{event} " in line:
+            return dict(part.split("=", 1) for part in line.split(f"{event} ", 1)[1].split() if "=" in part)
+    return {}
+
+
+def measure_ready(args) -> list[dict]:
+    results = []
+    fake = None
+    env = service_env()
+    if not args.skip_first_request:
+        fake_port = free_port()
+        fake = FakeOpenRouter().start(fake_port)
+        fake.faults = {"*": {"latency_median": 0.05, "latency_sigma": 0.1}}
+        env["OPENROUTER_BASE_URL"] = f"http://127.0.0.1:{fake_port}"
+    port = free_port()
+    with tempfile.TemporaryFile(mode="w+", encoding="utf-8") as log_file:
+        start = time.perf_counter()
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+            cwd=BACKEND_DIR,
+            env=env,
+            stdout=log_file,
+            stderr=subprocess.STDOUT,
+        )
+        try:
+            wait_ready(f"http://127.0.0.1:{port}/health", server)
+            ready_ms = (time.perf_counter() - start) * 1000
+            latencies = []
+            if not args.skip_first_request:
+                for index in range(2):
+                    # 序号不同的图片：第二个请求不命中结果缓存
+                    payload = {"image_base64": base64.b64encode(render_label("512px", index)).decode("ascii")}
+                    request_start = time.perf_counter()
+                    response = httpx.post(f"http://127.0.0.1:{port}/api/v1/analyze", json=payload, timeout=60)
+                    latencies.append(
+                        {
+                            "ms": round((time.perf_counter() - request_start) * 1000, 1),
+                            "status": response.status_code,
+                            "error_type": response.json().get("error_type"),
+                        }
+                    )
+            # 等待预热线程结束（首个请求早于预热完成时，日志行会晚一些出现）
+            for _ in range(100):
+                log_file.seek(0)
+                log_text = log_file.read()
+                if "startup_warm_up_" in log_text:
+                    break
+                time.sleep(0.05)
+        finally:
+            server.terminate()
+            server.wait()
+            if fake is not None:
+                fake.stop()
+    results.append(
+        {
+            "phase": "ready",
+            "ready_ms": round(ready_ms, 1),
+            "startup_ready": startup_log_fields(log_text, "startup_ready"),
+            "startup_warm_up_done": startup_log_fields(log_text, "startup_warm_up_done"),
+        }
+    )
+    if latencies:
+        results.append(
+            {
+                "phase": "first_request",
+                "first": latencies[0],
+                "second": latencies[1],
+                "first_overhead_ms": round(latencies[0]["ms"] - latencies[1]["ms"], 1),
+                "spawn_to_first_response_ms": round(ready_ms + latencies[0]["ms"], 1),
+            }
+        )
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="-X importtime 的运行次数")
+    parser.add_argument("--top", type=int, default=10, help="输出累计耗时最大的前几项导入")
+    parser.add_argument("--budget-ms", type=float, default=900, help="import_ms 的上限，超过时退出码为 1；0 表示不检查")
+    parser.add_argument("--forbid-modules", nargs="*", default=list(DEFAULT_FORBIDDEN), help="导入 main 时不应加载的模块")
+    parser.add_argument("--skip-ready", action="store_true", help="只测导入耗时，不启动服务进程")
+    parser.add_argument("--skip-first-request", action="store_true", help="不发首个请求（也不启动假 OpenRouter）")
+    parser.add_argument("--output", type=Path)
+    args = parser.parse_args()
+
+    results = []
+
+    def emit(result: dict) -> None:
+        results.append(result)
+        print(json.dumps(result, ensure_ascii=False), flush=True)
+
+    imports = measure_imports(args)
+    emit(imports)
+    if not args.skip_ready:
+        for result in measure_ready(args):
+            emit(result)
+
+    violations = []
+    if args.budget_ms and imports["import_ms"] > args.budget_ms:
+        violations.append(f"import_ms {imports['import_ms']} > budget_ms {args.budget_ms}")
+    if imports["forbidden_loaded"]:
+        violations.append("导入 main 时加载了：" + ", ".join(imports["forbidden_loaded"]))
+    print(json.dumps({"budget_ms": args.budget_ms, "violations": violations}, ensure_ascii=False), flush=True)
+
+    if args.output:
+        meta = {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "cpu_count": os.cpu_count(),
+            "args": {key: str(value) if isinstance(value, Path) else value for key, value in vars(args).items()},
+        }
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        args.output.write_text(
+            json.dumps({"meta": meta, "results": results, "violations": violations}, ensure_ascii=False, indent=2),
+            encoding="utf-8",
+        )
+    if violations:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+OpenRouter 共享连接池检查：N 个并发 VLM 调用是否走同一个 AsyncOpenAI / httpx.AsyncClient，且在时间上重叠
+
+用法（在 backend 目录下）：
+    python benchmarks/bench_vlm_pool.py
+    python benchmarks/bench_vlm_pool.py --calls 16 --delay 0.5
+    OPENROUTER_MAX_CONNECTIONS=4 python benchmarks/bench_vlm_pool.py --calls 8
+
+在线程中启动本地假 OpenRouter（固定延迟 --delay 秒），用同一个 VLMService 同时发出 --calls 个 analyze_ingredients 调用，
+在共享的 httpx 客户端上挂 request 事件钩子统计经过它的 HTTP 请求。检查项：
+- shared_client：调用结束时 VLMService.client 仍是调用前的同一个 AsyncOpenAI 对象，其内部使用的就是 VLMService.http_client，
+  且每个调用的 HTTP 请求都经过这个 http_client（钩子计数等于 --calls）
+- overlap：假 OpenRouter 上同时处理中的请求数峰值达到 min(--calls, OPENROUTER_MAX_CONNECTIONS)，
+  总耗时低于按连接数分批的时间（ceil(calls / 连接数) × delay）与完全串行时间（calls × delay，同步客户端的情形）的中点；
+  每个调用还有编码图片等 CPU 开销，且假服务运行在同一进程中，总耗时会比分批时间多出一截
+输出一行 JSON；任一项不满足时输出 violations 并以退出码 1 结束，可以直接放进 CI。
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import io
+import json
+import math
+import os
+import sys
+import time
+from pathlib import Path
+
+from PIL import Image
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from bench_load import free_port  # noqa: E402
+from fake_openrouter import FakeOpenRouter  # noqa: E402
+from label_images import render_label  # noqa: E402
+
+MODEL = "fake/pool-check"
+
+
+async def run(args, fake: FakeOpenRouter) -> dict:
+    from services.env_config import read_int_env
+    from services.vlm_service import VLMService
+
+    service = VLMService()
+    if not service.ensure_client() or service.client is None:
+        raise RuntimeError("OpenRouter 客户端创建失败")
+    client, http_client = service.client, service.http_client
+    seen_requests = 0
+
+    async def on_request(request) -> None:
+        nonlocal seen_requests
+        seen_requests += 1
+
+    http_client.event_hooks["request"].append(on_request)
+
+    image = Image.open(io.BytesIO(render_label("512px")))
+    image.load()
+    start = time.perf_counter()
+    results = await asyncio.gather(
+        *(service.analyze_ingredients(image, request_id=f"pool-{index}") for index in range(args.calls))
+    )
+    wall = time.perf_counter() - start
+    shared = service.client is client and service.http_client is http_client and client._client is http_client
+    await service.aclose()
+
+    max_connections = read_int_env("OPENROUTER_MAX_CONNECTIONS", 20)
+    return {
+        "calls": args.calls,
+        "delay_s": args.delay,
+        "max_connections": max_connections,
+        "errors": sum(result.error is not None for result in results),
+        "shared_client": shared,
+        "http_requests": seen_requests,
+        "peak_in_flight": fake.peak_in_flight,
+        "expected_peak": min(args.calls, max_connections),
+        "wall_s": round(wall, 3),
+        "batched_bound_s": round(math.ceil(args.calls / max_connections) * args.delay, 3),
+        "serial_s": round(args.calls * args.delay, 3),
+        "wall_limit_s": round((math.ceil(args.calls / max_connections) + args.calls) * args.delay / 2, 3),
+    }
+
+
+def check(result: dict, args) -> list[str]:
+    violations = []
+    if result["errors"]:
+        violations.append(f"{result['errors']} 个调用返回错误")
+    if not result["shared_client"]:
+        violations.append("调用后 AsyncOpenAI / http_client 不是调用前的同一个对象，或 AsyncOpenAI 没有使用共享的 http_client")
+    if result["http_requests"] != args.calls:
+        violations.append(f"共享 http_client 上只有 {result['http_requests']} 个请求（期望 {args.calls}）")
+    if result["peak_in_flight"] < result["expected_peak"]:
+        violations.append(f"上游同时处理的请求峰值 {result['peak_in_flight']} < {result['expected_peak']}：调用没有重叠")
+    # 只有一个连接时分批时间等于串行时间，不检查总耗时
+    if result["expected_peak"] > 1 and result["wall_s"] >= result["wall_limit_s"]:
+        violations.append(f"总耗时 {result['wall_s']}s >= {result['wall_limit_s']}s：接近串行执行")
+    return violations
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=8, help="并发的分析调用数")
+    parser.add_argument("--delay", type=float, default=1.0, help="假 OpenRouter 每次响应的固定延迟（秒）")
+    args = parser.parse_args()
+
+    port = free_port()
+    fake = FakeOpenRouter().start(port)
+    fake.faults = {"*": {"delay": args.delay}}
+    # 单个模型：不触发对冲，每个调用恰好一次 HTTP 请求；不设成分说明缓存，不会追加说明请求
+    os.environ.update(
+        OPENROUTER_API_KEY="fake",
+        OPENROUTER_BASE_URL=f"http://127.0.0.1:{port}",
+        OPENROUTER_MODELS=MODEL,
+        VLM_BACKEND_MODE="live",
+        LANGSMITH_TRACING="false",
+    )
+    try:
+        result = asyncio.run(run(args, fake))
+    finally:
+        fake.stop()
+    violations = check(result, args)
+    print(json.dumps({**result, "violations": violations}, ensure_ascii=False), flush=True)
+    if violations:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
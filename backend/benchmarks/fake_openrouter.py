@@ -0,0 +1,180 @@
+"""
+本地假 OpenRouter 服务：OpenAI 兼容的 /chat/completions，可按模型配置延迟分布、流式输出速度并注入故障
+
+用法（在 backend 目录下）：
+    python benchmarks/fake_openrouter.py --port 8090
+    python benchmarks/fake_openrouter.py --port 8090 --faults '{"*": {"latency_median": 4, "latency_sigma": 0.35, "tokens_per_second": 60}}'
+    OPENROUTER_BASE_URL=http://127.0.0.1:8090 OPENROUTER_API_KEY=fake python -m uvicorn main:app
+
+故障配置（POST /_faults，整体替换）：{"模型名或 *": {"status": 503, "rate": 1.0, "delay": 0.0, "retry_after": null, ...}}
+- status / rate：以 rate 概率返回该状态码（OpenAI 风格的错误体），status 为空时不注入错误
+- delay：响应前固定等待的秒数（对成功和错误响应都生效）
+- latency_median / latency_sigma：另加对数正态分布的等待（中位数秒、对数标准差），模拟排队和首 token 延迟
+- straggler_rate / straggler_factor：以该概率把这次等待乘以 factor，模拟免费模型的长尾
+- tokens_per_second：按 completion token 数（约 3 个字符一个）计算生成耗时；流式响应按此速度逐块输出，非流式在返回前等待
+- retry_after：错误响应附带的 Retry-After 头
+GET /_stats 返回每个模型收到的请求数、注入的错误数，以及同时处理中的请求数峰值（peak_in_flight，流式响应只计到开始输出）。其他脚本可直接 import FakeOpenRouter 在线程中启动。
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import math
+import random
+import threading
+import time
+from collections import Counter
+from typing import Optional
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+DEFAULT_CONTENT = json.dumps(
+    {
+        "health_score": "C",
+        "summary": "含有人工色素和防腐剂，适量食用。",
+        "risks": [
+            {"level": "High", "name": "Tartrazine (E102)", "desc": "人工色素，可能引起儿童多动。"},
+            {"level": "Moderate", "name": "Sodium Benzoate (E211)", "desc": "防腐剂，与维生素 C 共存时可能生成苯。"},
+        ],
+        "full_ingredients": ["Water", "Sugar", "Citric Acid (E330)", "Tartrazine (E102)", "Sodium Benzoate (E211)"],
+        "alternatives": ["无添加色素的果汁饮料"],
+        "confidence": 0.9,
+    },
+    ensure_ascii=False,
+)
+
+
+class FakeOpenRouter:
+    def __init__(self, content: str = DEFAULT_CONTENT, seed: int = 0):
+        self.content = content
+        self.faults: dict[str, dict] = {}
+        self.requests: Counter = Counter()
+        self.injected: Counter = Counter()
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self._rng = random.Random(seed)
+        self.app = Starlette(
+            routes=[
+                Route("/chat/completions", self.chat_completions, methods=["POST"]),
+                Route("/_faults", self.set_faults, methods=["POST"]),
+                Route("/_stats", self.stats, methods=["GET"]),
+            ]
+        )
+        self._server: Optional[uvicorn.Server] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def fault_for(self, model: str) -> dict:
+        return self.faults.get(model) or self.faults.get("*") or {}
+
+    def latency_for(self, fault: dict) -> float:
+        seconds = fault.get("delay", 0.0)
+        if fault.get("latency_median"):
+            latency = fault["latency_median"] * math.exp(self._rng.gauss(0, fault.get("latency_sigma", 0.0)))
+            if self._rng.random() < fault.get("straggler_rate", 0.0):
+                latency *= fault.get("straggler_factor", 1.0)
+            seconds += latency
+        return seconds
+
+    async def chat_completions(self, request: Request) -> Response:
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            return await self._chat_completions(request)
+        finally:
+            self.in_flight -= 1
+
+    async def _chat_completions(self, request: Request) -> Response:
+        body = await request.json()
+        model = body.get("model", "-")
+        self.requests[model] += 1
+        fault = self.fault_for(model)
+        latency = self.latency_for(fault)
+        if latency:
+            await asyncio.sleep(latency)
+        if fault.get("status") and self._rng.random() < fault.get("rate", 1.0):
+            self.injected[model] += 1
+            headers = {"retry-after": str(fault["retry_after"])} if fault.get("retry_after") is not None else None
+            return JSONResponse(
+                {"error": {"message": f"injected {fault['status']}", "code": fault["status"]}},
+                status_code=fault["status"],
+                headers=headers,
+            )
+        completion_id = f"fake-{self.requests.total()}"
+        usage = {"prompt_tokens": 1000, "completion_tokens": len(self.content) // 3, "total_tokens": 1000 + len(self.content) // 3}
+        tokens_per_second = fault.get("tokens_per_second")
+        if body.get("stream"):
+            return StreamingResponse(
+                self._stream(completion_id, model, usage, tokens_per_second),
+                media_type="text/event-stream",
+            )
+        if tokens_per_second:
+            await asyncio.sleep(usage["completion_tokens"] / tokens_per_second)
+        return JSONResponse(
+            {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [
+                    {"index": 0, "message": {"role": "assistant", "content": self.content}, "finish_reason": "stop"}
+                ],
+                "usage": usage,
+            }
+        )
+
+    async def _stream(self, completion_id: str, model: str, usage: dict, tokens_per_second: Optional[float] = None):
+        base = {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()), "model": model}
+        # 每块 24 个字符，约 8 个 token
+        chunk_seconds = 8 / tokens_per_second if tokens_per_second else 0
+        for start in range(0, len(self.content), 24):
+            delta = {"content": self.content[start:start + 24]}
+            yield f"data: {json.dumps({**base, 'choices': [{'index': 0, 'delta': delta, 'finish_reason': None}]})}\n\n"
+            await asyncio.sleep(chunk_seconds)
+        yield f"data: {json.dumps({**base, 'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}]})}\n\n"
+        yield f"data: {json.dumps({**base, 'choices': [], 'usage': usage})}\n\n"
+        yield "data: [DONE]\n\n"
+
+    async def set_faults(self, request: Request) -> Response:
+        self.faults = await request.json()
+        return JSONResponse(self.faults)
+
+    async def stats(self, request: Request) -> Response:
+        return JSONResponse(
+            {"requests": dict(self.requests), "injected": dict(self.injected), "peak_in_flight": self.peak_in_flight}
+        )
+
+    def start(self, port: int) -> "FakeOpenRouter":
+        """在后台线程中启动（供基准脚本使用）"""
+        config = uvicorn.Config(self.app, host="127.0.0.1", port=port, log_level="warning", lifespan="off")
+        self._server = uvicorn.Server(config)
+        self._thread = threading.Thread(target=self._server.run, daemon=True)
+        self._thread.start()
+        while not self._server.started:
+            time.sleep(0.01)
+        return self
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.should_exit = True
+            self._thread.join()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--faults", default="{}", help="启动时的故障配置（JSON），之后可通过 POST /_faults 修改")
+    args = parser.parse_args()
+
+    fake = FakeOpenRouter()
+    fake.faults = json.loads(args.faults)
+    uvicorn.run(fake.app, host="127.0.0.1", port=args.port, log_level="info")
+
+
+if __name__ == "__main__":
+    main()
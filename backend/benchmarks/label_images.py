@@ -0,0 +1,95 @@
+"""
+合成商品标签图片：把 corpus/ocr_texts 中的配料表文字渲染到带噪点的底色上，按指定尺寸编码为 JPEG，供压测和微基准使用
+
+纯色图片的 JPEG 只有几 KB，解码 / 编码耗时与真实照片相差很大；这里加入逐像素噪点和轻微模糊，
+使文件大小和解码耗时接近手机拍摄的标签照片。同一（尺寸、序号）总是生成相同的字节，序号不同的图片内容不同，
+压测时不会命中结果缓存（近似重复索引默认关闭；开启时不同序号的图片也可能误匹配，见 bench_near_duplicate_index.py）。真实照片可以放进任意目录，通过各脚本的 --images 参数使用。
+
+用法（在 backend 目录下）：
+    python benchmarks/label_images.py --out /tmp/labels --sizes 512px 12mp --count 2
+"""
+
+from __future__ import annotations
+
+import argparse
+import io
+import random
+import textwrap
+from pathlib import Path
+
+from PIL import Image, ImageChops, ImageDraw, ImageFilter, ImageFont
+
+CORPUS_DIR = Path(__file__).resolve().parent / "corpus" / "ocr_texts"
+
+# 名称 → (宽, 高)；12mp 为常见手机主摄的 4:3 原图
+LABEL_SIZES = {
+    "512px": (512, 512),
+    "1mp": (864, 1152),
+    "3mp": (1500, 2000),
+    "12mp": (3024, 4032),
+}
+
+
+def _corpus_lines() -> list[str]:
+    lines = []
+    for path in sorted(CORPUS_DIR.glob("*.txt")):
+        lines.extend(line for line in path.read_text(encoding="utf-8").splitlines() if line.strip())
+    return lines or ["Ingredients: water, sugar, citric acid (E330), sodium benzoate (E211)."]
+
+
+def render_label(size: str | tuple[int, int], index: int = 0, quality: int = 90) -> bytes:
+    """渲染一张标签图片并返回 JPEG 字节"""
+    width, height = LABEL_SIZES[size] if isinstance(size, str) else size
+    rng = random.Random(f"{width}x{height}-{index}")
+    tint = tuple(rng.randrange(200, 225) for _ in range(3))
+    image = Image.new("RGB", (width, height), tint)
+    noise = Image.frombytes("L", (width, height), rng.randbytes(width * height)).point(lambda value: value // 8)
+    image = ImageChops.add(image, Image.merge("RGB", (noise, noise, noise)))
+
+    draw = ImageDraw.Draw(image)
+    font_size = max(12, width // 36)
+    font = ImageFont.load_default(size=font_size)
+    lines = _corpus_lines()
+    start = rng.randrange(len(lines))
+    y = rng.randrange(font_size, font_size * 3)
+    chars_per_line = max(20, int(width / (font_size * 0.55)))
+    for offset in range(len(lines)):
+        for wrapped in textwrap.wrap(lines[(start + offset) % len(lines)], chars_per_line):
+            if y > height - font_size * 2:
+                break
+            draw.text((font_size, y), wrapped, fill=(20, 20, 20), font=font)
+            y += int(font_size * 1.4)
+    image = image.filter(ImageFilter.GaussianBlur(0.6))
+
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=quality)
+    return buffer.getvalue()
+
+
+def load_images(directory: Path) -> list[bytes]:
+    """读取目录中的 JPEG / PNG / WebP 图片（按文件名排序）"""
+    return [
+        path.read_bytes()
+        for path in sorted(directory.iterdir())
+        if path.suffix.lower() in (".jpg", ".jpeg", ".png", ".webp")
+    ]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--out", type=Path, required=True)
+    parser.add_argument("--sizes", nargs="+", default=list(LABEL_SIZES), choices=list(LABEL_SIZES))
+    parser.add_argument("--count", type=int, default=1)
+    args = parser.parse_args()
+
+    args.out.mkdir(parents=True, exist_ok=True)
+    for size in args.sizes:
+        for index in range(args.count):
+            data = render_label(size, index)
+            path = args.out / f"label_{size}_{index}.jpg"
+            path.write_bytes(data)
+            print(f"{path} {len(data)} bytes")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,48 +3,64 @@ IngrediScan AI Backend Service
 FastAPI 后端服务，集成 RapidOCR 和 OpenRouter 多模态模型
 """
 
+import time
+
+# 模块开始导入的时刻，启动完成时报告导入耗时
+_IMPORT_START = time.perf_counter()
+
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, ValidationError
 import base64
+import importlib.util
 import io
+import json
 from PIL import Image
 import os
+import threading
 import uuid
-from typing import Optional
+from typing import AsyncIterator, Awaitable, Callable, Optional
 import logging
-import threading
-from starlette.datastructures import Headers
+from starlette.datastructures import Headers, UploadFile
 
-try:
-    import sentry_sdk
-    from sentry_sdk.integrations.fastapi import FastApiIntegration
-    from sentry_sdk.integrations.logging import LoggingIntegration
-    SENTRY_AVAILABLE = True
-except ImportError:
-    SENTRY_AVAILABLE = False
+# sentry-sdk 只在设置了 SENTRY_DSN 时导入（导入本身约 0.3 秒，未启用时不付出）
+SENTRY_AVAILABLE = importlib.util.find_spec("sentry_sdk") is not None
 
 # 导入 OCR 和 VLM 模块
-from services.ocr_service import OCRService
-from services.vlm_service import VLMService
-from services.runtime_logging import elapsed_ms, memory_snapshot, now_ms, text_preview
+from services.ocr_pool import OCRPoolError, OCRProcessPool
+from services.ocr_validation import validate_with_ocr
+from services.additive_index import AdditiveKnowledgeBase
+from services.description_cache import DEFAULT_CACHE_PATH, IngredientDescriptionCache
+from services.rule_engine import RuleEngine
+from services.vlm_service import PROMPT_VERSION, VLMService
+from services.env_config import read_choice_env, read_float_env, read_int_env
+from services.result_cache import ResultCache, build_cache_key, image_digest
+from services.perceptual_hash import NearDuplicateIndex, dhash_fingerprint
+from services.single_flight import SingleFlight
+from services.job_queue import Job, JobQueue, JobQueueFull
+from services.admission import AdmissionController, AdmissionMiddleware
+from services.runtime_logging import MemorySampler, elapsed_ms, memory_snapshot, now_ms, rss_kb, text_preview
+from services.metrics import ANALYSES, CONTENT_TYPE, IN_FLIGHT, REGISTRY, observe_ms
+from services.logging_setup import (
+    add_request_fields,
+    begin_request,
+    configure_logging,
+    log_request_summary,
+    logging_stats,
+)
 
-# 配置日志
-logging.basicConfig(level=logging.INFO)
+# 配置日志：sync 在调用线程写出；queued 交给后台线程格式化和写出。逐步骤的详细日志按请求抽样
+configure_logging(
+    mode=read_choice_env("LOG_MODE", "sync", ("sync", "queued")),
+    detail_sample_rate=read_float_env("LOG_DETAIL_SAMPLE_RATE", 1.0),
+    queue_size=read_int_env("LOG_QUEUE_MAX", 10000),
+)
 logger = logging.getLogger(__name__)
 
 
-def _read_float_env(env_name: str, default: float) -> float:
-    raw_value = os.getenv(env_name, "").strip()
-    if not raw_value:
-        return default
-    try:
-        return float(raw_value)
-    except ValueError:
-        logger.warning("环境变量 %s=%r 不是有效浮点数，使用默认值 %s", env_name, raw_value, default)
-        return default
-
-
 def init_sentry() -> None:
     dsn = os.getenv("SENTRY_DSN", "").strip()
     if not dsn:
@@ -54,11 +70,15 @@ def init_sentry() -> None:
         logger.error("检测到 SENTRY_DSN，但 sentry-sdk 未安装")
         return
 
+    import sentry_sdk
+    from sentry_sdk.integrations.fastapi import FastApiIntegration
+    from sentry_sdk.integrations.logging import LoggingIntegration
+
     sentry_sdk.init(
         dsn=dsn,
         environment=os.getenv("SENTRY_ENVIRONMENT", os.getenv("ENVIRONMENT", "production")),
-        traces_sample_rate=_read_float_env("SENTRY_TRACES_SAMPLE_RATE", 0.1),
-        profiles_sample_rate=_read_float_env("SENTRY_PROFILES_SAMPLE_RATE", 0.0),
+        traces_sample_rate=read_float_env("SENTRY_TRACES_SAMPLE_RATE", 0.1),
+        profiles_sample_rate=read_float_env("SENTRY_PROFILES_SAMPLE_RATE", 0.0),
         integrations=[
             FastApiIntegration(),
             LoggingIntegration(level=logging.INFO, event_level=logging.ERROR),
@@ -91,10 +111,51 @@ class LoggingCORSMiddleware(CORSMiddleware):
 
 init_sentry()
 
+
+def _warm_up(started: float) -> None:
+    """后台预热：导入 openai 并创建 OpenRouter 客户端，首个请求不再付出这部分耗时；失败时后续请求会在 ensure_client 中重试"""
+    try:
+        initialized = vlm_service.ensure_client()
+    except Exception as e:
+        logger.warning("startup_warm_up_failed error_type=%s error=%s", type(e).__name__, e)
+        return
+    if not initialized:
+        logger.warning("startup_warm_up_failed error_type=client_init error=OpenRouter 客户端创建失败，首个请求将重试")
+        return
+    logger.info("startup_warm_up_done elapsed_ms=%s", round((time.perf_counter() - started) * 1000))
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    lifespan_start = time.perf_counter()
+    memory_sampler.start()
+    # 重量级依赖（openai 等）在后台线程中导入，不阻塞启动和健康检查
+    threading.Thread(target=_warm_up, args=(lifespan_start,), name="warm-up", daemon=True).start()
+    # OCR 进程池在后台预热，不阻塞启动和健康检查；就绪前的请求跳过 OCR
+    ocr_pool_start = asyncio.create_task(ocr_pool.start()) if ocr_pool is not None else None
+    job_queue.start()
+    logger.info(
+        "startup_ready import_ms=%s lifespan_ms=%s",
+        round((_APP_IMPORTED - _IMPORT_START) * 1000),
+        round((time.perf_counter() - lifespan_start) * 1000),
+    )
+    yield
+    await job_queue.close()
+    if ocr_pool is not None:
+        ocr_pool_start.cancel()
+        await ocr_pool.close()
+    # 关闭 OpenRouter 共享连接池
+    await vlm_service.aclose()
+    if description_cache is not None:
+        description_cache.close()
+    memory_sampler.stop()
+
+
 app = FastAPI(
     title="IngrediScan AI API",
     description="食品成分分析 API，集成 OCR 和 VLM 模型",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
 )
 
 def _load_cors_allowed_origins() -> list[str]:
@@ -139,6 +200,38 @@ if cors_allowed_origins and all(
 ):
     logger.warning("CORS_ALLOWED_ORIGINS 当前仅包含本地域名，线上前端请求会被拦截")
 
+# 准入控制：分析接口（含批量和任务提交）超出并发 / 排队 / 内存上限时直接返回 429 / 503 + Retry-After（在 CORS 之内，拒绝响应同样带 CORS 头）
+# 后台采样 RSS，日志中的 memory_snapshot() 读取缓存值；0 表示关闭，每行日志直接读取 /proc
+memory_sampler = MemorySampler(
+    interval_seconds=read_float_env("MEMORY_SAMPLER_INTERVAL_SECONDS", 0.5),
+    window_seconds=read_float_env("MEMORY_SAMPLER_WINDOW_SECONDS", 300),
+)
+admission_controller = AdmissionController(
+    max_in_flight=read_int_env("ADMISSION_MAX_IN_FLIGHT", 8),
+    max_queue=read_int_env("ADMISSION_MAX_QUEUE", 16),
+    queue_timeout_seconds=read_float_env("ADMISSION_QUEUE_TIMEOUT_SECONDS", 10),
+    rss_high_water_mb=read_int_env("ADMISSION_RSS_HIGH_WATER_MB", 0),
+)
+app.add_middleware(
+    AdmissionMiddleware,
+    controller=admission_controller,
+    paths=(
+        "/api/v1/analyze",
+        "/api/v1/analyze/upload",
+        "/api/v1/analyze/stream",
+        # 批量请求在整个 NDJSON 响应期间占用一个名额；任务提交只在读取和校验图片期间占用，排队的图片由 JOB_QUEUE_MAX_BYTES 限制
+        "/api/v1/analyze/batch",
+        "/api/v1/jobs",
+    ),
+)
+logger.info(
+    "admission_control max_in_flight=%s max_queue=%s queue_timeout_seconds=%s rss_high_water_mb=%s",
+    admission_controller.max_in_flight,
+    admission_controller.max_queue,
+    admission_controller.queue_timeout_seconds,
+    admission_controller.rss_high_water_mb,
+)
+
 # CORS 配置（前端直连后端）
 app.add_middleware(
     LoggingCORSMiddleware,
@@ -147,30 +240,85 @@ app.add_middleware(
     allow_credentials=False,
     allow_methods=["*"],
     allow_headers=["*"],
-    expose_headers=["X-Request-ID"],
+    expose_headers=["X-Request-ID", "X-Cache", "Retry-After"],
 )
 
 # 初始化服务
-vlm_service = VLMService()
-_ocr_service: OCRService | None = None
-_ocr_service_lock = threading.Lock()
-
-
-def get_ocr_service() -> OCRService:
-    """延迟初始化 OCR，降低服务启动耗时和冷启动内存压力。"""
-    global _ocr_service
-    if _ocr_service is None:
-        with _ocr_service_lock:
-            if _ocr_service is None:
-                start_ms = now_ms()
-                logger.info("ocr_lazy_init_start %s", memory_snapshot())
-                _ocr_service = OCRService()
-                logger.info(
-                    "ocr_lazy_init_done elapsed_ms=%s %s",
-                    elapsed_ms(start_ms),
-                    memory_snapshot(),
-                )
-    return _ocr_service
+# 成分说明：cache 让模型只返回成分名，说明来自持久化缓存（未收录的成分单独生成）；inline 由模型为每个成分写说明
+INGREDIENT_DESCRIPTION_MODE = read_choice_env("INGREDIENT_DESCRIPTION_MODE", "cache", ("cache", "inline"))
+description_cache = (
+    IngredientDescriptionCache(
+        path=os.getenv("INGREDIENT_DESCRIPTION_CACHE_PATH", "").strip() or DEFAULT_CACHE_PATH,
+        max_entries=read_int_env("INGREDIENT_DESCRIPTION_CACHE_MAX_ENTRIES", 50000),
+    )
+    if INGREDIENT_DESCRIPTION_MODE == "cache"
+    else None
+)
+vlm_service = VLMService(description_cache=description_cache)
+result_cache = ResultCache(
+    max_entries=read_int_env("RESULT_CACHE_MAX_ENTRIES", 256),
+    max_bytes=read_int_env("RESULT_CACHE_MAX_BYTES", 8 * 1024 * 1024),
+    ttl_seconds=read_float_env("RESULT_CACHE_TTL_SECONDS", 24 * 3600),
+)
+# 默认关闭：64 位 dHash 上不同标签的距离与同一标签再次拍摄的距离重叠（见 bench_near_duplicate_index.py），
+# 误匹配会把另一件商品的分析结果返回给用户；只在用真实照片校准过阈值后开启
+near_duplicate_index = NearDuplicateIndex(
+    max_entries=read_int_env("NEAR_DUPLICATE_MAX_ENTRIES", 0),
+    max_distance=read_int_env("NEAR_DUPLICATE_MAX_DISTANCE", 2),
+)
+analyze_flight = SingleFlight()
+DISCONNECT_POLL_SECONDS = read_float_env("DISCONNECT_POLL_SECONDS", 0.5)
+UPLOAD_MAX_BYTES = read_int_env("UPLOAD_MAX_BYTES", 10 * 1024 * 1024)
+# JSON 请求体：Base64 编码后的单张图片（约 4/3 倍）加上其他字段
+JSON_IMAGE_MAX_BYTES = UPLOAD_MAX_BYTES * 4 // 3 + 64 * 1024
+# 批量接口：单批最多图片数；所有批量请求共享的 OCR + VLM 并发上限（缓存命中不占用）
+BATCH_MAX_ITEMS = read_int_env("BATCH_MAX_ITEMS", 50)
+# 整个批量请求体的字节上限：JSON 请求体读入后还有 pydantic 解析出的字符串副本，峰值约为两倍，需远低于实例内存（免费实例 512 MB）
+BATCH_MAX_BYTES = read_int_env("BATCH_MAX_BYTES", 64 * 1024 * 1024)
+BATCH_CONCURRENCY = max(1, read_int_env("BATCH_CONCURRENCY", 4))
+batch_semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+# 分析引擎：vlm 调用 OpenRouter；rules 只用 OCR + 内置知识库；auto 优先 VLM，OpenRouter 不可用时回退到规则引擎
+ANALYZE_ENGINE = read_choice_env("ANALYZE_ENGINE", "vlm", ("vlm", "rules", "auto"))
+# 添加剂知识库在启动时编译为 Aho-Corasick 自动机，规则引擎与 VLM 的 risks 预填共用
+additive_kb = AdditiveKnowledgeBase.load()
+rule_engine = RuleEngine(additive_kb)
+logger.info(
+    "additive_index_loaded version=%s entries=%s patterns=%s nodes=%s",
+    additive_kb.version,
+    len(additive_kb.entries),
+    len(additive_kb.automaton),
+    additive_kb.automaton.node_count,
+)
+if description_cache is not None:
+    # 知识库条目的说明作为初始内容，常见添加剂无需模型生成
+    seeded = description_cache.seed(
+        ((name, entry.desc) for entry in additive_kb.entries for name in (entry.code, *entry.names) if name),
+        source=f"kb@{additive_kb.version}",
+    )
+    logger.info("description_cache_ready path=%s seeded=%s %s", description_cache.path, seeded, description_cache.stats())
+
+# 流水线：sequential 先 OCR 再 VLM（OCR 文字进入提示词）；parallel 两者同时执行，OCR 用于事后校验
+ANALYZE_PIPELINE_MODE = read_choice_env("ANALYZE_PIPELINE_MODE", "sequential", ("sequential", "parallel"))
+OCR_VALIDATION_GRACE_SECONDS = read_float_env("OCR_VALIDATION_GRACE_SECONDS", 0.5)
+
+# OCR：off 跳过（Render 免费实例默认），pool 在预热的子进程池中执行 RapidOCR
+OCR_MODE = read_choice_env("OCR_MODE", "off", ("off", "pool"))
+ocr_pool = (
+    OCRProcessPool(
+        workers=read_int_env("OCR_POOL_WORKERS", min(2, os.cpu_count() or 1)),
+        max_queue=read_int_env("OCR_POOL_MAX_QUEUE", 8),
+        timeout_seconds=read_float_env("OCR_TIMEOUT_SECONDS", 15),
+        max_jobs_per_worker=read_int_env("OCR_WORKER_MAX_JOBS", 200),
+        max_worker_rss_mb=read_int_env("OCR_WORKER_MAX_RSS_MB", 700),
+    )
+    if OCR_MODE == "pool"
+    else None
+)
+if ANALYZE_ENGINE != "vlm" and ocr_pool is None:
+    logger.warning("ANALYZE_ENGINE=%s 依赖 OCR，但 OCR_MODE=off，规则引擎将无法分析", ANALYZE_ENGINE)
+
+
 
 
 class AnalyzeRequest(BaseModel):
@@ -178,6 +326,16 @@ class AnalyzeRequest(BaseModel):
     image_type: str = "image/jpeg"
 
 
+class AnalyzeBatchItem(BaseModel):
+    id: Optional[str] = None  # 调用方自定义标识（如 SKU），原样返回
+    image_base64: str
+    image_type: str = "image/jpeg"
+
+
+class AnalyzeBatchRequest(BaseModel):
+    images: list[AnalyzeBatchItem]
+
+
 class RiskItem(BaseModel):
     level: str  # "High", "Moderate", "Low"
     name: str
@@ -198,17 +356,12 @@ class AnalyzeResponse(BaseModel):
     alternatives: list[str]
     confidence: Optional[float] = None
     error: Optional[str] = None  # 错误信息（如果分析失败）
-    error_type: Optional[str] = None  # 错误类型：invalid_image, api_error, parse_error 等
+    error_type: Optional[str] = None  # 错误类型：invalid_image, too_large, api_error, parse_error 等
 
 
-def decode_base64_image(image_base64: str, request_id: str = "-") -> Image.Image:
-    """将 Base64 字符串解码为 PIL Image"""
+def open_image_bytes(image_data: bytes, request_id: str = "-") -> Image.Image:
+    """将原始图片字节打开为 PIL Image（仅解析文件头，像素延迟解码）"""
     try:
-        # 移除 data URL 前缀（如果存在）
-        if "," in image_base64:
-            image_base64 = image_base64.split(",")[1]
-        
-        image_data = base64.b64decode(image_base64)
         image = Image.open(io.BytesIO(image_data))
         logger.info(
             "analyze_image_decoded request_id=%s image_bytes=%s size=%s mode=%s format=%s %s",
@@ -220,6 +373,25 @@ def decode_base64_image(image_base64: str, request_id: str = "-") -> Image.Image
             memory_snapshot(),
         )
         return image
+    except Exception as e:
+        logger.error(
+            "analyze_image_decode_failed request_id=%s error=%s image_bytes=%s %s",
+            request_id,
+            e,
+            len(image_data),
+            memory_snapshot(),
+        )
+        raise HTTPException(status_code=400, detail=f"无效的图片数据: {str(e)}")
+
+
+def decode_base64_image(image_base64: str, request_id: str = "-") -> tuple[Image.Image, bytes]:
+    """将 Base64 字符串解码为 PIL Image，同时返回原始图片字节（用于内容寻址缓存）"""
+    try:
+        # 移除 data URL 前缀（如果存在）
+        if "," in image_base64:
+            image_base64 = image_base64.split(",")[1]
+        
+        image_data = base64.b64decode(image_base64)
     except Exception as e:
         logger.error(
             "analyze_image_decode_failed request_id=%s error=%s payload_base64_len=%s %s",
@@ -229,6 +401,387 @@ def decode_base64_image(image_base64: str, request_id: str = "-") -> Image.Image
             memory_snapshot(),
         )
         raise HTTPException(status_code=400, detail=f"无效的图片数据: {str(e)}")
+    return open_image_bytes(image_data, request_id=request_id), image_data
+
+
+async def read_body(request: Request, max_bytes: int, detail: str) -> bytes:
+    """按块读取请求体，累计超过 max_bytes 立即 413；不依赖 Content-Length，分块传输的请求同样受限"""
+    chunks: list[bytes] = []
+    received = 0
+    async for chunk in request.stream():
+        received += len(chunk)
+        if received > max_bytes:
+            raise HTTPException(status_code=413, detail=detail)
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+
+def limit_request_body(request: Request, max_bytes: int, detail: str) -> Request:
+    """返回同一请求的包装：经它读取（如 multipart 解析）的请求体累计超过 max_bytes 时 413"""
+    received = 0
+
+    async def receive():
+        nonlocal received
+        message = await request.receive()
+        if message["type"] == "http.request":
+            received += len(message.get("body", b""))
+            if received > max_bytes:
+                raise HTTPException(status_code=413, detail=detail)
+        return message
+
+    return Request(request.scope, receive)
+
+
+async def read_upload_image(request: Request) -> tuple[bytes, str]:
+    """
+    读取二进制上传的图片字节
+
+    - multipart/form-data：读取 file 字段
+    - 其他类型（application/octet-stream、image/*）：把请求体按块读入，超过上限立即 413
+    """
+    content_length = request.headers.get("content-length", "")
+    if content_length.isdigit() and int(content_length) > UPLOAD_MAX_BYTES:
+        raise HTTPException(status_code=413, detail=f"图片过大，最大 {UPLOAD_MAX_BYTES} 字节")
+
+    content_type = request.headers.get("content-type", "")
+    if content_type.startswith("multipart/form-data"):
+        form = await request.form(max_files=1, max_fields=4)
+        try:
+            upload = form.get("file")
+            if not isinstance(upload, UploadFile):
+                raise HTTPException(status_code=400, detail="multipart 请求缺少 file 字段")
+            if upload.size is not None and upload.size > UPLOAD_MAX_BYTES:
+                raise HTTPException(status_code=413, detail=f"图片过大，最大 {UPLOAD_MAX_BYTES} 字节")
+            image_data = await upload.read()
+            image_type = upload.content_type or "image/jpeg"
+        finally:
+            await form.close()
+    else:
+        image_data = await read_body(request, UPLOAD_MAX_BYTES, f"图片过大，最大 {UPLOAD_MAX_BYTES} 字节")
+        image_type = content_type.split(";", 1)[0].strip() or "application/octet-stream"
+
+    if not image_data:
+        raise HTTPException(status_code=400, detail="无效的图片数据: 请求体为空")
+    return image_data, image_type
+
+
+def compute_image_fingerprint(image_data: bytes, request_id: str = "-") -> Optional[int]:
+    """计算近似重复查找用的感知哈希；失败时返回 None，不影响主流程"""
+    if not near_duplicate_index.enabled:
+        return None
+    start_ms = now_ms()
+    try:
+        fingerprint = dhash_fingerprint(image_data)
+    except Exception as e:
+        logger.warning("analyze_fingerprint_failed request_id=%s error=%s", request_id, e)
+        return None
+    if fingerprint == 0:
+        # 纯色/无结构图片的 dHash 全为 0，彼此都会"相似"，不参与近似匹配
+        return None
+    logger.info(
+        "analyze_fingerprint_done request_id=%s elapsed_ms=%s fingerprint=%016x",
+        request_id,
+        elapsed_ms(start_ms),
+        fingerprint,
+    )
+    return fingerprint
+
+
+def find_near_duplicate_result(fingerprint: int, request_id: str = "-"):
+    """在感知哈希索引中查找汉明距离阈值内、且结果仍在缓存中的历史分析"""
+    for distance, candidate_key in near_duplicate_index.search(fingerprint):
+        cached_result = result_cache.get(candidate_key, record_stats=False)
+        if cached_result is not None:
+            logger.info(
+                "analyze_near_duplicate_hit request_id=%s distance=%s index_size=%s",
+                request_id,
+                distance,
+                len(near_duplicate_index),
+            )
+            return cached_result
+    return None
+
+
+def analysis_model_name() -> str:
+    """缓存键中的「模型」部分：规则引擎模式按知识库版本区分"""
+    if ANALYZE_ENGINE == "rules":
+        return f"rules@{additive_kb.version}"
+    return vlm_service.route_name
+
+
+def lookup_cached_result(image_data: bytes, request_id: str) -> tuple[str, str, Optional[object], Optional[int]]:
+    """
+    查找精确 / 近似重复缓存
+
+    Returns:
+        (cache_key, cache_status HIT/NEAR_HIT/MISS, 缓存结果或 None, 感知指纹或 None)
+    """
+    # VLM 结果中的 risks 由知识库预填，知识库版本变化时旧结果同样失效
+    cache_key = build_cache_key(image_digest(image_data), analysis_model_name(), f"{PROMPT_VERSION}+kb{additive_kb.version}")
+    cache_status = "HIT"
+    cached_result = result_cache.get(cache_key, record_stats=False)
+    fingerprint = None
+    if cached_result is None:
+        # 字节不同但画面几乎相同（同一商品的再次拍摄）时复用已有结果
+        fingerprint = compute_image_fingerprint(image_data, request_id=request_id)
+        if fingerprint is not None:
+            cached_result = find_near_duplicate_result(fingerprint, request_id=request_id)
+            if cached_result is not None:
+                cache_status = "NEAR_HIT"
+                result_cache.put(
+                    cache_key,
+                    cached_result,
+                    size_bytes=len(cached_result.model_dump_json()),
+                )
+    if cached_result is None:
+        cache_status = "MISS"
+        result_cache.record_miss()
+    else:
+        result_cache.record_hit()
+    return cache_key, cache_status, cached_result, fingerprint
+
+
+def store_result(cache_key: str, fingerprint: Optional[int], analysis_result) -> None:
+    """只缓存成功结果，api_error / parse_error 等错误响应不缓存"""
+    if analysis_result.error is not None:
+        return
+    result_cache.put(
+        cache_key,
+        analysis_result,
+        size_bytes=len(analysis_result.model_dump_json()),
+    )
+    if fingerprint is not None:
+        near_duplicate_index.add(fingerprint, cache_key)
+
+
+async def analyze_and_cache(
+    image: Image.Image,
+    image_data: bytes,
+    request_id: str,
+    cache_key: str,
+    fingerprint: Optional[int],
+):
+    """
+    OCR + VLM / 规则引擎分析并缓存成功结果；作为 single-flight 的共享任务执行一次
+
+    - sequential：先 OCR，OCR 文字和添加剂索引命中的 risks 作为提示词的一部分发给 VLM，两段耗时相加；
+      返回后知识库 risks 合并进结果，模型只需补充索引遗漏的风险成分
+    - parallel：OCR 与 VLM 同时开始，VLM 返回后用 OCR 文字事后校验成分列表，
+      并合并添加剂索引命中的 risks；OCR 晚于 VLM 超过 OCR_VALIDATION_GRACE_SECONDS 时放弃校验，不拉长尾延迟
+    - ANALYZE_ENGINE=rules 时只做 OCR + 规则引擎；auto 在 VLM 返回 api_error 时回退到规则引擎
+    """
+    timings: dict[str, int] = {}
+    cacheable = True
+    if ANALYZE_ENGINE == "rules":
+        ocr_text = await timed_ocr_text(image_data, request_id, timings)
+        analysis_result = run_rule_engine(ocr_text, request_id, timings)
+    elif ANALYZE_PIPELINE_MODE == "parallel":
+        ocr_task = asyncio.ensure_future(timed_ocr_text(image_data, request_id, timings))
+        try:
+            step_ms = now_ms()
+            analysis_result = await vlm_service.analyze_ingredients(
+                image=image,
+                ocr_text="",
+                request_id=request_id,
+                image_bytes=image_data,
+            )
+            timings["vlm_ms"] = elapsed_ms(step_ms)
+            if should_fallback_to_rules(analysis_result):
+                analysis_result = fallback_to_rules(analysis_result, await ocr_task, request_id, timings)
+                cacheable = False
+            else:
+                analysis_result = await apply_ocr_validation(analysis_result, ocr_task, request_id, timings)
+        finally:
+            ocr_task.cancel()
+    else:
+        ocr_text = await timed_ocr_text(image_data, request_id, timings)
+        known_risks = index_known_risks(ocr_text, request_id, timings)
+        step_ms = now_ms()
+        analysis_result = await vlm_service.analyze_ingredients(
+            image=image,
+            ocr_text=ocr_text,
+            request_id=request_id,
+            image_bytes=image_data,
+            known_risks=additive_kb.authoritative(known_risks),
+        )
+        timings["vlm_ms"] = elapsed_ms(step_ms)
+        if should_fallback_to_rules(analysis_result):
+            analysis_result = fallback_to_rules(analysis_result, ocr_text, request_id, timings)
+            cacheable = False
+        else:
+            analysis_result = additive_kb.merge_risks(analysis_result, known_risks)
+    log_stage_timings(request_id, timings)
+    # 回退结果不写入缓存，OpenRouter 恢复后同一图片仍走 VLM
+    if cacheable:
+        store_result(cache_key, fingerprint, analysis_result)
+    return analysis_result
+
+
+async def wait_unless_disconnected(request: Request, task: asyncio.Future) -> bool:
+    """
+    等待任务完成，同时监测客户端是否断开
+
+    客户端断开时取消本请求对任务的等待并返回 False；
+    共享的 VLM 调用只有在没有其他等待者时才会被 single-flight 取消。
+    """
+    while True:
+        done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_SECONDS)
+        if done:
+            return True
+        if await request.is_disconnected():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+            return False
+
+
+async def extract_ocr_text(image_data: bytes, request_id: str) -> str:
+    """
+    通过 OCR 进程池提取文字
+
+    OCR 只是 VLM 的辅助输入：未开启、未就绪、排队已满或超时都降级为空文本，不影响分析。
+    """
+    step_ms = now_ms()
+    if ocr_pool is None or not ocr_pool.ready:
+        logger.info(
+            "analyze_ocr_skipped request_id=%s reason=%s",
+            request_id,
+            "disabled" if ocr_pool is None else "pool_not_ready",
+        )
+        return ""
+    try:
+        ocr_text = await ocr_pool.extract_text(image_data, request_id=request_id)
+    except OCRPoolError as e:
+        logger.warning(
+            "analyze_ocr_skipped request_id=%s reason=%s elapsed_ms=%s error=%s pool_stats=%s",
+            request_id,
+            e.reason,
+            elapsed_ms(step_ms),
+            e,
+            ocr_pool.stats(),
+        )
+        return ""
+    logger.info(
+        "analyze_ocr_done request_id=%s elapsed_ms=%s text_len=%s pool_stats=%s %s",
+        request_id,
+        elapsed_ms(step_ms),
+        len(ocr_text),
+        ocr_pool.stats(),
+        memory_snapshot(),
+    )
+    return ocr_text
+
+
+async def timed_ocr_text(image_data: bytes, request_id: str, timings: dict[str, int]) -> str:
+    step_ms = now_ms()
+    ocr_text = await extract_ocr_text(image_data, request_id)
+    timings["ocr_ms"] = elapsed_ms(step_ms)
+    return ocr_text
+
+
+async def apply_ocr_validation(
+    analysis_result,
+    ocr_task: asyncio.Future,
+    request_id: str,
+    timings: dict[str, int],
+):
+    """并行模式下 VLM 返回后，用 OCR 文字校验并补全成分列表，合并添加剂索引命中的 risks"""
+    step_ms = now_ms()
+    if not ocr_task.done():
+        await asyncio.wait({ocr_task}, timeout=OCR_VALIDATION_GRACE_SECONDS)
+    timings["ocr_wait_ms"] = elapsed_ms(step_ms)
+    if not ocr_task.done():
+        logger.info(
+            "analyze_ocr_validation_skipped request_id=%s reason=ocr_late grace_seconds=%s",
+            request_id,
+            OCR_VALIDATION_GRACE_SECONDS,
+        )
+        return analysis_result
+
+    step_ms = now_ms()
+    corrected, report = validate_with_ocr(analysis_result, ocr_task.result())
+    timings["validate_ms"] = elapsed_ms(step_ms)
+    corrected = additive_kb.merge_risks(corrected, index_known_risks(ocr_task.result(), request_id, timings))
+    if report.ocr_ingredients or report.added:
+        logger.info(
+            "analyze_ocr_validation request_id=%s ocr_ingredients=%s coverage=%s added=%s missing_e_numbers=%s",
+            request_id,
+            report.ocr_ingredients,
+            report.coverage if report.coverage is not None else "-",
+            report.added,
+            report.missing_e_numbers,
+        )
+    return corrected
+
+
+def index_known_risks(ocr_text: str, request_id: str, timings: dict[str, int]):
+    """用添加剂索引扫描 OCR 文字，得到预填的权威 risks"""
+    step_ms = now_ms()
+    known_risks = additive_kb.known_risks(ocr_text)
+    timings["index_ms"] = elapsed_ms(step_ms)
+    if known_risks:
+        logger.info(
+            "analyze_additive_index request_id=%s matched=%s names=%s",
+            request_id,
+            len(known_risks),
+            text_preview(", ".join(risk.name for risk in known_risks)),
+        )
+    return known_risks
+
+
+def run_rule_engine(ocr_text: str, request_id: str, timings: dict[str, int]):
+    step_ms = now_ms()
+    analysis_result = rule_engine.analyze(ocr_text, request_id=request_id)
+    timings["rules_ms"] = elapsed_ms(step_ms)
+    return analysis_result
+
+
+def should_fallback_to_rules(analysis_result) -> bool:
+    """auto 模式下 OpenRouter 不可用（连接失败、限流、配额耗尽等 api_error）时回退到规则引擎"""
+    return ANALYZE_ENGINE == "auto" and analysis_result.error_type == "api_error"
+
+
+def fallback_to_rules(vlm_result, ocr_text: str, request_id: str, timings: dict[str, int]):
+    """用规则引擎替代失败的 VLM 结果；规则引擎也无法分析时保留原始 api_error"""
+    analysis_result = run_rule_engine(ocr_text, request_id, timings)
+    logger.warning(
+        "analyze_engine_fallback request_id=%s from=vlm to=rules vlm_error=%s rules_error_type=%s",
+        request_id,
+        text_preview(vlm_result.error or ""),
+        analysis_result.error_type or "-",
+    )
+    if analysis_result.error is not None:
+        return vlm_result
+    return analysis_result
+
+
+def log_stage_timings(request_id: str, timings: dict[str, int]) -> None:
+    for name, value in timings.items():
+        observe_ms(name.removesuffix("_ms"), value)
+    add_request_fields(**timings)
+    logger.info(
+        "analyze_stage_timings request_id=%s engine=%s pipeline=%s %s",
+        request_id,
+        ANALYZE_ENGINE,
+        ANALYZE_PIPELINE_MODE,
+        " ".join(f"{name}={value}" for name, value in timings.items()),
+    )
+
+
+def record_analysis(endpoint: str, cache_status: str, analysis_result, total_ms: int, **fields) -> None:
+    """每次分析结束时记录一次：按接口 / 缓存状态 / error_type 计数，记录端到端耗时，并输出 request_summary"""
+    ANALYSES.inc(endpoint, cache_status, analysis_result.error_type or "none")
+    observe_ms("total", total_ms)
+    log_request_summary(
+        logger,
+        cache=cache_status,
+        error_type=analysis_result.error_type,
+        health_score=analysis_result.health_score,
+        total_ms=total_ms,
+        **fields,
+    )
 
 
 @app.get("/")
@@ -241,37 +794,95 @@ async def health_check():
     return {"status": "healthy"}
 
 
-@app.post("/api/v1/analyze", response_model=AnalyzeResponse)
-async def analyze_product(request: Request, response: Response, payload: AnalyzeRequest):
+# 抓取时读取的仪表：队列深度、缓存条目、熔断器状态等已有状态，不在热路径上额外记录
+_CIRCUIT_STATE_VALUES = {"closed": 0, "half_open": 1, "open": 2}
+REGISTRY.gauge("ingrediscan_admission_in_flight", "Requests admitted by admission control", callback=lambda: admission_controller.in_flight)
+REGISTRY.gauge("ingrediscan_admission_waiting", "Requests waiting in the admission queue", callback=lambda: admission_controller.waiting)
+REGISTRY.gauge("ingrediscan_job_queue_depth", "Jobs waiting for a worker", callback=lambda: job_queue.depth)
+REGISTRY.gauge("ingrediscan_result_cache_entries", "Entries in the result cache", callback=lambda: result_cache.stats()["entries"])
+REGISTRY.gauge(
+    "ingrediscan_circuit_state",
+    "OpenRouter circuit breaker state per model (0 closed, 1 half_open, 2 open)",
+    ("model",),
+    callback=lambda: {(model,): _CIRCUIT_STATE_VALUES[breaker.state] for model, breaker in vlm_service.breakers.items()},
+)
+REGISTRY.gauge(
+    "ingrediscan_openrouter_retries",
+    "Retries performed by the OpenRouter retry policy since start",
+    callback=lambda: vlm_service.retry_policy.retries,
+)
+REGISTRY.gauge(
+    "ingrediscan_log_records_dropped",
+    "Log records dropped because the LOG_MODE=queued queue was full",
+    callback=lambda: logging_stats()["dropped"],
+)
+REGISTRY.gauge("ingrediscan_process_resident_memory_bytes", "Resident memory of the API process", callback=lambda: rss_kb() * 1024)
+REGISTRY.gauge(
+    "ingrediscan_process_resident_memory_peak_bytes",
+    "Peak sampled resident memory of the API process since start",
+    callback=lambda: memory_sampler.peak_kb * 1024 if memory_sampler.active else None,
+)
+
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus 文本格式指标"""
+    return Response(content=REGISTRY.render(), media_type=CONTENT_TYPE)
+
+
+def error_response(message: str, error_type: str) -> AnalyzeResponse:
+    return AnalyzeResponse(
+        health_score="",
+        summary="",
+        risks=[],
+        full_ingredients=[],
+        alternatives=[],
+        error=message,
+        error_type=error_type,
+    )
+
+
+def http_error_type(e: HTTPException) -> str:
+    """读取 / 解码图片时 HTTPException 对应的 error_type：超出大小上限（413）单独计数，不与损坏图片混在一起"""
+    return "too_large" if e.status_code == 413 else "invalid_image"
+
+
+def error_response_for_exception(e: Exception) -> AnalyzeResponse:
+    """根据未处理异常的内容返回对应的错误类型和提示"""
+    error_message = str(e)
+    if "图片" in error_message or "image" in error_message.lower() or "decode" in error_message.lower():
+        return error_response("图片格式错误或无法解析，请上传清晰的商品标签图片", "invalid_image")
+    if "OCR" in error_message or "ocr" in error_message.lower():
+        return error_response("图片文字识别失败，请上传更清晰的商品标签图片", "parse_error")
+    if "网络" in error_message or "network" in error_message.lower() or "连接" in error_message:
+        return error_response("网络连接问题，请检查网络后重试", "api_error")
+    return error_response(f"服务器处理出错：{error_message}", "server_error")
+
+
+async def run_analysis(
+    request: Request,
+    response: Response,
+    request_id: str,
+    total_start_ms: int,
+    load_image: Callable[[], Awaitable[tuple[Image.Image, bytes]]],
+):
     """
-    分析产品图片的主接口
+    分析流水线（JSON 与二进制上传接口共用）
     
     流程：
-    1. 解码 Base64 图片
-    2. OCR 提取文字
-    3. VLM 分析成分和健康风险
+    1. 读取并解码图片
+    2. 结果缓存 / 近似重复查找
+    3. OCR 提取文字 + VLM 分析成分和健康风险（顺序或并行，见 ANALYZE_PIPELINE_MODE）
     4. 返回结构化结果
     """
-    request_id = request.headers.get("x-request-id") or uuid.uuid4().hex[:12]
-    response.headers["X-Request-ID"] = request_id
-    total_start_ms = now_ms()
-    origin = request.headers.get("origin", "-")
-    user_agent = text_preview(request.headers.get("user-agent", "-"), 180)
-
+    IN_FLIGHT.inc("analysis")
+    memory_watch = memory_sampler.watch()
+    cache_status = "-"
     try:
-        logger.info(
-            "analyze_start request_id=%s origin=%s image_type=%s payload_base64_len=%s user_agent=%s %s",
-            request_id,
-            origin,
-            payload.image_type,
-            len(payload.image_base64 or ""),
-            user_agent,
-            memory_snapshot(),
-        )
-        
         # Step 1: 解码图片
         step_ms = now_ms()
-        image = decode_base64_image(payload.image_base64, request_id=request_id)
+        image, image_data = await load_image()
+        observe_ms("decode", elapsed_ms(step_ms))
         logger.info(
             "analyze_decode_done request_id=%s elapsed_ms=%s size=%s %s",
             request_id,
@@ -279,46 +890,89 @@ async def analyze_product(request: Request, response: Response, payload: Analyze
             image.size,
             memory_snapshot(),
         )
+
+        # 相同图片 + 模型 + 提示词版本直接复用缓存结果
+        cache_key, cache_status, cached_result, fingerprint = lookup_cached_result(image_data, request_id)
+        response.headers["X-Cache"] = cache_status
+        if cached_result is not None:
+            logger.info(
+                "analyze_cache_hit request_id=%s cache_status=%s total_elapsed_ms=%s result_score=%s cache_stats=%s %s",
+                request_id,
+                cache_status,
+                elapsed_ms(total_start_ms),
+                cached_result.health_score,
+                result_cache.stats(),
+                memory_snapshot(),
+            )
+            record_analysis(
+                "sync",
+                cache_status,
+                cached_result,
+                elapsed_ms(total_start_ms),
+                peak_rss_delta_kb=memory_sampler.peak_delta_kb(memory_watch),
+            )
+            return cached_result
         
-        # Step 2: 跳过 OCR，Render 免费实例上 RapidOCR 耗时和内存压力过高。
-        step_ms = now_ms()
-        ocr_text = ""
-        logger.info(
-            "analyze_ocr_skipped request_id=%s elapsed_ms=%s reason=disabled_for_render_free_tier %s",
-            request_id,
-            elapsed_ms(step_ms),
-            memory_snapshot(),
-        )
-        
-        # Step 3: VLM 分析
+        # Step 2: OCR + VLM 分析（相同图片的并发请求合并为一次调用，编排方式见 analyze_and_cache）
         step_ms = now_ms()
         logger.info("analyze_vlm_start request_id=%s %s", request_id, memory_snapshot())
-        analysis_result = await vlm_service.analyze_ingredients(
-            image=image,
-            ocr_text=ocr_text,
-            request_id=request_id,
+        analyze_call = asyncio.ensure_future(
+            analyze_flight.run(
+                cache_key,
+                lambda: analyze_and_cache(
+                    image=image,
+                    image_data=image_data,
+                    request_id=request_id,
+                    cache_key=cache_key,
+                    fingerprint=fingerprint,
+                ),
+                request_id=request_id,
+            )
         )
+        if not await wait_unless_disconnected(request, analyze_call):
+            logger.warning(
+                "analyze_client_disconnected request_id=%s total_elapsed_ms=%s %s",
+                request_id,
+                elapsed_ms(total_start_ms),
+                memory_snapshot(),
+            )
+            ANALYSES.inc("sync", cache_status, "client_disconnected")
+            log_request_summary(logger, cache=cache_status, error_type="client_disconnected", total_ms=elapsed_ms(total_start_ms))
+            return Response(status_code=499)
+        analysis_result, leader_request_id = analyze_call.result()
+        if leader_request_id is not None:
+            cache_status = "COALESCED"
+            response.headers["X-Cache"] = cache_status
         logger.info(
-            "analyze_vlm_done request_id=%s elapsed_ms=%s error_type=%s has_error=%s %s",
+            "analyze_vlm_done request_id=%s elapsed_ms=%s error_type=%s has_error=%s coalesced_with=%s %s",
             request_id,
             elapsed_ms(step_ms),
             analysis_result.error_type,
             bool(analysis_result.error),
+            leader_request_id or "-",
             memory_snapshot(),
         )
         
-        # Step 4: 返回结果
+        # Step 3: 返回结果
         logger.info(
-            "analyze_done request_id=%s total_elapsed_ms=%s result_error_type=%s result_score=%s %s",
+            "analyze_done request_id=%s total_elapsed_ms=%s result_error_type=%s result_score=%s peak_rss_delta_kb=%s %s",
             request_id,
             elapsed_ms(total_start_ms),
             analysis_result.error_type,
             analysis_result.health_score,
+            memory_sampler.peak_delta_kb(memory_watch),
             memory_snapshot(),
         )
+        record_analysis(
+            "sync",
+            cache_status,
+            analysis_result,
+            elapsed_ms(total_start_ms),
+            peak_rss_delta_kb=memory_sampler.peak_delta_kb(memory_watch),
+        )
         return analysis_result
         
-    except HTTPException:
+    except HTTPException as e:
         logger.warning(
             "analyze_http_exception request_id=%s total_elapsed_ms=%s %s",
             request_id,
@@ -326,6 +980,8 @@ async def analyze_product(request: Request, response: Response, payload: Analyze
             memory_snapshot(),
             exc_info=True,
         )
+        ANALYSES.inc("sync", cache_status, http_error_type(e))
+        log_request_summary(logger, cache=cache_status, error_type=http_error_type(e), total_ms=elapsed_ms(total_start_ms))
         raise
     except Exception as e:
         logger.error(
@@ -337,40 +993,637 @@ async def analyze_product(request: Request, response: Response, payload: Analyze
             exc_info=True,
         )
         
-        # 根据错误类型返回不同的错误信息
-        error_message = str(e)
-        if "图片" in error_message or "image" in error_message.lower() or "decode" in error_message.lower():
-            error_type = "invalid_image"
-            user_message = "图片格式错误或无法解析，请上传清晰的商品标签图片"
-        elif "OCR" in error_message or "ocr" in error_message.lower():
-            error_type = "parse_error"
-            user_message = "图片文字识别失败，请上传更清晰的商品标签图片"
-        elif "网络" in error_message or "network" in error_message.lower() or "连接" in error_message:
-            error_type = "api_error"
-            user_message = "网络连接问题，请检查网络后重试"
-        else:
-            error_type = "server_error"
-            user_message = f"服务器处理出错：{error_message}"
-        
         # 返回错误信息而不是抛出异常，让前端可以显示错误
-        result = AnalyzeResponse(
-            health_score="",
-            summary="",
-            risks=[],
-            full_ingredients=[],
-            alternatives=[],
-            error=user_message,
-            error_type=error_type
-        )
+        result = error_response_for_exception(e)
         logger.info(
-            "analyze_done request_id=%s total_elapsed_ms=%s result_error_type=%s result_score=%s %s",
+            "analyze_done request_id=%s total_elapsed_ms=%s result_error_type=%s result_score=%s peak_rss_delta_kb=%s %s",
             request_id,
             elapsed_ms(total_start_ms),
             result.error_type,
             result.health_score,
+            memory_sampler.peak_delta_kb(memory_watch),
             memory_snapshot(),
         )
+        record_analysis(
+            "sync",
+            cache_status,
+            result,
+            elapsed_ms(total_start_ms),
+            peak_rss_delta_kb=memory_sampler.peak_delta_kb(memory_watch),
+        )
         return result
+    finally:
+        IN_FLIGHT.dec("analysis")
+        memory_sampler.unwatch(memory_watch)
+
+
+
+@app.post("/api/v1/analyze", response_model=AnalyzeResponse)
+async def analyze_product(request: Request, response: Response, payload: AnalyzeRequest):
+    """分析产品图片的主接口（JSON + Base64）"""
+    request_id = request.headers.get("x-request-id") or uuid.uuid4().hex[:12]
+    begin_request(request_id, "sync")
+    response.headers["X-Request-ID"] = request_id
+    total_start_ms = now_ms()
+    logger.info(
+        "analyze_start request_id=%s origin=%s image_type=%s payload_base64_len=%s user_agent=%s %s",
+        request_id,
+        request.headers.get("origin", "-"),
+        payload.image_type,
+        len(payload.image_base64 or ""),
+        text_preview(request.headers.get("user-agent", "-"), 180),
+        memory_snapshot(),
+    )
+
+    async def load_image() -> tuple[Image.Image, bytes]:
+        return decode_base64_image(payload.image_base64, request_id=request_id)
+
+    return await run_analysis(request, response, request_id, total_start_ms, load_image)
+
+
+@app.post("/api/v1/analyze/upload", response_model=AnalyzeResponse)
+async def analyze_product_upload(request: Request, response: Response):
+    """
+    分析产品图片（二进制上传）
+
+    接受 multipart/form-data（file 字段）或 application/octet-stream / image/* 原始字节，
+    省去 Base64 膨胀和 JSON 解析带来的额外副本。
+    """
+    request_id = request.headers.get("x-request-id") or uuid.uuid4().hex[:12]
+    begin_request(request_id, "sync")
+    response.headers["X-Request-ID"] = request_id
+    total_start_ms = now_ms()
+    logger.info(
+        "analyze_start request_id=%s origin=%s content_type=%s content_length=%s user_agent=%s %s",
+        request_id,
+        request.headers.get("origin", "-"),
+        request.headers.get("content-type", "-"),
+        request.headers.get("content-length", "-"),
+        text_preview(request.headers.get("user-agent", "-"), 180),
+        memory_snapshot(),
+    )
+
+    async def load_image() -> tuple[Image.Image, bytes]:
+        image_data, image_type = await read_upload_image(request)
+        logger.info(
+            "analyze_upload_received request_id=%s image_type=%s image_bytes=%s %s",
+            request_id,
+            image_type,
+            len(image_data),
+            memory_snapshot(),
+        )
+        return open_image_bytes(image_data, request_id=request_id), image_data
+
+    return await run_analysis(request, response, request_id, total_start_ms, load_image)
+
+
+def sse_event(event: str, data: object) -> str:
+    """格式化一条 Server-Sent Events 消息"""
+    if isinstance(data, BaseModel):
+        payload = data.model_dump_json()
+    else:
+        payload = json.dumps(data, ensure_ascii=False)
+    return f"event: {event}\ndata: {payload}\n\n"
+
+
+async def rule_engine_events(image_data: bytes, request_id: str, timings: dict[str, int]) -> AsyncIterator[tuple[str, object]]:
+    """规则引擎模式没有增量输出，只产生最终 result 事件"""
+    ocr_text = await timed_ocr_text(image_data, request_id, timings)
+    yield "result", run_rule_engine(ocr_text, request_id, timings)
+
+
+async def stream_analysis_events(
+    image: Image.Image,
+    image_data: bytes,
+    request_id: str,
+    total_start_ms: int,
+    cache_key: str,
+    fingerprint: Optional[int],
+) -> AsyncIterator[str]:
+    """把 VLM 流式事件转换为 SSE，并记录首个有效事件耗时（TTFUB）与总耗时"""
+    first_event = None
+    first_event_ms = None
+    timings: dict[str, int] = {}
+    ocr_task = None
+    ocr_text = ""
+    known_risks = []
+    prefilled_risks = []
+    if ANALYZE_ENGINE == "rules":
+        events = rule_engine_events(image_data, request_id, timings)
+    else:
+        if ANALYZE_PIPELINE_MODE == "parallel":
+            ocr_task = asyncio.ensure_future(timed_ocr_text(image_data, request_id, timings))
+        else:
+            ocr_text = await timed_ocr_text(image_data, request_id, timings)
+            known_risks = index_known_risks(ocr_text, request_id, timings)
+            prefilled_risks = additive_kb.authoritative(known_risks)
+        events = vlm_service.stream_analyze_ingredients(
+            image=image,
+            ocr_text=ocr_text,
+            request_id=request_id,
+            image_bytes=image_data,
+            known_risks=prefilled_risks,
+        )
+    # 知识库命中的 risks 不必等模型生成，先行推送；模型随后给出的同一成分不再重复推送。过敏原等待模型确认，不先行推送
+    for risk in prefilled_risks:
+        if first_event is None:
+            first_event = "risk"
+            first_event_ms = elapsed_ms(total_start_ms)
+            logger.info(
+                "analyze_stream_first_event request_id=%s event=%s elapsed_ms=%s source=additive_index",
+                request_id,
+                first_event,
+                first_event_ms,
+            )
+        yield sse_event("risk", risk)
+    step_ms = now_ms()
+    IN_FLIGHT.inc("analysis")
+    memory_watch = memory_sampler.watch()
+    try:
+        async for event, data in events:
+            if event == "risk" and prefilled_risks and additive_kb.covered_by(data, prefilled_risks):
+                continue
+            if event == "result":
+                cacheable = True
+                if ANALYZE_ENGINE != "rules":
+                    timings["vlm_ms"] = elapsed_ms(step_ms)
+                if should_fallback_to_rules(data):
+                    if ocr_task is not None:
+                        ocr_text = await ocr_task
+                    data = fallback_to_rules(data, ocr_text, request_id, timings)
+                    cacheable = False
+                elif ocr_task is not None:
+                    data = await apply_ocr_validation(data, ocr_task, request_id, timings)
+                else:
+                    data = additive_kb.merge_risks(data, known_risks)
+                log_stage_timings(request_id, timings)
+                if cacheable:
+                    store_result(cache_key, fingerprint, data)
+                logger.info(
+                    "analyze_stream_done request_id=%s first_event=%s first_event_ms=%s total_elapsed_ms=%s result_error_type=%s result_score=%s peak_rss_delta_kb=%s %s",
+                    request_id,
+                    first_event or "-",
+                    first_event_ms if first_event_ms is not None else "-",
+                    elapsed_ms(total_start_ms),
+                    data.error_type,
+                    data.health_score,
+                    memory_sampler.peak_delta_kb(memory_watch),
+                    memory_snapshot(),
+                )
+                record_analysis(
+                    "stream",
+                    "MISS",
+                    data,
+                    elapsed_ms(total_start_ms),
+                    first_event_ms=first_event_ms,
+                    peak_rss_delta_kb=memory_sampler.peak_delta_kb(memory_watch),
+                )
+                if first_event_ms is not None:
+                    observe_ms("first_event", first_event_ms)
+            elif first_event is None:
+                first_event = event
+                first_event_ms = elapsed_ms(total_start_ms)
+                logger.info(
+                    "analyze_stream_first_event request_id=%s event=%s elapsed_ms=%s",
+                    request_id,
+                    event,
+                    first_event_ms,
+                )
+            yield sse_event(event, data)
+    finally:
+        IN_FLIGHT.dec("analysis")
+        memory_sampler.unwatch(memory_watch)
+        if ocr_task is not None:
+            ocr_task.cancel()
+
+
+@app.post("/api/v1/analyze/stream")
+async def analyze_product_stream(request: Request):
+    """
+    流式分析产品图片（Server-Sent Events）
+
+    请求体与 /api/v1/analyze/upload 相同。事件按模型输出顺序推送：
+    health_score、summary、每个 risk、每个 ingredient、alternatives，最后是完整的 result（AnalyzeResponse）。
+    缓存命中时只推送 result。
+    """
+    request_id = request.headers.get("x-request-id") or uuid.uuid4().hex[:12]
+    begin_request(request_id, "stream")
+    total_start_ms = now_ms()
+    logger.info(
+        "analyze_start request_id=%s mode=stream origin=%s content_type=%s content_length=%s user_agent=%s %s",
+        request_id,
+        request.headers.get("origin", "-"),
+        request.headers.get("content-type", "-"),
+        request.headers.get("content-length", "-"),
+        text_preview(request.headers.get("user-agent", "-"), 180),
+        memory_snapshot(),
+    )
+    step_ms = now_ms()
+    image_data, _ = await read_upload_image(request)
+    image = open_image_bytes(image_data, request_id=request_id)
+    observe_ms("decode", elapsed_ms(step_ms))
+    cache_key, cache_status, cached_result, fingerprint = lookup_cached_result(image_data, request_id)
+    headers = {
+        "X-Request-ID": request_id,
+        "X-Cache": cache_status,
+        "Cache-Control": "no-cache",
+        # 关闭反向代理缓冲，保证事件即时送达
+        "X-Accel-Buffering": "no",
+    }
+
+    if cached_result is not None:
+        logger.info(
+            "analyze_cache_hit request_id=%s cache_status=%s total_elapsed_ms=%s result_score=%s cache_stats=%s %s",
+            request_id,
+            cache_status,
+            elapsed_ms(total_start_ms),
+            cached_result.health_score,
+            result_cache.stats(),
+            memory_snapshot(),
+        )
+        record_analysis("stream", cache_status, cached_result, elapsed_ms(total_start_ms))
+
+        async def cached_events() -> AsyncIterator[str]:
+            yield sse_event("result", cached_result)
+
+        return StreamingResponse(cached_events(), media_type="text/event-stream", headers=headers)
+
+    return StreamingResponse(
+        stream_analysis_events(image, image_data, request_id, total_start_ms, cache_key, fingerprint),
+        media_type="text/event-stream",
+        headers=headers,
+    )
+
+
+async def read_batch_items(request: Request, batch_id: str):
+    """
+    读取批量请求中的图片
+
+    - application/json：AnalyzeBatchRequest，id 缺省时使用序号
+    - multipart/form-data：多个 file 字段，id 为文件名
+
+    请求体总大小不超过 BATCH_MAX_BYTES：先检查 Content-Length，读取过程中再按实际收到的字节数检查（分块传输没有 Content-Length）。
+
+    Returns:
+        ([(id, 加载函数)], 需要在响应结束后关闭的 multipart 表单或 None)
+    """
+    too_large = f"批量请求过大，最大 {BATCH_MAX_BYTES} 字节"
+    content_length = request.headers.get("content-length", "")
+    if content_length.isdigit() and int(content_length) > BATCH_MAX_BYTES:
+        raise HTTPException(status_code=413, detail=too_large)
+
+    content_type = request.headers.get("content-type", "")
+    if content_type.startswith("multipart/form-data"):
+        limited = limit_request_body(request, BATCH_MAX_BYTES, too_large)
+        form = await limited.form(max_files=BATCH_MAX_ITEMS, max_fields=BATCH_MAX_ITEMS + 4)
+        uploads = [upload for upload in form.getlist("file") if isinstance(upload, UploadFile)]
+
+        def upload_loader(upload: UploadFile, request_id: str):
+            async def load_image() -> tuple[Image.Image, bytes]:
+                if upload.size is not None and upload.size > UPLOAD_MAX_BYTES:
+                    raise HTTPException(status_code=413, detail=f"图片过大，最大 {UPLOAD_MAX_BYTES} 字节")
+                image_data = await upload.read()
+                if not image_data:
+                    raise HTTPException(status_code=400, detail="图片为空")
+                return open_image_bytes(image_data, request_id=request_id), image_data
+
+            return load_image
+
+        items = [
+            (upload.filename or str(index), upload_loader(upload, f"{batch_id}-{index}"))
+            for index, upload in enumerate(uploads)
+        ]
+    else:
+        form = None
+        try:
+            payload = AnalyzeBatchRequest.model_validate_json(await read_body(request, BATCH_MAX_BYTES, too_large))
+        except ValidationError as e:
+            raise HTTPException(status_code=422, detail=e.errors(include_url=False, include_context=False))
+
+        def base64_loader(item: AnalyzeBatchItem, request_id: str):
+            async def load_image() -> tuple[Image.Image, bytes]:
+                return decode_base64_image(item.image_base64, request_id=request_id)
+
+            return load_image
+
+        items = [
+            (item.id or str(index), base64_loader(item, f"{batch_id}-{index}"))
+            for index, item in enumerate(payload.images)
+        ]
+
+    if not items or len(items) > BATCH_MAX_ITEMS:
+        if form is not None:
+            await form.close()
+        raise HTTPException(status_code=400, detail=f"每批需要 1-{BATCH_MAX_ITEMS} 张图片，收到 {len(items)} 张")
+    return items, form
+
+
+async def analyze_batch_item(
+    index: int,
+    item_id: str,
+    load_image: Callable[[], Awaitable[tuple[Image.Image, bytes]]],
+    batch_id: str,
+) -> dict:
+    """
+    分析批量请求中的一张图片，总是返回一条结果（单张图片出错只影响该条目）
+
+    与单图接口共用结果缓存、近似重复索引和 single-flight：批内和跨请求的相同图片只调用一次模型。
+    """
+    request_id = f"{batch_id}-{index}"
+    begin_request(request_id, "batch")
+    start_ms = now_ms()
+    cache_status = "-"
+    IN_FLIGHT.inc("analysis")
+    try:
+        image, image_data = await load_image()
+        cache_key, cache_status, analysis_result, fingerprint = lookup_cached_result(image_data, request_id)
+        if analysis_result is None:
+            async with batch_semaphore:
+                # 排队期间批内相同图片可能已经分析完成
+                analysis_result = result_cache.get(cache_key, record_stats=False)
+                if analysis_result is not None:
+                    cache_status = "HIT"
+                else:
+                    analysis_result, leader_request_id = await analyze_flight.run(
+                        cache_key,
+                        lambda: analyze_and_cache(
+                            image=image,
+                            image_data=image_data,
+                            request_id=request_id,
+                            cache_key=cache_key,
+                            fingerprint=fingerprint,
+                        ),
+                        request_id=request_id,
+                    )
+                    if leader_request_id is not None:
+                        cache_status = "COALESCED"
+    except HTTPException as e:
+        analysis_result = error_response(str(e.detail), http_error_type(e))
+    except Exception as e:
+        logger.error("analyze_batch_item_failed request_id=%s error=%s", request_id, e, exc_info=True)
+        analysis_result = error_response_for_exception(e)
+    finally:
+        IN_FLIGHT.dec("analysis")
+    item_elapsed_ms = elapsed_ms(start_ms)
+    record_analysis("batch", cache_status, analysis_result, item_elapsed_ms)
+    logger.info(
+        "analyze_batch_item_done request_id=%s index=%s cache_status=%s elapsed_ms=%s result_error_type=%s result_score=%s",
+        request_id,
+        index,
+        cache_status,
+        item_elapsed_ms,
+        analysis_result.error_type,
+        analysis_result.health_score,
+    )
+    return {
+        "type": "item",
+        "index": index,
+        "id": item_id,
+        "request_id": request_id,
+        "cache": cache_status,
+        "elapsed_ms": item_elapsed_ms,
+        "result": analysis_result.model_dump(),
+    }
+
+
+async def batch_analysis_lines(items: list, batch_id: str, total_start_ms: int, form) -> AsyncIterator[str]:
+    """
+    按完成顺序输出 NDJSON：每张图片一行 item，最后一行 summary
+
+    每批最多 BATCH_CONCURRENCY 张图片同时解码分析，避免整批图片同时驻留内存；
+    客户端断开时取消未完成的条目。
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+    pending = iter(enumerate(items))
+
+    async def worker() -> None:
+        for index, (item_id, load_image) in pending:
+            await queue.put(await analyze_batch_item(index, item_id, load_image, batch_id))
+
+    workers = [asyncio.ensure_future(worker()) for _ in range(min(BATCH_CONCURRENCY, len(items)))]
+    errors = 0
+    cache_hits = 0
+    try:
+        for _ in range(len(items)):
+            line = await queue.get()
+            errors += line["result"]["error_type"] is not None
+            cache_hits += line["cache"] in ("HIT", "NEAR_HIT")
+            yield json.dumps(line, ensure_ascii=False) + "\n"
+        logger.info(
+            "analyze_batch_done request_id=%s items=%s errors=%s cache_hits=%s total_elapsed_ms=%s %s",
+            batch_id,
+            len(items),
+            errors,
+            cache_hits,
+            elapsed_ms(total_start_ms),
+            memory_snapshot(),
+        )
+        summary = {
+            "type": "summary",
+            "items": len(items),
+            "errors": errors,
+            "cache_hits": cache_hits,
+            "elapsed_ms": elapsed_ms(total_start_ms),
+        }
+        yield json.dumps(summary) + "\n"
+    finally:
+        for task in workers:
+            task.cancel()
+        if form is not None:
+            await form.close()
+
+
+@app.post("/api/v1/analyze/batch")
+async def analyze_product_batch(request: Request):
+    """
+    批量分析产品图片（NDJSON 流式返回）
+
+    请求体为 JSON（{"images": [{"id", "image_base64", "image_type"}]}）或包含多个 file 字段的 multipart/form-data。
+    每张图片完成后立即输出一行 {"type": "item", "index", "id", "request_id", "cache", "elapsed_ms", "result"}，
+    顺序为完成顺序；单张图片失败时该行的 result 带 error / error_type，不影响其他图片。
+    最后一行为 {"type": "summary", "items", "errors", "cache_hits", "elapsed_ms"}。
+    """
+    batch_id = request.headers.get("x-request-id") or uuid.uuid4().hex[:12]
+    total_start_ms = now_ms()
+    items, form = await read_batch_items(request, batch_id)
+    logger.info(
+        "analyze_batch_start request_id=%s items=%s concurrency=%s origin=%s content_type=%s content_length=%s %s",
+        batch_id,
+        len(items),
+        BATCH_CONCURRENCY,
+        request.headers.get("origin", "-"),
+        request.headers.get("content-type", "-"),
+        request.headers.get("content-length", "-"),
+        memory_snapshot(),
+    )
+    return StreamingResponse(
+        batch_analysis_lines(items, batch_id, total_start_ms, form),
+        media_type="application/x-ndjson",
+        headers={"X-Request-ID": batch_id, "Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+async def run_job(job: Job) -> AnalyzeResponse:
+    """
+    任务 worker 执行一次分析；与单图接口共用结果缓存、近似重复索引和 single-flight
+
+    图片或分析出错时返回带 error_type 的结果（任务状态仍为 done），与同步接口的响应一致。
+    """
+    image_data, request_id = job.payload
+    begin_request(request_id, "job")
+    start_ms = now_ms()
+    IN_FLIGHT.inc("analysis")
+    memory_watch = memory_sampler.watch()
+    try:
+        image = open_image_bytes(image_data, request_id=request_id)
+        cache_key, cache_status, analysis_result, fingerprint = lookup_cached_result(image_data, request_id)
+        if analysis_result is None:
+            analysis_result, leader_request_id = await analyze_flight.run(
+                cache_key,
+                lambda: analyze_and_cache(
+                    image=image,
+                    image_data=image_data,
+                    request_id=request_id,
+                    cache_key=cache_key,
+                    fingerprint=fingerprint,
+                ),
+                request_id=request_id,
+            )
+            if leader_request_id is not None:
+                cache_status = "COALESCED"
+    except HTTPException as e:
+        cache_status = "-"
+        analysis_result = error_response(str(e.detail), http_error_type(e))
+    except Exception as e:
+        logger.error("job_analyze_failed request_id=%s job_id=%s error=%s", request_id, job.id, e, exc_info=True)
+        cache_status = "-"
+        analysis_result = error_response_for_exception(e)
+    finally:
+        IN_FLIGHT.dec("analysis")
+        memory_sampler.unwatch(memory_watch)
+    record_analysis(
+        "job",
+        cache_status,
+        analysis_result,
+        elapsed_ms(start_ms),
+        job_id=job.id,
+        wait_ms=job.wait_ms,
+        peak_rss_delta_kb=memory_sampler.peak_delta_kb(memory_watch),
+    )
+    logger.info(
+        "job_analyze_done request_id=%s job_id=%s cache_status=%s result_error_type=%s result_score=%s peak_rss_delta_kb=%s %s",
+        request_id,
+        job.id,
+        cache_status,
+        analysis_result.error_type,
+        analysis_result.health_score,
+        memory_sampler.peak_delta_kb(memory_watch),
+        memory_snapshot(),
+    )
+    return analysis_result
+
+
+# 任务模式：提交后立即返回任务 ID，由 JOB_WORKERS 个进程内 worker 依次分析，客户端断线后可凭 ID 取回结果
+job_queue = JobQueue(
+    handler=run_job,
+    workers=read_int_env("JOB_WORKERS", 2),
+    max_queue=read_int_env("JOB_QUEUE_MAX", 32),
+    result_ttl_seconds=read_float_env("JOB_RESULT_TTL_SECONDS", 600),
+    max_bytes=read_int_env("JOB_QUEUE_MAX_BYTES", 64 * 1024 * 1024),
+)
+
+
+def job_view(job: Job) -> dict:
+    view = {
+        "job_id": job.id,
+        "status": job.status,
+        "wait_ms": job.wait_ms,
+        "service_ms": job.service_ms,
+        "result": job.result.model_dump() if job.result is not None else None,
+        "error": job.error,
+    }
+    if job.status == "queued":
+        view["queue_depth"] = job_queue.depth
+    return view
+
+
+@app.post("/api/v1/jobs", status_code=202)
+async def submit_job(request: Request, response: Response):
+    """
+    提交异步分析任务，立即返回任务 ID
+
+    请求体与 /api/v1/analyze（application/json + Base64）或 /api/v1/analyze/upload（multipart / 原始字节）相同。
+    图片在提交时校验文件头，无效图片直接返回 400；队列已满时返回 503 + Retry-After。
+    """
+    request_id = request.headers.get("x-request-id") or uuid.uuid4().hex[:12]
+    response.headers["X-Request-ID"] = request_id
+    if request.headers.get("content-type", "").startswith("application/json"):
+        try:
+            body = await read_body(request, JSON_IMAGE_MAX_BYTES, f"图片过大，最大 {UPLOAD_MAX_BYTES} 字节")
+            payload = AnalyzeRequest.model_validate_json(body)
+        except ValidationError as e:
+            raise HTTPException(status_code=422, detail=e.errors(include_url=False, include_context=False))
+        _, image_data = decode_base64_image(payload.image_base64, request_id=request_id)
+    else:
+        image_data, _ = await read_upload_image(request)
+        open_image_bytes(image_data, request_id=request_id)
+    try:
+        job = job_queue.submit((image_data, request_id), size=len(image_data))
+    except JobQueueFull as e:
+        logger.warning("job_rejected request_id=%s reason=queue_full %s", request_id, job_queue.stats())
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    logger.info(
+        "job_submitted request_id=%s job_id=%s image_bytes=%s queue_depth=%s origin=%s %s",
+        request_id,
+        job.id,
+        len(image_data),
+        job_queue.depth,
+        request.headers.get("origin", "-"),
+        memory_snapshot(),
+    )
+    response.headers["Location"] = f"/api/v1/jobs/{job.id}"
+    return job_view(job)
+
+
+@app.get("/api/v1/logging/stats")
+async def log_stats():
+    """日志模式、详细日志抽样比例，queued 模式下的队列深度和丢弃数"""
+    return logging_stats()
+
+
+@app.get("/api/v1/memory/stats")
+async def memory_stats():
+    """后台内存采样：当前 / 峰值 RSS 和最近窗口内的分位数"""
+    return memory_sampler.stats()
+
+
+@app.get("/api/v1/jobs/stats")
+async def job_stats():
+    """队列深度、忙碌 worker 数和最近任务的等待 / 执行耗时分位数，用于确定 JOB_WORKERS"""
+    return job_queue.stats()
+
+
+@app.get("/api/v1/vlm/stats")
+async def vlm_stats():
+    """各模型的调用数、对冲率、胜率、延迟分位数、当前对冲阈值和熔断器状态，以及累计重试次数"""
+    return vlm_service.stats()
+
+
+@app.get("/api/v1/jobs/{job_id}")
+async def get_job(job_id: str):
+    """
+    查询任务状态：queued / running / done / failed
+
+    done 时 result 与同步接口的响应相同；任务完成 JOB_RESULT_TTL_SECONDS 秒后过期，过期或不存在返回 404。
+    """
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="任务不存在或已过期")
+    return job_view(job)
+
+
+# 模块导入完成的时刻（startup_ready 中的 import_ms）
+_APP_IMPORTED = time.perf_counter()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,357 @@
+"""
+添加剂索引 - 内置知识库 + Aho-Corasick 多模式匹配
+
+services/data/additives.json 中的 E 编号（含「E 102」「E-102」写法）和中英文名称在启动时编译为一个自动机，
+对 OCR 文字只扫描一遍即可找出全部命中，耗时与文字长度线性相关，与词典大小基本无关。
+
+用途：
+- 规则引擎按配料名查找条目（AdditiveKnowledgeBase.match）
+- VLM 分析前扫描 OCR 配料表，把命中条目作为权威 risks 预先填入，模型只需补充知识库未覆盖的风险成分；
+  过敏原条目例外，只有模型读到的配料表或 risks 中也有该成分时才保留
+
+「peanut-free」「Gluten free」「不含麸质」「无花生」「may contain traces of nuts」这类否定 / 无添加声明中的名称不算命中；
+exclusions 中的短语（如「sugar snap peas」「coconut milk」）占住所在位置，其中较短的名称不算命中。
+"""
+
+from __future__ import annotations
+
+import json
+import re
+from bisect import bisect_right
+from collections import deque
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Generic, Iterator, Optional, TypeVar
+
+from services.ocr_validation import extract_ingredient_section, find_e_numbers
+from services.vlm_service import AnalyzeResponse, RiskItem
+
+KB_PATH = Path(__file__).resolve().parent / "data" / "additives.json"
+
+LEVEL_ORDER = {"High": 0, "Moderate": 1, "Low": 2}
+_WHITESPACE_RE = re.compile(r"\s+")
+# 与 ocr_validation 中 E 编号正则一致的写法：E102 / E 102 / E-102 / E -102
+_E_CODE_VARIANTS = ("e{}", "e {}", "e-{}", "e -{}")
+# 否定 / 无添加声明（在规范化的小写文本上匹配）：名称后紧跟「-free / free」，或同一分句中名称之前出现否定词；
+# 「无」只在紧挨名称时算否定（「无添加」不限位置），避免「无水柠檬酸」中的「柠檬酸」被排除
+_FREE_AFTER_RE = re.compile(r" ?- ?free\b| free\b|free\b")
+_NEGATION_BEFORE_RE = re.compile(r"\bno\b|\bwithout\b|\bfree (?:from|of)\b|\bmay contain|不含|可能含有|无添加")
+_NEGATION_ADJACENT = "无"
+# 向前查找否定词的最大字符数（同一分句内）；只看名称前的一小段，扫描仍与文字长度线性相关
+_NEGATION_WINDOW = 60
+_CLAUSE_BREAK_RE = re.compile(r"[,，、;；。:：()（）\[\]【】\n]|\.(?=\s|$)")
+# 过敏原条目需要模型确认，不作为权威 risks
+CONFIRM_CATEGORIES = frozenset({"allergen"})
+
+T = TypeVar("T")
+
+
+class AhoCorasick(Generic[T]):
+    """
+    Aho-Corasick 自动机：add() 全部模式后 build()，之后 iter_matches() 线性扫描文本
+
+    节点转移用 dict 存储，失败转移在扫描时按需回溯（不展开成完整 DFA），
+    内存约为模式总字符数 × 每节点一个小 dict。
+    """
+
+    def __init__(self) -> None:
+        self._goto: list[dict[str, int]] = [{}]
+        self._fail: list[int] = [0]
+        # 节点对应的模式下标（-1 表示不是模式结尾）；输出链指向失败链上最近的模式结尾节点
+        self._pattern: list[int] = [-1]
+        self._output_link: list[int] = [0]
+        self._values: list[tuple[int, T]] = []
+        self._built = False
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    @property
+    def node_count(self) -> int:
+        return len(self._goto)
+
+    def add(self, pattern: str, value: T) -> bool:
+        """添加模式；同一模式重复添加时保留第一个值并返回 False"""
+        if not pattern:
+            raise ValueError("pattern must not be empty")
+        node = 0
+        for ch in pattern:
+            next_node = self._goto[node].get(ch)
+            if next_node is None:
+                next_node = len(self._goto)
+                self._goto[node][ch] = next_node
+                self._goto.append({})
+                self._fail.append(0)
+                self._pattern.append(-1)
+                self._output_link.append(0)
+            node = next_node
+        if self._pattern[node] >= 0:
+            return False
+        self._pattern[node] = len(self._values)
+        self._values.append((len(pattern), value))
+        self._built = False
+        return True
+
+    def build(self) -> "AhoCorasick[T]":
+        """按广度优先计算失败转移和输出链"""
+        queue = deque(self._goto[0].values())
+        for node in queue:
+            self._fail[node] = 0
+            self._output_link[node] = 0
+        while queue:
+            node = queue.popleft()
+            for ch, child in self._goto[node].items():
+                queue.append(child)
+                state = self._fail[node]
+                while state and ch not in self._goto[state]:
+                    state = self._fail[state]
+                fail = self._goto[state].get(ch, 0)
+                self._fail[child] = fail
+                self._output_link[child] = fail if self._pattern[fail] >= 0 else self._output_link[fail]
+        self._built = True
+        return self
+
+    def iter_matches(self, text: str) -> Iterator[tuple[int, int, T]]:
+        """产出所有命中 (start, end, value)，包括重叠和互相包含的模式"""
+        if not self._built:
+            self.build()
+        goto, fail, pattern, output_link, values = self._goto, self._fail, self._pattern, self._output_link, self._values
+        state = 0
+        for index, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            node = state if pattern[state] >= 0 else output_link[state]
+            while node:
+                length, value = values[pattern[node]]
+                yield index + 1 - length, index + 1, value
+                node = output_link[node]
+
+
+@dataclass(frozen=True)
+class KBEntry:
+    code: str
+    names: tuple[str, ...]
+    level: str
+    category: str
+    desc: str
+
+
+@dataclass(frozen=True)
+class AdditiveMatch:
+    start: int  # 原文下标
+    end: int
+    text: str  # 原文中的命中片段（保留大小写）
+    entry: KBEntry
+
+
+def _is_word_char(ch: str) -> bool:
+    return ch.isascii() and ch.isalnum()
+
+
+def _is_cjk(ch: str) -> bool:
+    return "\u3400" <= ch <= "\u9fff"
+
+
+def _is_word_match(text: str, pattern: str, start: int, end: int) -> bool:
+    """
+    - 拉丁字母模式要求词边界（egg 不匹配 eggplant），允许英文复数后缀（almonds、tocopherols）
+    - 单字中文模式（如「盐」「鱼」）前后都不能是汉字，避免「亚硝酸盐」误中「盐」
+    """
+    if len(pattern) == 1 and _is_cjk(pattern):
+        return not (start > 0 and _is_cjk(text[start - 1])) and not (end < len(text) and _is_cjk(text[end]))
+    if _is_word_char(pattern[0]) and start > 0 and _is_word_char(text[start - 1]):
+        return False
+    if _is_word_char(pattern[-1]) and end < len(text) and _is_word_char(text[end]):
+        for suffix in ("s", "es"):
+            if text.startswith(suffix, end) and not _is_word_char(text[end + len(suffix):end + len(suffix) + 1] or " "):
+                return True
+        return False
+    return True
+
+
+def _is_negated(text: str, start: int, end: int) -> bool:
+    """命中位于「-free / free」之前，或同一分句中前面有否定词（no、不含、may contain 等）"""
+    if _FREE_AFTER_RE.match(text, end):
+        return True
+    prefix = text[max(0, start - _NEGATION_WINDOW):start]
+    if prefix.rstrip().endswith(_NEGATION_ADJACENT):
+        return True
+    clause_start = 0
+    for clause_break in _CLAUSE_BREAK_RE.finditer(prefix):
+        clause_start = clause_break.end()
+    return _NEGATION_BEFORE_RE.search(prefix, clause_start) is not None
+
+
+def _normalize(text: str) -> tuple[str, list[tuple[int, int]]]:
+    """
+    小写并把连续空白合并为一个空格（OCR 断行的「sodium\\nbenzoate」也能命中）
+
+    Returns:
+        (规范化文本, 下标映射)；映射为 (规范化下标, 累计删除字符数)，
+        规范化文本中位置 i 对应原文位置 i + 最后一个规范化下标 ≤ i 的累计删除数
+    """
+    lowered = text.lower()
+    if len(lowered) != len(text):
+        # 少数字符小写后长度变化（如 İ），逐字处理以保持下标对应
+        lowered = "".join(ch.lower() if len(ch.lower()) == 1 else ch for ch in text)
+    shifts: list[tuple[int, int]] = [(0, 0)]
+    removed = 0
+    for match in _WHITESPACE_RE.finditer(lowered):
+        length = match.end() - match.start()
+        if length > 1:
+            shifts.append((match.start() - removed + 1, removed + length - 1))
+            removed += length - 1
+    return _WHITESPACE_RE.sub(" ", lowered), shifts
+
+
+def _original_index(shifts: list[tuple[int, int]], index: int) -> int:
+    return index + shifts[bisect_right(shifts, (index, float("inf"))) - 1][1]
+
+
+class AdditiveKnowledgeBase:
+    """添加剂 / 过敏原知识库"""
+
+    def __init__(
+        self,
+        entries: list[KBEntry],
+        alternatives: dict[str, str],
+        version: str = "-",
+        exclusions: tuple[str, ...] = (),
+    ):
+        self.entries = entries
+        self.alternatives = alternatives
+        self.version = version
+        self.exclusions = exclusions
+        self._by_code = {entry.code: entry for entry in entries if entry.code}
+        # 值为 None 的模式是 exclusions：参与最长匹配，但不产生命中
+        self.automaton: AhoCorasick[tuple[str, Optional[KBEntry]]] = AhoCorasick()
+        for entry in entries:
+            if entry.code:
+                digits = entry.code[1:].lower()
+                for variant in _E_CODE_VARIANTS:
+                    self.automaton.add(variant.format(digits), (variant.format(digits), entry))
+            for name in entry.names:
+                pattern = _WHITESPACE_RE.sub(" ", name.lower()).strip()
+                self.automaton.add(pattern, (pattern, entry))
+        for phrase in exclusions:
+            pattern = _WHITESPACE_RE.sub(" ", phrase.lower()).strip()
+            self.automaton.add(pattern, (pattern, None))
+        self.automaton.build()
+
+    @classmethod
+    def load(cls, path: Path = KB_PATH) -> "AdditiveKnowledgeBase":
+        with open(path, "r", encoding="utf-8") as kb_file:
+            data = json.load(kb_file)
+        entries = [
+            KBEntry(
+                code=item.get("code", ""),
+                names=tuple(item.get("names", [])),
+                level=item["level"],
+                category=item.get("category", ""),
+                desc=item.get("desc", ""),
+            )
+            for item in data["entries"]
+        ]
+        return cls(entries, data.get("alternatives", {}), data.get("version", "-"), tuple(data.get("exclusions", [])))
+
+    def lookup_code(self, code: str) -> Optional[KBEntry]:
+        return self._by_code.get(code)
+
+    def scan(self, text: str) -> list[AdditiveMatch]:
+        """
+        扫描文本，返回按位置排序、互不重叠的命中
+
+        同一位置取最长模式（「山梨酸钾」不会同时命中「山梨酸」），重叠时保留靠左的命中。
+        选出的位置是 exclusions 短语，或处在否定 / 无添加声明中时不返回。
+        """
+        if not text:
+            return []
+        normalized, shifts = _normalize(text)
+        candidates = [
+            (start, end, entry)
+            for start, end, (pattern, entry) in self.automaton.iter_matches(normalized)
+            if _is_word_match(normalized, pattern, start, end)
+        ]
+        candidates.sort(key=lambda item: (item[0], item[0] - item[1]))
+        matches: list[AdditiveMatch] = []
+        last_end = 0
+        for start, end, entry in candidates:
+            if start < last_end:
+                continue
+            last_end = end
+            if entry is None or _is_negated(normalized, start, end):
+                continue
+            original_start = _original_index(shifts, start)
+            original_end = _original_index(shifts, end - 1) + 1
+            matches.append(AdditiveMatch(original_start, original_end, text[original_start:original_end], entry))
+        return matches
+
+    def match(self, ingredient: str) -> list[KBEntry]:
+        """返回配料名命中的条目（按出现顺序去重）"""
+        matched: list[KBEntry] = []
+        for found in self.scan(ingredient.strip()):
+            if found.entry not in matched:
+                matched.append(found.entry)
+        return matched
+
+    def known_risks(self, ocr_text: str) -> list[RiskItem]:
+        """
+        扫描 OCR 配料表，返回知识库命中的 risks（每个条目一项，按风险等级排序）
+
+        找到配料表标题时只扫描配料表段落，营养成分表中的「钠」「糖」不计入；找不到时扫描全文。
+        """
+        if not ocr_text or not ocr_text.strip():
+            return []
+        section = extract_ingredient_section(ocr_text)
+        risks: dict[KBEntry, RiskItem] = {}
+        for found in self.scan(section if section is not None else ocr_text):
+            if found.entry not in risks:
+                risks[found.entry] = RiskItem(level=found.entry.level, name=risk_name(found.text, found.entry), desc=found.entry.desc)
+        ordered = sorted(risks, key=lambda entry: LEVEL_ORDER.get(entry.level, len(LEVEL_ORDER)))
+        return [risks[entry] for entry in ordered]
+
+    def needs_confirmation(self, risk: RiskItem) -> bool:
+        """过敏原等条目需要模型确认（OCR 文字中的名称可能出自工厂声明、储存说明等），不预先推送也不覆盖模型结果"""
+        return any(entry.category in CONFIRM_CATEGORIES for entry in self.match(risk.name))
+
+    def authoritative(self, known_risks: list[RiskItem]) -> list[RiskItem]:
+        """不需要模型确认、可以直接写入结果的知识库 risks"""
+        return [risk for risk in known_risks if not self.needs_confirmation(risk)]
+
+    def merge_risks(self, result: AnalyzeResponse, known_risks: list[RiskItem]) -> AnalyzeResponse:
+        """
+        把知识库 risks 合并进模型结果
+
+        知识库条目覆盖模型对同一成分给出的等级和说明，模型额外识别的风险成分保留；合并后按风险等级排序（同级内知识库条目在前）。
+        需要确认的条目（过敏原）不覆盖模型：模型自己给出了该成分的风险项时保留模型的判断；
+        模型列出了配料但其中没有该成分时视为模型已排除，不加入；模型没有列出任何配料时按知识库加入。
+        结果带 error 或没有知识库命中时原样返回。
+        """
+        if result.error or not known_risks:
+            return result
+        model_entries = {entry for name in result.full_ingredients for entry in self.match(name)}
+        kept = []
+        for known in known_risks:
+            if self.needs_confirmation(known):
+                if any(self.covered_by(risk, [known]) for risk in result.risks):
+                    continue
+                if result.full_ingredients and not model_entries.intersection(self.match(known.name)):
+                    continue
+            kept.append(known)
+        extra = [risk for risk in result.risks if not self.covered_by(risk, kept)]
+        risks = sorted(kept + extra, key=lambda risk: LEVEL_ORDER.get(risk.level, len(LEVEL_ORDER)))
+        return result.model_copy(update={"risks": risks})
+
+    def covered_by(self, risk: RiskItem, known_risks: list[RiskItem]) -> bool:
+        """模型给出的风险项是否与知识库 risks 指向同一条目"""
+        known_entries = {entry for known in known_risks for entry in self.match(known.name)}
+        return any(entry in known_entries for entry in self.match(risk.name))
+
+
+def risk_name(text: str, entry: KBEntry) -> str:
+    """风险项名称：原文名称，原文中没有 E 编号时补在括号里"""
+    text = _WHITESPACE_RE.sub(" ", text).strip()
+    if entry.code and entry.code not in find_e_numbers(text):
+        return f"{text} ({entry.code})"
+    return text
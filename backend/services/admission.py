@@ -0,0 +1,179 @@
+"""
+准入控制 - 限制同时处理的分析请求数、等待队列长度和进程常驻内存
+
+小实例上一批大图同时上传会把 RSS 推过内存上限导致进程被 OOM kill。超出限制的请求立即返回
+429（排队已满）或 503（内存超过高水位 / 排队超时）并附 Retry-After，而不是接下处理不完的请求。
+以 ASGI 中间件实现，在读取请求体之前判断，被拒绝的请求不会把图片读进内存。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import math
+import time
+from typing import Optional
+
+from services.runtime_logging import read_rss_kb, rss_kb
+
+logger = logging.getLogger(__name__)
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, status_code: int, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.status_code = status_code
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    - 同时处理的请求不超过 max_in_flight，其余请求排队（FIFO），排队数不超过 max_queue
+    - 排队超过 queue_timeout_seconds 返回 503；队列已满返回 429
+    - rss_high_water_mb > 0 时，进入和离开队列时各检查一次 RSS，超过且仍有请求在处理时返回 503；
+      没有请求在处理时照常接受：CPython / glibc 很少把释放的内存还给系统，一次峰值之后 RSS 可能一直停在高水位之上，
+      此时若一律拒绝，服务会永久 503。高水位之上相当于退化为逐个处理
+    - Retry-After 按最近请求的平均处理耗时估算排在前面的请求需要多久处理完
+    """
+
+    def __init__(
+        self,
+        max_in_flight: int,
+        max_queue: int,
+        queue_timeout_seconds: float,
+        rss_high_water_mb: int = 0,
+    ):
+        self.max_in_flight = max(1, max_in_flight)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout_seconds = queue_timeout_seconds
+        self.rss_high_water_mb = rss_high_water_mb
+        self.in_flight = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected: dict[str, int] = {"queue_full": 0, "queue_timeout": 0, "memory": 0}
+        self._semaphore = asyncio.Semaphore(self.max_in_flight)
+        # 平均处理耗时（指数移动平均），用于估算 Retry-After
+        self._service_seconds = 1.0
+
+    def retry_after(self) -> int:
+        rounds = (self.waiting + 1) / self.max_in_flight
+        return min(60, max(1, math.ceil(self._service_seconds * rounds)))
+
+    def _check_memory(self) -> Optional[int]:
+        if self.rss_high_water_mb <= 0 or self.in_flight == 0:
+            return None
+        # 直接读 /proc：采样缓存最多滞后 0.5 秒，一波并发上传会按突增之前的 RSS 放行
+        rss_mb = read_rss_kb() // 1024
+        return rss_mb if rss_mb >= self.rss_high_water_mb else None
+
+    def _reject(self, status_code: int, reason: str) -> AdmissionRejected:
+        self.rejected[reason] += 1
+        return AdmissionRejected(status_code, reason, self.retry_after())
+
+    async def acquire(self) -> float:
+        """取得处理名额，返回排队秒数；超出限制时抛 AdmissionRejected"""
+        if self._check_memory() is not None:
+            raise self._reject(503, "memory")
+        start = time.perf_counter()
+        if self.in_flight >= self.max_in_flight or self.waiting:
+            if self.waiting >= self.max_queue:
+                raise self._reject(429, "queue_full")
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout_seconds)
+            except asyncio.TimeoutError:
+                raise self._reject(503, "queue_timeout")
+            finally:
+                self.waiting -= 1
+        else:
+            await self._semaphore.acquire()
+        # 排队期间内存可能已被前面的请求推高
+        if self._check_memory() is not None:
+            self._semaphore.release()
+            raise self._reject(503, "memory")
+        self.in_flight += 1
+        self.admitted += 1
+        return time.perf_counter() - start
+
+    def release(self, service_seconds: float) -> None:
+        self.in_flight -= 1
+        self._service_seconds = 0.8 * self._service_seconds + 0.2 * service_seconds
+        self._semaphore.release()
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "rejected": dict(self.rejected),
+            "avg_service_ms": round(self._service_seconds * 1000),
+        }
+
+
+class AdmissionMiddleware:
+    """对指定路径的 POST 请求做准入控制；名额在响应（含流式响应）全部发送完毕后释放"""
+
+    def __init__(self, app, controller: AdmissionController, paths: tuple[str, ...]):
+        self.app = app
+        self.controller = controller
+        self.paths = frozenset(paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+        try:
+            wait_seconds = await self.controller.acquire()
+        except AdmissionRejected as rejected:
+            await self._send_rejection(scope, send, rejected)
+            return
+        if wait_seconds >= 0.001:
+            logger.info(
+                "admission_queued request_id=%s path=%s wait_ms=%s %s",
+                _request_id(scope),
+                scope["path"],
+                round(wait_seconds * 1000),
+                self.controller.stats(),
+            )
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release(time.perf_counter() - start)
+
+    async def _send_rejection(self, scope, send, rejected: AdmissionRejected) -> None:
+        logger.warning(
+            "admission_rejected request_id=%s path=%s status=%s reason=%s retry_after=%s rss_kb=%s %s",
+            _request_id(scope),
+            scope["path"],
+            rejected.status_code,
+            rejected.reason,
+            rejected.retry_after,
+            rss_kb(),
+            self.controller.stats(),
+        )
+        body = json.dumps(
+            {"detail": "服务繁忙，请稍后重试", "reason": rejected.reason, "retry_after": rejected.retry_after},
+            ensure_ascii=False,
+        ).encode("utf-8")
+        await send(
+            {
+                "type": "http.response.start",
+                "status": rejected.status_code,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                    (b"retry-after", str(rejected.retry_after).encode()),
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
+
+
+def _request_id(scope) -> str:
+    for name, value in scope.get("headers", []):
+        if name == b"x-request-id":
+            return value.decode("latin-1")
+    return "-"
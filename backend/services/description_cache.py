@@ -0,0 +1,161 @@
+"""
+成分说明缓存 - 按规范化成分名持久化保存说明文字（SQLite）
+
+糖、盐、棕榈油、E330 等成分在大量扫描中反复出现。VLM 只返回成分名和风险等级，
+ingredients_detail 中的说明从这里读取，只有第一次见到的成分才需要模型另外生成说明。
+"""
+
+from __future__ import annotations
+
+import logging
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from pathlib import Path
+from typing import Iterable
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_PATH = Path(__file__).resolve().parents[1] / ".cache" / "ingredient_descriptions.sqlite3"
+
+# 「Citric Acid (E330)」与「citric acid」视为同一成分；百分比和首尾标点不参与比较
+_E_CODE_SUFFIX_RE = re.compile(r"[(（]\s*e\s?-?\d{3,4}[a-z]?\s*[)）]")
+_PERCENT_RE = re.compile(r"\d+(\.\d+)?\s*%")
+_WHITESPACE_RE = re.compile(r"\s+")
+_STRIP_CHARS = " .,;:，。；：、*-_'\"“”‘’"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS descriptions (
+    key TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    description TEXT NOT NULL,
+    source TEXT NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0,
+    updated_at REAL NOT NULL
+)
+"""
+
+
+def normalize_ingredient_name(name: str) -> str:
+    """缓存键：NFKC + 小写，去掉 E 编号括注、百分比、首尾标点，合并空白"""
+    text = unicodedata.normalize("NFKC", name or "").lower()
+    text = _PERCENT_RE.sub("", _E_CODE_SUFFIX_RE.sub("", text))
+    return _WHITESPACE_RE.sub(" ", text).strip(_STRIP_CHARS)
+
+
+class IngredientDescriptionCache:
+    """
+    成分说明缓存
+
+    SQLite 只负责持久化：启动时把全部说明载入内存字典，读取只查字典、不加锁、不碰数据库，
+    可以直接在事件循环中执行（包括流式接口逐个成分的查找）；写入在提交后同步更新字典，会提交事务，调用方应放到线程中执行。
+    字典只反映本进程的写入，多个进程共用同一个文件时彼此的新条目要到重启后才可见（最多重复生成一次说明）。
+    超过 max_entries 时按命中次数和更新时间淘汰最冷的条目；条目数取自字典，不再每次写入都 COUNT(*)。
+    """
+
+    def __init__(self, path: Path | str = DEFAULT_CACHE_PATH, max_entries: int = 50000):
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        if str(path) != ":memory:":
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(_SCHEMA)
+        self._conn.commit()
+        # 规范化键 -> 说明，与表内容保持一致
+        self._descriptions: dict[str, str] = dict(self._conn.execute("SELECT key, description FROM descriptions"))
+
+    def __len__(self) -> int:
+        return len(self._descriptions)
+
+    def get_many(self, names: Iterable[str]) -> dict[str, str]:
+        """返回 {原始成分名: 说明}，未收录的成分不出现在结果中"""
+        keys: dict[str, list[str]] = {}
+        for name in names:
+            key = normalize_ingredient_name(name)
+            if key:
+                keys.setdefault(key, []).append(name)
+        found: dict[str, str] = {}
+        for key, names_for_key in keys.items():
+            description = self._descriptions.get(key)
+            if description is not None:
+                for name in names_for_key:
+                    found[name] = description
+        return found
+
+    def put_many(self, descriptions: dict[str, str], source: str) -> int:
+        """写入 {成分名: 说明}，已有条目会被覆盖；返回写入条数"""
+        now = time.time()
+        rows = [
+            (key, name.strip(), description.strip(), source, now)
+            for name, description in descriptions.items()
+            if (key := normalize_ingredient_name(name)) and description and description.strip()
+        ]
+        if not rows:
+            return 0
+        with self._lock:
+            self._conn.executemany(
+                "INSERT INTO descriptions (key, name, description, source, updated_at) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET name=excluded.name, description=excluded.description, "
+                "source=excluded.source, updated_at=excluded.updated_at",
+                rows,
+            )
+            self._conn.commit()
+            for key, _, description, _, _ in rows:
+                self._descriptions[key] = description
+            self._evict_locked()
+        return len(rows)
+
+    def seed(self, descriptions: Iterable[tuple[str, str]], source: str) -> int:
+        """预置说明（如添加剂知识库），不覆盖已有条目；返回新增条数"""
+        now = time.time()
+        rows = [
+            (key, name.strip(), description.strip(), source, now)
+            for name, description in descriptions
+            if (key := normalize_ingredient_name(name)) and description and description.strip()
+        ]
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO descriptions (key, name, description, source, updated_at) VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+            self._conn.commit()
+            for key, _, description, _, _ in rows:
+                self._descriptions.setdefault(key, description)
+            added = self._conn.total_changes - before
+            self._evict_locked()
+            return added
+
+    def record_hits(self, names: Iterable[str]) -> None:
+        """累加命中次数，供淘汰时区分冷热条目"""
+        keys = [(key,) for key in {normalize_ingredient_name(name) for name in names} if key]
+        if not keys:
+            return
+        with self._lock:
+            self._conn.executemany("UPDATE descriptions SET hits = hits + 1 WHERE key = ?", keys)
+            self._conn.commit()
+
+    def _evict_locked(self) -> None:
+        overflow = len(self._descriptions) - self.max_entries
+        if overflow > 0:
+            evicted = self._conn.execute(
+                "SELECT key FROM descriptions ORDER BY hits ASC, updated_at ASC LIMIT ?",
+                (overflow,),
+            ).fetchall()
+            self._conn.executemany("DELETE FROM descriptions WHERE key = ?", evicted)
+            self._conn.commit()
+            for (key,) in evicted:
+                self._descriptions.pop(key, None)
+            logger.info("description_cache_evicted count=%s max_entries=%s", overflow, self.max_entries)
+
+    def stats(self) -> dict[str, int]:
+        return {"entries": len(self)}
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
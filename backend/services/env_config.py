@@ -0,0 +1,40 @@
+"""Environment variable helpers shared by the backend services."""
+
+from __future__ import annotations
+
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+
+def read_float_env(env_name: str, default: float) -> float:
+    raw_value = os.getenv(env_name, "").strip()
+    if not raw_value:
+        return default
+    try:
+        return float(raw_value)
+    except ValueError:
+        logger.warning("环境变量 %s=%r 不是有效浮点数，使用默认值 %s", env_name, raw_value, default)
+        return default
+
+
+def read_int_env(env_name: str, default: int) -> int:
+    raw_value = os.getenv(env_name, "").strip()
+    if not raw_value:
+        return default
+    try:
+        return int(raw_value)
+    except ValueError:
+        logger.warning("环境变量 %s=%r 不是有效整数，使用默认值 %s", env_name, raw_value, default)
+        return default
+
+
+def read_choice_env(env_name: str, default: str, choices: tuple[str, ...]) -> str:
+    raw_value = os.getenv(env_name, "").strip().lower()
+    if not raw_value:
+        return default
+    if raw_value in choices:
+        return raw_value
+    logger.warning("环境变量 %s=%r 不在可选值 %s 中，使用默认值 %s", env_name, raw_value, choices, default)
+    return default
@@ -0,0 +1,198 @@
+"""
+异步任务队列 - 提交后立即返回任务 ID，由进程内 worker 从有界队列中取出执行
+
+移动端网络不稳定时，20 秒的 VLM 调用期间连接可能断开。任务模式下分析在服务端继续进行，
+客户端凭任务 ID 轮询结果；结果保留 result_ttl_seconds 秒。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+import uuid
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+# 用于统计等待 / 执行耗时分位数的最近任务数
+_STATS_WINDOW = 512
+
+
+class JobQueueFull(Exception):
+    """队列已满，调用方应稍后重试"""
+
+
+@dataclass
+class Job:
+    id: str
+    payload: Any
+    size: int = 0
+    status: str = "queued"  # queued / running / done / failed
+    created_at: float = field(default_factory=time.monotonic)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    result: Any = None
+    error: Optional[str] = None
+
+    @property
+    def wait_ms(self) -> Optional[int]:
+        if self.started_at is None:
+            return round((time.monotonic() - self.created_at) * 1000) if self.status == "queued" else None
+        return round((self.started_at - self.created_at) * 1000)
+
+    @property
+    def service_ms(self) -> Optional[int]:
+        if self.started_at is None:
+            return None
+        return round(((self.finished_at or time.monotonic()) - self.started_at) * 1000)
+
+
+def _percentile(values: list[int], fraction: float) -> Optional[int]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, int(len(ordered) * fraction + 0.5) - 1)]
+
+
+class JobQueue:
+    """
+    有界任务队列 + 固定数量的 asyncio worker
+
+    - submit()：队列已满，或 max_bytes > 0 且加上尚未处理完的任务数据合计将超过 max_bytes 时抛 JobQueueFull；返回 Job，其 id 用于查询
+    - get()：已完成的任务在 result_ttl_seconds 后过期，过期或不存在时返回 None
+    - handler 抛出的异常记为 failed，不影响 worker 继续处理后续任务
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[Job], Awaitable[Any]],
+        workers: int,
+        max_queue: int,
+        result_ttl_seconds: float,
+        max_jobs: int = 10000,
+        max_bytes: int = 0,
+    ):
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.max_queue = max(1, max_queue)
+        self.result_ttl_seconds = result_ttl_seconds
+        self.max_jobs = max_jobs
+        self.max_bytes = max(0, max_bytes)
+        # 排队和处理中的任务数据（图片字节）合计，任务处理完释放数据后扣除
+        self.pending_bytes = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self._queue: asyncio.Queue[Job] = asyncio.Queue(self.max_queue)
+        self._jobs: OrderedDict[str, Job] = OrderedDict()
+        self._running = 0
+        self._wait_ms: deque[int] = deque(maxlen=_STATS_WINDOW)
+        self._service_ms: deque[int] = deque(maxlen=_STATS_WINDOW)
+        self._tasks: list[asyncio.Task] = []
+
+    def start(self) -> None:
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker(index)) for index in range(self.workers)]
+            logger.info("job_queue_started workers=%s max_queue=%s ttl_seconds=%s", self.workers, self.max_queue, self.result_ttl_seconds)
+
+    async def close(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def submit(self, payload: Any, size: int = 0) -> Job:
+        """size 为任务数据占用的字节数，计入 max_bytes"""
+        self._purge_expired()
+        # 没有未处理完的任务时总是接受，单个超过 max_bytes 的任务不会被永久拒绝
+        if self.max_bytes and self.pending_bytes and self.pending_bytes + size > self.max_bytes:
+            self.rejected += 1
+            raise JobQueueFull(f"任务队列数据已达上限（{self.max_bytes} 字节）")
+        job = Job(id=uuid.uuid4().hex, payload=payload, size=size)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise JobQueueFull(f"任务队列已满（{self.max_queue}）")
+        self.pending_bytes += size
+        self._jobs[job.id] = job
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        self._purge_expired()
+        return self._jobs.get(job_id)
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    def stats(self) -> dict[str, Any]:
+        wait_ms = list(self._wait_ms)
+        service_ms = list(self._service_ms)
+        return {
+            "workers": self.workers,
+            "busy_workers": self._running,
+            "queue_depth": self.depth,
+            "max_queue": self.max_queue,
+            "pending_bytes": self.pending_bytes,
+            "max_bytes": self.max_bytes,
+            "retained_jobs": len(self._jobs),
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "wait_ms_p50": _percentile(wait_ms, 0.5),
+            "wait_ms_p95": _percentile(wait_ms, 0.95),
+            "service_ms_p50": _percentile(service_ms, 0.5),
+            "service_ms_p95": _percentile(service_ms, 0.95),
+        }
+
+    async def _worker(self, index: int) -> None:
+        while True:
+            job = await self._queue.get()
+            job.status = "running"
+            job.started_at = time.monotonic()
+            self._running += 1
+            try:
+                job.result = await self.handler(job)
+                job.status = "done"
+                self.completed += 1
+            except asyncio.CancelledError:
+                job.status = "failed"
+                job.error = "服务关闭，任务已取消"
+                raise
+            except Exception as e:
+                logger.error("job_failed job_id=%s worker=%s error=%s", job.id, index, e, exc_info=True)
+                job.status = "failed"
+                job.error = str(e)
+                self.failed += 1
+            finally:
+                job.finished_at = time.monotonic()
+                # 处理完成后不再需要请求数据（图片字节），只保留结果
+                job.payload = None
+                self.pending_bytes -= job.size
+                self._running -= 1
+                self._queue.task_done()
+            self._wait_ms.append(job.wait_ms)
+            self._service_ms.append(job.service_ms)
+            logger.info(
+                "job_done job_id=%s worker=%s status=%s wait_ms=%s service_ms=%s queue_depth=%s",
+                job.id,
+                index,
+                job.status,
+                job.wait_ms,
+                job.service_ms,
+                self.depth,
+            )
+
+    def _purge_expired(self) -> None:
+        """删除过期的已完成任务；超过 max_jobs 时从最早的已完成任务开始删除"""
+        now = time.monotonic()
+        for job_id in list(self._jobs):
+            job = self._jobs[job_id]
+            if job.finished_at is None:
+                continue
+            if now - job.finished_at >= self.result_ttl_seconds or len(self._jobs) > self.max_jobs:
+                del self._jobs[job_id]
@@ -0,0 +1,169 @@
+"""
+日志输出方式 - 同步写出（默认），或经 QueueHandler / QueueListener 交给后台线程写出；按请求采样逐步骤的详细日志
+
+- LOG_MODE=queued：事件循环线程只把 LogRecord 放进有界队列，消息格式化（% 参数、异常堆栈）和写 stderr 都在监听线程完成；
+  队列满时丢弃并计数，不阻塞请求
+- LOG_DETAIL_SAMPLE_RATE：每个请求开始时按该比例决定是否输出逐步骤的 INFO 日志（含模型输出预览）；
+  未抽中的请求只保留 SUMMARY_EVENTS 中的汇总事件和所有 WARNING 及以上日志
+- 每个请求结束时输出一条 request_summary，fields 为 JSON：阶段耗时、token 用量、模型、缓存状态和结果
+"""
+
+from __future__ import annotations
+
+import atexit
+import json
+import logging
+import queue
+import random
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+
+# 未抽中详细日志的请求仍然输出的 INFO 事件（日志消息的第一个词）
+SUMMARY_EVENTS = frozenset(
+    {
+        "analyze_stage_timings",
+        "analyze_cache_hit",
+        "analyze_done",
+        "analyze_stream_done",
+        "analyze_batch_item_done",
+        "analyze_batch_done",
+        "job_analyze_done",
+        "job_done",
+        "vlm_hedge_fired",
+        "vlm_route_done",
+        "request_summary",
+    }
+)
+
+# None 表示不在请求内（启动、后台任务），日志不受采样影响
+_detail: ContextVar[Optional[bool]] = ContextVar("log_detail", default=None)
+_fields: ContextVar[Optional[dict]] = ContextVar("log_request_fields", default=None)
+_detail_sample_rate = 1.0
+_queue_handler: Optional["_DeferredQueueHandler"] = None
+_listener: Optional[QueueListener] = None
+
+
+class _JsonFields:
+    """在格式化时才序列化为 JSON（queued 模式下由监听线程完成）"""
+
+    __slots__ = ("fields",)
+
+    def __init__(self, fields: dict):
+        self.fields = fields
+
+    def __str__(self) -> str:
+        return json.dumps(self.fields, ensure_ascii=False, separators=(",", ":"), default=str)
+
+
+class RequestDetailFilter(logging.Filter):
+    """丢弃未抽中请求的逐步骤 INFO 日志"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or _detail.get() is not False:
+            return True
+        return isinstance(record.msg, str) and record.msg.partition(" ")[0] in SUMMARY_EVENTS
+
+
+class _DeferredQueueHandler(QueueHandler):
+    """同进程队列无需 pickle：不在调用线程格式化消息，原样入队；队列满时丢弃并计数"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def configure_logging(mode: str = "sync", detail_sample_rate: float = 1.0, queue_size: int = 10000) -> None:
+    """
+    配置根 logger（INFO）；已有的根 handler 保留，没有时与 logging.basicConfig 一样添加一个 stderr handler
+
+    queued 模式下这些 handler 移到 QueueListener 后面，进程退出时 atexit 停止监听线程并写完队列中剩余的日志。
+    """
+    global _detail_sample_rate, _queue_handler, _listener
+    _detail_sample_rate = min(1.0, max(0.0, detail_sample_rate))
+    # 格式中不使用调用位置、线程和进程字段（pid 已在 memory_snapshot 中），跳过 LogRecord 中的这些查找
+    # （见 logging HOWTO 的 Optimization 一节）；被采样丢弃的记录同样要付出创建 LogRecord 的开销
+    logging._srcfile = None
+    logging.logThreads = False
+    logging.logProcesses = False
+    logging.logMultiprocessing = False
+    root = logging.getLogger()
+    root.setLevel(logging.INFO)
+    handlers = root.handlers[:]
+    if not handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
+        handlers = [handler]
+    detail_filter = RequestDetailFilter()
+    if mode != "queued" or _listener is not None:
+        for handler in handlers:
+            handler.addFilter(detail_filter)
+            if handler not in root.handlers:
+                root.addHandler(handler)
+        return
+    for handler in handlers:
+        root.removeHandler(handler)
+    _queue_handler = _DeferredQueueHandler(queue.Queue(maxsize=max(1, queue_size)))
+    _queue_handler.addFilter(detail_filter)
+    root.addHandler(_queue_handler)
+    _listener = QueueListener(_queue_handler.queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
+
+def stop_logging() -> None:
+    """停止监听线程，写完队列中剩余的日志"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def logging_stats() -> dict:
+    return {
+        "mode": "queued" if _queue_handler is not None else "sync",
+        "detail_sample_rate": _detail_sample_rate,
+        "queue_depth": _queue_handler.queue.qsize() if _queue_handler is not None else 0,
+        "dropped": _queue_handler.dropped if _queue_handler is not None else 0,
+    }
+
+
+def begin_request(request_id: str, endpoint: str) -> None:
+    """请求开始时调用（在请求自己的任务 / 上下文中）：抽样决定是否输出逐步骤日志，并初始化 request_summary 字段"""
+    _detail.set(_detail_sample_rate >= 1.0 or random.random() < _detail_sample_rate)
+    _fields.set({"request_id": request_id, "endpoint": endpoint})
+
+
+def detail_enabled() -> bool:
+    """当前请求是否输出逐步骤日志；调用方据此跳过预览字符串的构建"""
+    return _detail.get() is not False
+
+
+def add_request_fields(**fields) -> None:
+    current = _fields.get()
+    if current is not None:
+        current.update(fields)
+
+
+def add_request_counts(**counts: int) -> None:
+    """累加型字段（如多次模型调用的 token 数）"""
+    current = _fields.get()
+    if current is not None:
+        for name, value in counts.items():
+            if value:
+                current[name] = current.get(name, 0) + value
+
+
+def log_request_summary(logger: logging.Logger, **fields) -> None:
+    """每个请求结束时输出一条结构化记录"""
+    summary = {**(_fields.get() or {}), **fields}
+    logger.info("request_summary request_id=%s fields=%s", summary.get("request_id", "-"), _JsonFields(summary))
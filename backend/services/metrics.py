@@ -0,0 +1,232 @@
+"""
+Prometheus 指标 - 计数器、仪表和直方图，GET /metrics 以文本格式（0.0.4）输出
+
+不依赖 prometheus_client：热路径上的一次记录只是一次字典查找加整数 / 浮点累加（直方图多一次 bisect），
+格式化全部在抓取时完成。所有记录都在事件循环线程中进行，不加锁。
+"""
+
+from __future__ import annotations
+
+import math
+from bisect import bisect_left
+from typing import Callable, Iterable, Optional
+
+# 请求各阶段耗时（秒）：从毫秒级的解码 / 解析到数十秒的 OpenRouter 调用
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0)
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def header(self) -> list[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+    def samples(self) -> list[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, *labelvalues: str, amount: float = 1) -> None:
+        self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def value(self, *labelvalues: str) -> float:
+        return self._values.get(labelvalues, 0)
+
+    def samples(self) -> list[str]:
+        return [
+            f"{self.name}{_labels(self.labelnames, values)} {_format_value(value)}"
+            for values, value in sorted(self._values.items())
+        ]
+
+
+class Gauge(_Metric):
+    """普通仪表；设置 callback 时在抓取时调用，返回单个值或 {标签值元组: 值}"""
+
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Iterable[str] = (),
+        callback: Optional[Callable[[], object]] = None,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[tuple[str, ...], float] = {}
+        self.callback = callback
+
+    def inc(self, *labelvalues: str, amount: float = 1) -> None:
+        self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def dec(self, *labelvalues: str, amount: float = 1) -> None:
+        self._values[labelvalues] = self._values.get(labelvalues, 0) - amount
+
+    def set(self, value: float, *labelvalues: str) -> None:
+        self._values[labelvalues] = value
+
+    def samples(self) -> list[str]:
+        values = self._values
+        if self.callback is not None:
+            current = self.callback()
+            values = current if isinstance(current, dict) else {(): current}
+        return [
+            f"{self.name}{_labels(self.labelnames, labelvalues)} {_format_value(value)}"
+            for labelvalues, value in sorted(values.items())
+            if value is not None
+        ]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Iterable[str] = (),
+        buckets: tuple[float, ...] = LATENCY_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # 每组标签：[各桶计数（非累计，最后一个为 +Inf）..., 总和]
+        self._series: dict[tuple[str, ...], list[float]] = {}
+
+    def observe(self, value: float, *labelvalues: str) -> None:
+        series = self._series.get(labelvalues)
+        if series is None:
+            series = self._series[labelvalues] = [0] * (len(self.buckets) + 2)
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def count(self, *labelvalues: str) -> int:
+        series = self._series.get(labelvalues)
+        return int(sum(series[:-1])) if series else 0
+
+    def samples(self) -> list[str]:
+        lines = []
+        for labelvalues, series in sorted(self._series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), series[:-1]):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labelvalues, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labelvalues)} {_format_value(series[-1])}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labelvalues)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"duplicate metric {metric.name}")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Iterable[str] = (),
+        callback: Optional[Callable[[], object]] = None,
+    ) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames, callback))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Iterable[str] = (),
+        buckets: tuple[float, ...] = LATENCY_BUCKETS,
+    ) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        lines: list[str] = []
+        for metric in self._metrics.values():
+            samples = metric.samples()
+            if samples:
+                lines.extend(metric.header())
+                lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+REGISTRY = Registry()
+
+# 各阶段耗时：decode / encode / prompt / openrouter / parse / describe / ocr / ocr_wait / index / validate / rules / vlm / total
+STAGE_SECONDS = REGISTRY.histogram(
+    "ingrediscan_stage_duration_seconds",
+    "Latency of analysis pipeline stages in seconds",
+    ("stage",),
+)
+ANALYSES = REGISTRY.counter(
+    "ingrediscan_analyses_total",
+    "Completed analyses by endpoint, cache status and error_type (none = success)",
+    ("endpoint", "cache", "error_type"),
+)
+IN_FLIGHT = REGISTRY.gauge(
+    "ingrediscan_in_flight",
+    "Analyses and OpenRouter calls currently in progress",
+    ("kind",),
+)
+JSON_PARSE = REGISTRY.counter(
+    "ingrediscan_json_parse_total",
+    "Model output parses by method (direct / tolerant / stream / failed)",
+    ("method",),
+)
+JSON_REPAIRS = REGISTRY.counter(
+    "ingrediscan_json_repairs_total",
+    "Repairs applied by the tolerant JSON parser, by repair type",
+    ("repair",),
+)
+OPENROUTER_CALLS = REGISTRY.counter(
+    "ingrediscan_openrouter_calls_total",
+    "OpenRouter chat completion calls (after retries) by model, call type and outcome",
+    ("model", "call", "outcome"),
+)
+OPENROUTER_TOKENS = REGISTRY.counter(
+    "ingrediscan_openrouter_tokens_total",
+    "Token usage reported by OpenRouter, by model, call type and kind (prompt / completion)",
+    ("model", "call", "kind"),
+)
+
+
+def observe_ms(stage: str, milliseconds: float) -> None:
+    STAGE_SECONDS.observe(milliseconds / 1000, stage)
@@ -0,0 +1,185 @@
+"""
+多模型路由 + 对冲请求 - 主模型在其历史 p90 耗时内没有返回时，向下一个模型发出对冲请求，取先得到有效结果的一方
+
+免费模型的延迟长尾很重：大部分请求几秒完成，少数要等几十秒。对冲只在主模型「已经比平时慢」时才触发，
+额外调用量约为 (1 - hedge_quantile)，换来尾延迟接近两个模型中较快的一方。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import math
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Generic, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+@dataclass
+class ModelStats:
+    """单个模型的延迟窗口和计数"""
+
+    latencies: deque[float]
+    calls: int = 0  # 发出的调用数（作为主调用或对冲调用）
+    hedged_calls: int = 0  # 作为对冲调用发出的次数
+    hedges_fired: int = 0  # 本模型调用超过阈值、触发下一个模型对冲的次数
+    wins: int = 0  # 返回被采用的有效结果的次数
+    invalid: int = 0  # 返回了无效结果（api_error / parse_error 等）的次数
+    cancelled: int = 0  # 输给其他模型被取消的次数
+
+
+def _quantile(values: list[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(len(ordered) * fraction) - 1))]
+
+
+class ModelRouter(Generic[T]):
+    """
+    按顺序排列的模型列表；run() 先调用第一个模型，依次在每个模型的对冲阈值到达时追加下一个模型
+
+    - 对冲阈值 = 该模型最近 window 次调用耗时的 hedge_quantile 分位数，限制在 [min_delay, max_delay] 内；
+      样本少于 min_samples 时使用 default_delay
+    - 某个调用返回无效结果时不等阈值，立即追加下一个模型（故障转移）
+    - 第一个有效结果胜出，其余调用被取消；被取消的调用以已耗时作为样本（真实耗时的下限），避免窗口只剩快样本；
+      无效结果（包括熔断器打开时的立即失败）不计入延迟样本
+    - 全部无效时返回第一个模型的结果
+    """
+
+    def __init__(
+        self,
+        models: list[str],
+        hedge_quantile: float = 0.9,
+        default_delay: float = 10.0,
+        min_delay: float = 1.0,
+        max_delay: float = 60.0,
+        min_samples: int = 20,
+        window: int = 200,
+    ):
+        if not models:
+            raise ValueError("models must not be empty")
+        self.models = list(dict.fromkeys(models))
+        self.hedge_quantile = hedge_quantile
+        self.default_delay = default_delay
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.min_samples = min_samples
+        self._stats = {model: ModelStats(latencies=deque(maxlen=window)) for model in self.models}
+
+    @property
+    def primary(self) -> str:
+        return self.models[0]
+
+    def hedge_delay(self, model: str) -> float:
+        latencies = self._stats[model].latencies
+        if len(latencies) < self.min_samples:
+            return self.default_delay
+        return min(self.max_delay, max(self.min_delay, _quantile(list(latencies), self.hedge_quantile)))
+
+    def record(self, model: str, seconds: float) -> None:
+        self._stats[model].latencies.append(seconds)
+
+    async def run(
+        self,
+        call: Callable[[str], Awaitable[T]],
+        is_valid: Callable[[T], bool],
+        request_id: str = "-",
+    ) -> tuple[T, str]:
+        """
+        Returns:
+            (结果, 给出结果的模型)
+        """
+        if len(self.models) == 1:
+            model = self.primary
+            stats = self._stats[model]
+            stats.calls += 1
+            start = time.perf_counter()
+            result = await call(model)
+            if is_valid(result):
+                self.record(model, time.perf_counter() - start)
+                stats.wins += 1
+            else:
+                stats.invalid += 1
+            return result, model
+
+        tasks: dict[asyncio.Task, tuple[str, float]] = {}
+        results: dict[str, T] = {}
+        next_index = 0
+
+        def launch(hedge: bool) -> str:
+            nonlocal next_index
+            model = self.models[next_index]
+            next_index += 1
+            stats = self._stats[model]
+            stats.calls += 1
+            stats.hedged_calls += hedge
+            tasks[asyncio.ensure_future(call(model))] = (model, time.perf_counter())
+            return model
+
+        current = launch(hedge=False)
+        deadline = time.perf_counter() + self.hedge_delay(current)
+        try:
+            while tasks:
+                timeout = max(0.0, deadline - time.perf_counter()) if next_index < len(self.models) else None
+                done, _ = await asyncio.wait(tasks, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    model, started = tasks.pop(task)
+                    result = task.result()
+                    if is_valid(result):
+                        self.record(model, time.perf_counter() - started)
+                        self._stats[model].wins += 1
+                        self._log_done(request_id, model, next_index)
+                        return result, model
+                    self._stats[model].invalid += 1
+                    results[model] = result
+                if next_index < len(self.models) and (not done or not tasks):
+                    # 超过阈值仍在等待（对冲），或在途调用全部无效（故障转移）
+                    if not done:
+                        self._stats[current].hedges_fired += 1
+                    reason = "slow" if not done else "invalid"
+                    current = launch(hedge=True)
+                    deadline = time.perf_counter() + self.hedge_delay(current)
+                    logger.info(
+                        "vlm_hedge_fired request_id=%s model=%s reason=%s in_flight=%s",
+                        request_id,
+                        current,
+                        reason,
+                        len(tasks),
+                    )
+        finally:
+            for task, (model, started) in tasks.items():
+                task.cancel()
+                self._stats[model].cancelled += 1
+                self.record(model, time.perf_counter() - started)
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+        self._log_done(request_id, "-", next_index)
+        fallback_model = self.primary if self.primary in results else next(iter(results))
+        return results[fallback_model], fallback_model
+
+    def _log_done(self, request_id: str, winner: str, launched: int) -> None:
+        logger.info("vlm_route_done request_id=%s winner=%s launched=%s", request_id, winner, launched)
+
+    def stats(self) -> dict[str, dict]:
+        """每个模型的调用数、对冲率、胜率和当前对冲阈值，用于调整 hedge_quantile 和模型顺序"""
+        report = {}
+        for model, stats in self._stats.items():
+            latencies = list(stats.latencies)
+            report[model] = {
+                "calls": stats.calls,
+                "hedged_calls": stats.hedged_calls,
+                "hedges_fired": stats.hedges_fired,
+                "hedge_rate": round(stats.hedges_fired / stats.calls, 3) if stats.calls else None,
+                "wins": stats.wins,
+                "win_rate": round(stats.wins / stats.calls, 3) if stats.calls else None,
+                "invalid": stats.invalid,
+                "cancelled": stats.cancelled,
+                "latency_p50_ms": round(_quantile(latencies, 0.5) * 1000) if latencies else None,
+                "latency_p90_ms": round(_quantile(latencies, 0.9) * 1000) if latencies else None,
+                "hedge_delay_ms": round(self.hedge_delay(model) * 1000),
+            }
+        return report
@@ -0,0 +1,309 @@
+"""
+OCR 进程池 - 固定数量的预热工作进程，各自持有一个 RapidOCR 实例
+
+ONNX 推理是同步的 CPU 密集操作，放在主进程里会阻塞事件循环，模型本身也会推高主进程内存。
+进程池把推理隔离到子进程中：
+1. 启动时预先创建并预热全部工作进程（加载模型 + 一次空推理）
+2. 等待队列有上限，超出时立即拒绝，而不是无限堆积
+3. 单次调用超时后终止并替换对应工作进程
+4. 工作进程处理 N 个任务或常驻内存超过上限后回收重建，防止内存缓慢上涨
+"""
+
+from __future__ import annotations
+
+import asyncio
+import io
+import logging
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+from PIL import Image
+
+from services.runtime_logging import elapsed_ms, now_ms, rss_kb
+
+logger = logging.getLogger(__name__)
+
+
+class OCRPoolError(Exception):
+    """OCR 进程池无法完成本次调用；reason 用于日志（busy / timeout / worker_crashed / unavailable）"""
+
+    def __init__(self, reason: str, message: str = ""):
+        super().__init__(message or reason)
+        self.reason = reason
+
+
+def _default_engine_factory():
+    from services.ocr_service import OCRService
+
+    return OCRService()
+
+
+def _worker_main(conn, engine_factory: Callable) -> None:
+    """工作进程入口：初始化并预热引擎，然后循环处理 (图片字节, request_id) 任务"""
+    try:
+        engine = engine_factory()
+        if engine.available:
+            engine.extract_text_sync(Image.new("RGB", (64, 64), "white"), "warmup")
+        conn.send(("ready", engine.available, rss_kb()))
+    except Exception as e:  # 初始化失败时告知父进程，避免其一直等待
+        conn.send(("error", f"{type(e).__name__}: {e}", rss_kb()))
+        return
+
+    while True:
+        try:
+            job = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            return
+        if job is None:
+            return
+        image_data, request_id = job
+        try:
+            image = Image.open(io.BytesIO(image_data))
+            if image.mode != "RGB":
+                image = image.convert("RGB")
+            conn.send(("ok", engine.extract_text_sync(image, request_id), rss_kb()))
+        except Exception as e:
+            conn.send(("error", f"{type(e).__name__}: {e}", rss_kb()))
+
+
+class _Worker:
+    """父进程侧的工作进程句柄；所有阻塞方法都在线程池中调用"""
+
+    def __init__(self, context, engine_factory: Callable, index: int):
+        parent_conn, child_conn = context.Pipe()
+        self.index = index
+        self.process = context.Process(
+            target=_worker_main,
+            args=(child_conn, engine_factory),
+            name=f"ocr-worker-{index}",
+            daemon=True,
+        )
+        self.process.start()
+        child_conn.close()
+        self.conn = parent_conn
+        self.jobs = 0
+        self.rss_kb = 0
+
+    def wait_ready(self, timeout: float) -> bool:
+        """等待预热完成，返回引擎是否可用"""
+        if not self.conn.poll(timeout):
+            raise OCRPoolError("timeout", f"ocr-worker-{self.index} 预热超时")
+        status, available, self.rss_kb = self.conn.recv()
+        if status != "ready":
+            raise OCRPoolError("unavailable", f"ocr-worker-{self.index} 初始化失败: {available}")
+        return bool(available)
+
+    def call(self, image_data: bytes, request_id: str, timeout: float) -> str:
+        try:
+            self.conn.send((image_data, request_id))
+            if not self.conn.poll(timeout):
+                raise OCRPoolError("timeout", f"OCR 超过 {timeout}s 未完成")
+            status, payload, self.rss_kb = self.conn.recv()
+        except (EOFError, OSError) as e:
+            raise OCRPoolError("worker_crashed", f"ocr-worker-{self.index} 异常退出: {e}") from e
+        self.jobs += 1
+        if status != "ok":
+            raise OCRPoolError("worker_error", payload)
+        return payload
+
+    def stop(self) -> None:
+        try:
+            self.conn.send(None)
+        except (OSError, ValueError):
+            pass
+        self.process.join(timeout=2)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join(timeout=2)
+        self.conn.close()
+
+
+class OCRProcessPool:
+    """
+    固定大小的 OCR 进程池
+
+    extract_text() 在空闲工作进程上执行一次 OCR；没有空闲进程时排队等待，
+    排队数达到 max_queue 时抛 OCRPoolError("busy")。工作进程在线程中阻塞等待结果，事件循环不受影响。
+    """
+
+    def __init__(
+        self,
+        workers: int,
+        max_queue: int,
+        timeout_seconds: float,
+        max_jobs_per_worker: int = 0,
+        max_worker_rss_mb: int = 0,
+        start_timeout_seconds: float = 120.0,
+        engine_factory: Callable = _default_engine_factory,
+    ):
+        self.workers = max(1, workers)
+        self.max_queue = max(0, max_queue)
+        self.timeout_seconds = timeout_seconds
+        self.max_jobs_per_worker = max_jobs_per_worker
+        self.max_worker_rss_kb = max_worker_rss_mb * 1024
+        self.start_timeout_seconds = start_timeout_seconds
+        self._engine_factory = engine_factory
+        # spawn：不复制 uvicorn 主进程的事件循环、线程和内存
+        self._context = multiprocessing.get_context("spawn")
+        self._executor = ThreadPoolExecutor(max_workers=self.workers * 2, thread_name_prefix="ocr-pool")
+        self._idle: Optional[asyncio.Queue[_Worker]] = None
+        self._all: set[_Worker] = set()
+        self._next_index = 0
+        self._waiting = 0
+        self._ready = False
+        self._closed = False
+        self._stats = {"jobs": 0, "errors": 0, "timeouts": 0, "rejected": 0, "recycled": 0}
+
+    @property
+    def ready(self) -> bool:
+        return self._ready and not self._closed
+
+    async def start(self) -> None:
+        """创建并预热全部工作进程；引擎不可用（未安装 RapidOCR）时关闭进程池"""
+        start_ms = now_ms()
+        self._idle = asyncio.Queue()
+        workers = await asyncio.gather(*(self._spawn() for _ in range(self.workers)), return_exceptions=True)
+        started = [worker for worker in workers if isinstance(worker, _Worker)]
+        for worker in workers:
+            if not isinstance(worker, _Worker):
+                logger.error("ocr_pool_worker_start_failed error=%r", worker)
+        if not started:
+            logger.error("ocr_pool_unavailable elapsed_ms=%s", elapsed_ms(start_ms))
+            await self.close()
+            return
+        for worker in started:
+            self._idle.put_nowait(worker)
+        self._ready = True
+        logger.info(
+            "ocr_pool_ready workers=%s elapsed_ms=%s worker_rss_kb=%s",
+            len(started),
+            elapsed_ms(start_ms),
+            [worker.rss_kb for worker in started],
+        )
+
+    async def _spawn(self) -> _Worker:
+        loop = asyncio.get_running_loop()
+        self._next_index += 1
+        worker = await loop.run_in_executor(
+            self._executor, _Worker, self._context, self._engine_factory, self._next_index
+        )
+        self._all.add(worker)
+        try:
+            available = await loop.run_in_executor(self._executor, worker.wait_ready, self.start_timeout_seconds)
+        except BaseException:
+            await self._discard(worker)
+            raise
+        if not available:
+            await self._discard(worker)
+            raise OCRPoolError("unavailable", "RapidOCR 不可用")
+        return worker
+
+    async def _discard(self, worker: _Worker) -> None:
+        self._all.discard(worker)
+        await asyncio.get_running_loop().run_in_executor(self._executor, worker.stop)
+
+    async def _replace(self, worker: _Worker, reason: str) -> None:
+        """停止工作进程并启动替代进程，完成预热后放回空闲队列"""
+        logger.info(
+            "ocr_pool_recycle worker=%s reason=%s jobs=%s rss_kb=%s",
+            worker.index,
+            reason,
+            worker.jobs,
+            worker.rss_kb,
+        )
+        self._stats["recycled"] += 1
+        await self._discard(worker)
+        if self._closed:
+            return
+        try:
+            replacement = await self._spawn()
+        except Exception as e:
+            logger.error("ocr_pool_respawn_failed error=%s alive_workers=%s", e, len(self._all))
+            return
+        if self._closed:
+            await self._discard(replacement)
+            return
+        self._idle.put_nowait(replacement)
+
+    def _recycle_reason(self, worker: _Worker) -> Optional[str]:
+        if self.max_jobs_per_worker and worker.jobs >= self.max_jobs_per_worker:
+            return "max_jobs"
+        if self.max_worker_rss_kb and worker.rss_kb >= self.max_worker_rss_kb:
+            return "max_rss"
+        return None
+
+    async def extract_text(self, image_data: bytes, request_id: str = "-") -> str:
+        """
+        在工作进程中识别图片文字；失败时抛 OCRPoolError
+
+        timeout_seconds 分别约束排队等待和推理执行两段时间。
+        """
+        if not self.ready:
+            raise OCRPoolError("unavailable", "OCR 进程池未就绪")
+        # 已在等待的调用中，超出空闲进程数的部分才算排队
+        if self._waiting - self._idle.qsize() >= self.max_queue:
+            self._stats["rejected"] += 1
+            raise OCRPoolError("busy", f"OCR 等待队列已满（{self.max_queue}）")
+
+        # 排队时间同样受超时约束，避免工作进程全部重建失败时调用方无限等待
+        self._waiting += 1
+        try:
+            worker = await asyncio.wait_for(self._idle.get(), timeout=self.timeout_seconds)
+        except asyncio.TimeoutError:
+            self._stats["timeouts"] += 1
+            raise OCRPoolError("timeout", f"等待空闲 OCR 进程超过 {self.timeout_seconds}s") from None
+        finally:
+            self._waiting -= 1
+
+        # 调用方被取消（如客户端断开）时，任务仍在工作进程中执行完毕并负责归还进程
+        job = asyncio.ensure_future(self._run_job(worker, image_data, request_id))
+        return await asyncio.shield(job)
+
+    async def _run_job(self, worker: _Worker, image_data: bytes, request_id: str) -> str:
+        loop = asyncio.get_running_loop()
+        self._stats["jobs"] += 1
+        try:
+            text = await loop.run_in_executor(
+                self._executor, worker.call, image_data, request_id, self.timeout_seconds
+            )
+        except OCRPoolError as e:
+            self._stats["errors"] += 1
+            if e.reason == "worker_error":
+                self._release(worker)
+            else:
+                if e.reason == "timeout":
+                    self._stats["timeouts"] += 1
+                asyncio.ensure_future(self._replace(worker, e.reason))
+            raise
+        self._release(worker)
+        return text
+
+    def _release(self, worker: _Worker) -> None:
+        reason = self._recycle_reason(worker)
+        if reason is not None:
+            asyncio.ensure_future(self._replace(worker, reason))
+        elif self._closed:
+            asyncio.ensure_future(self._discard(worker))
+        else:
+            self._idle.put_nowait(worker)
+
+    def stats(self) -> dict:
+        return {
+            "workers": len(self._all),
+            "idle": self._idle.qsize() if self._idle is not None else 0,
+            "waiting": self._waiting,
+            **self._stats,
+        }
+
+    async def close(self) -> None:
+        self._closed = True
+        self._ready = False
+        workers = list(self._all)
+        self._all.clear()
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(
+            *(loop.run_in_executor(self._executor, worker.stop) for worker in workers),
+            return_exceptions=True,
+        )
+        self._executor.shutdown(wait=False)
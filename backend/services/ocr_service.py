@@ -2,6 +2,7 @@
 OCR 服务 - 使用 RapidOCR 进行文字提取
 """
 
+import asyncio
 import logging
 from PIL import Image
 from typing import Optional
@@ -40,9 +41,13 @@ class OCRService:
         else:
             logger.warning("RapidOCR 不可用，将返回空字符串")
     
+    @property
+    def available(self) -> bool:
+        return self.ocr_engine is not None
+
     async def extract_text(self, image: Image.Image, request_id: str = "-") -> str:
         """
-        从图片中提取文字
+        从图片中提取文字（在线程中执行推理，不阻塞事件循环）
         
         Args:
             image: PIL Image 对象
@@ -50,6 +55,10 @@ class OCRService:
         Returns:
             提取的文字字符串，如果 OCR 失败则返回空字符串
         """
+        return await asyncio.to_thread(self.extract_text_sync, image, request_id)
+
+    def extract_text_sync(self, image: Image.Image, request_id: str = "-") -> str:
+        """同步执行 OCR，供线程或 OCR 进程池的工作进程调用"""
         if not self.ocr_engine:
             logger.warning("ocr_unavailable request_id=%s %s", request_id, memory_snapshot())
             return ""
@@ -0,0 +1,179 @@
+"""
+OCR 事后校验 - 用标签 OCR 文字核对并补全模型返回的成分列表
+
+并行流水线中 OCR 不再作为提示词前缀，而是在 VLM 返回后用于：
+1. 统计模型成分在 OCR 配料表中的覆盖率（日志指标）
+2. 补上 OCR 识别到、模型遗漏的 E 编号添加剂
+3. 覆盖率足够高（OCR 与模型读的是同一份配料表）时，补上模型遗漏的其他配料
+"""
+
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass, field
+from difflib import SequenceMatcher
+from typing import Optional
+
+from services.vlm_service import AnalyzeResponse, IngredientDetail
+
+# 覆盖率达到该值才补充非 E 编号配料，避免把 OCR 噪声或翻译差异当成遗漏
+MIN_COVERAGE_FOR_ADDITIONS = 0.5
+MAX_ADDITIONS = 10
+FUZZY_MATCH_RATIO = 0.8
+ADDED_DESCRIPTION = "标签 OCR 识别到该成分，模型结果中未列出"
+
+_SECTION_START_RE = re.compile(r"(配料表|配料|原料|成分表|ingredients?|zutaten|ingrédients)\s*[:：]?", re.IGNORECASE)
+_SECTION_END_RE = re.compile(
+    r"营养成分|营养标签|净含量|保质期|生产日期|贮存|储存|致敏|过敏原|可能含有|产地|产品标准|执行标准|生产许可|生产商|制造商"
+    r"|nutrition|allergen|allergy advice|may contain|best before|store in|storage|net w"
+    # 行首或句首的「Contains: milk」「CONTAINS MILK, SOY」是过敏原声明；「CONTAINS 2% OR LESS OF …」仍属于配料表
+    r"|(?:^|(?<=[.。;；]))[ \t]*contains\b(?![ \t]*[:：]?[ \t]*(?:\d|less\b))",
+    re.IGNORECASE | re.MULTILINE,
+)
+_SPLIT_RE = re.compile(r"[,，、;；。()（）\[\]【】:：\n]|\.(?=\s|$)")
+# 「单,双甘油脂肪酸酯」是一个配料，拆分前先去掉中间的逗号
+_MONO_DI_RE = re.compile(r"单\s*[,，、]\s*双")
+# 功能类别名（如「防腐剂（苯甲酸钠）」中的「防腐剂」）不是配料本身
+_FUNCTION_CLASSES = frozenset(
+    {
+        "preservative", "preservatives", "colour", "colours", "color", "colors", "emulsifier", "emulsifiers",
+        "antioxidant", "antioxidants", "sweetener", "sweeteners", "acidity regulator", "acidity regulators",
+        "raising agent", "raising agents", "stabiliser", "stabilisers", "stabilizer", "stabilizers",
+        "thickener", "thickeners", "flavour enhancer", "flavour enhancers", "flavor enhancer", "acid",
+        "防腐剂", "着色剂", "色素", "乳化剂", "抗氧化剂", "甜味剂", "增稠剂", "膨松剂", "酸度调节剂", "稳定剂",
+        "增味剂", "水分保持剂", "稳定剂和凝固剂", "食品添加剂",
+    }
+)
+_PERCENT_RE = re.compile(r"\d+(\.\d+)?\s*%")
+# 「CONTAINS 2% OR LESS OF SALT, …」中的引导语不是配料
+_MINOR_INGREDIENTS_RE = re.compile(
+    r"contains\s+(?:less than\s+)?\d+(?:\.\d+)?\s*%\s*(?:or less\s+)?of(?:\s+each of)?(?:\s+the following)?\s*[:：]?",
+    re.IGNORECASE,
+)
+_E_NUMBER_RE = re.compile(r"(?<![A-Za-z0-9])[Ee]\s?-?(\d{3,4})([a-zA-Z]?)(?!\d)")
+_NORMALIZE_RE = re.compile(r"[\s\-_'’.·*]+")
+_CJK_RE = re.compile(r"[㐀-鿿]")
+
+
+@dataclass
+class OCRValidationReport:
+    ocr_ingredients: int = 0
+    coverage: Optional[float] = None
+    added: list[str] = field(default_factory=list)
+    missing_e_numbers: list[str] = field(default_factory=list)
+
+
+def normalize_e_number(digits: str, suffix: str = "") -> str:
+    return f"E{digits}{suffix.lower()}"
+
+
+def find_e_numbers(text: str) -> list[str]:
+    """按出现顺序返回文本中的 E 编号（去重，统一为 E102 / E150d 格式）"""
+    seen: dict[str, None] = {}
+    for match in _E_NUMBER_RE.finditer(text or ""):
+        seen.setdefault(normalize_e_number(match.group(1), match.group(2)), None)
+    return list(seen)
+
+
+def _join_lines(text: str) -> str:
+    """合并 OCR 断行：中文行之间直接拼接，其他情况补空格"""
+    joined = ""
+    for line in (text or "").splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if joined and not (_CJK_RE.match(joined[-1]) and _CJK_RE.match(line[0])):
+            joined += " "
+        joined += line
+    return joined
+
+
+def extract_ingredient_section(ocr_text: str) -> Optional[str]:
+    """
+    取出配料表段落；找不到「配料 / Ingredients」等标题时返回 None
+
+    查找段落结尾时保留换行（contains 只在行首或句首才算标题），取出后再合并断行。
+    """
+    text = "\n".join(line.strip() for line in (ocr_text or "").splitlines() if line.strip())
+    start = _SECTION_START_RE.search(text)
+    if start is None:
+        return None
+    section = text[start.end():]
+    end = _SECTION_END_RE.search(section)
+    return _join_lines(section[:end.start()] if end else section)
+
+
+def split_ingredients(section: str) -> list[str]:
+    """把配料表段落拆成配料名（去掉百分比、功能类别名、纯数字和过短的片段）"""
+    items: list[str] = []
+    section = _PERCENT_RE.sub("", _MINOR_INGREDIENTS_RE.sub(",", section))
+    for token in _SPLIT_RE.split(_MONO_DI_RE.sub("单双", section)):
+        token = token.strip(" .-*")
+        if token.lower() in _FUNCTION_CLASSES:
+            continue
+        # 中文配料可以是单字（如「水」），拉丁字母配料至少两个字符
+        if not any(ch.isalpha() for ch in token) or (len(token) < 2 and not _CJK_RE.match(token)):
+            continue
+        items.append(token)
+    return items
+
+
+def _normalize(name: str) -> str:
+    return _NORMALIZE_RE.sub("", name).lower()
+
+
+def _matches(model_name: str, ocr_name: str) -> bool:
+    a, b = _normalize(model_name), _normalize(ocr_name)
+    if not a or not b:
+        return False
+    if a == b:
+        return True
+    if min(len(a), len(b)) >= 2 and (a in b or b in a):
+        return True
+    return SequenceMatcher(None, a, b).ratio() >= FUZZY_MATCH_RATIO
+
+
+def validate_with_ocr(result: AnalyzeResponse, ocr_text: str) -> tuple[AnalyzeResponse, OCRValidationReport]:
+    """
+    用 OCR 文字校验模型结果
+
+    Returns:
+        (补全后的结果, 校验报告)；结果带 error、OCR 为空时原样返回
+    """
+    report = OCRValidationReport()
+    if result.error or not ocr_text or not ocr_text.strip():
+        return result, report
+
+    model_names = list(result.full_ingredients)
+    model_text = " ".join(model_names + [risk.name for risk in result.risks])
+    model_e_numbers = set(find_e_numbers(model_text))
+    report.missing_e_numbers = [code for code in find_e_numbers(ocr_text) if code not in model_e_numbers]
+    additions = list(report.missing_e_numbers)
+
+    section = extract_ingredient_section(ocr_text)
+    if section is not None:
+        ocr_items = split_ingredients(section)
+        report.ocr_ingredients = len(ocr_items)
+        if ocr_items and model_names:
+            matched = sum(1 for name in model_names if any(_matches(name, item) for item in ocr_items))
+            report.coverage = round(matched / len(model_names), 3)
+            if report.coverage >= MIN_COVERAGE_FOR_ADDITIONS:
+                for item in ocr_items:
+                    if find_e_numbers(item):
+                        continue  # E 编号已在上面处理
+                    if not any(_matches(name, item) for name in model_names + additions):
+                        additions.append(item)
+
+    report.added = additions[:MAX_ADDITIONS]
+    if not report.added:
+        return result, report
+
+    details = list(result.ingredients_detail or [])
+    details.extend(IngredientDetail(name=name, description=ADDED_DESCRIPTION) for name in report.added)
+    corrected = result.model_copy(
+        update={
+            "full_ingredients": model_names + report.added,
+            "ingredients_detail": details,
+        }
+    )
+    return corrected, report
@@ -0,0 +1,110 @@
+"""
+感知哈希 - 用 dHash 指纹 + 多索引哈希识别同一商品的近似重复照片
+"""
+
+from __future__ import annotations
+
+import io
+import threading
+from collections import OrderedDict
+
+from PIL import Image
+
+HASH_SIZE = 8
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+def dhash_fingerprint(image_data: bytes, hash_size: int = HASH_SIZE) -> int:
+    """
+    计算图片的 64 位 dHash 指纹
+
+    单独从原始字节打开图片并使用 JPEG draft 模式缩小解码，
+    不会触发请求主流程中那张图片的完整像素解码。
+    """
+    image = Image.open(io.BytesIO(image_data))
+    image.draft("L", (hash_size * 8, hash_size * 8))
+    gray = image.convert("L").resize((hash_size + 1, hash_size), Image.Resampling.BILINEAR)
+    # 只有 hash_size² 次比较，逐字节比较即可，不需要为此在启动时导入 numpy
+    pixels = gray.tobytes()
+    width = hash_size + 1
+    value = 0
+    for row in range(0, hash_size * width, width):
+        for col in range(row, row + hash_size):
+            value = (value << 1) | (pixels[col + 1] > pixels[col])
+    # 与按字节打包的结果一致：位数不是 8 的倍数时末尾补零
+    return value << (-(hash_size * hash_size) % 8)
+
+
+class NearDuplicateIndex:
+    """
+    多索引哈希（multi-index hashing）汉明距离索引，指纹 -> 结果缓存键
+
+    把 64 位指纹切成 max_distance + 1 段：两个指纹距离不超过 max_distance 时，
+    由鸽巢原理至少有一段完全相同，因此只需校验与查询指纹某段相同的候选。
+    超过容量时按 LRU 淘汰最久未写入的指纹。
+    """
+
+    def __init__(self, max_entries: int, max_distance: int):
+        self.max_entries = max(0, max_entries)
+        self.max_distance = min(max_distance, 63)
+        chunk_count = max(1, self.max_distance + 1)
+        bounds = [round(i * 64 / chunk_count) for i in range(chunk_count + 1)]
+        self._chunks = [(bounds[i], (1 << (bounds[i + 1] - bounds[i])) - 1) for i in range(chunk_count)]
+        self._tables: list[dict[int, set[int]]] = [{} for _ in self._chunks]
+        self._entries: OrderedDict[int, str] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 and self.max_distance >= 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def add(self, fingerprint: int, key: str) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            if fingerprint in self._entries:
+                self._entries[fingerprint] = key
+                self._entries.move_to_end(fingerprint)
+                return
+            self._entries[fingerprint] = key
+            for table, (shift, mask) in zip(self._tables, self._chunks):
+                table.setdefault((fingerprint >> shift) & mask, set()).add(fingerprint)
+            while len(self._entries) > self.max_entries:
+                oldest, _ = self._entries.popitem(last=False)
+                self._discard(oldest)
+
+    def search(self, fingerprint: int) -> list[tuple[int, str]]:
+        """返回距离不超过阈值的 (distance, key)，按距离升序"""
+        if not self.enabled:
+            return []
+        matches: list[tuple[int, str]] = []
+        seen: set[int] = set()
+        with self._lock:
+            for table, (shift, mask) in zip(self._tables, self._chunks):
+                bucket = table.get((fingerprint >> shift) & mask)
+                if not bucket:
+                    continue
+                for candidate in bucket:
+                    if candidate in seen:
+                        continue
+                    seen.add(candidate)
+                    distance = hamming_distance(fingerprint, candidate)
+                    if distance <= self.max_distance:
+                        matches.append((distance, self._entries[candidate]))
+        matches.sort()
+        return matches
+
+    def _discard(self, fingerprint: int) -> None:
+        for table, (shift, mask) in zip(self._tables, self._chunks):
+            chunk = (fingerprint >> shift) & mask
+            bucket = table.get(chunk)
+            if bucket is not None:
+                bucket.discard(fingerprint)
+                if not bucket:
+                    del table[chunk]
@@ -0,0 +1,212 @@
+"""
+OpenRouter 调用的容错层 - 带抖动的指数退避重试 + 按模型的熔断器
+
+- 重试：只重试瞬时错误（连接失败、超时、408 / 409 / 429 / 5xx），退避时间为 full jitter（0 ~ base × 2^n 之间随机），
+  429 带 Retry-After 时按其等待；所有尝试加退避的总时长不超过预算
+- 熔断：某个模型连续 failure_threshold 次瞬时错误后打开，recovery_seconds 内直接失败（不再等待超时）；
+  之后进入半开状态，只放行一个探测请求，成功则关闭，失败则重新打开
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import random
+import time
+from typing import Awaitable, Callable, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+_TRANSIENT_STATUS = frozenset({408, 409, 429, 500, 502, 503, 504})
+
+
+class CircuitOpenError(Exception):
+    """熔断器打开时直接失败"""
+
+    def __init__(self, name: str, retry_in: float):
+        super().__init__(f"OpenRouter 模型 {name} 熔断中，{retry_in:.0f} 秒后重新探测")
+        self.name = name
+        self.retry_in = retry_in
+
+
+class RetryBudgetExceeded(Exception):
+    """总时长预算用完"""
+
+
+def status_code_of(error: Exception) -> Optional[int]:
+    return getattr(error, "status_code", None)
+
+
+def is_transient(error: Exception) -> bool:
+    """连接错误 / 超时（无状态码的 OpenAI SDK 异常或 httpx 异常）和可重试的状态码"""
+    if isinstance(error, (asyncio.TimeoutError, RetryBudgetExceeded)):
+        return True
+    status = status_code_of(error)
+    if status is not None:
+        return status in _TRANSIENT_STATUS
+    module = type(error).__module__
+    return module.startswith("openai") or module.startswith("httpx") or isinstance(error, OSError)
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    value = headers.get("retry-after")
+    try:
+        return max(0.0, float(value)) if value is not None else None
+    except ValueError:
+        return None
+
+
+class CircuitBreaker:
+    """按模型的熔断器（单事件循环内使用，无需加锁）"""
+
+    def __init__(self, name: str, failure_threshold: int = 5, recovery_seconds: float = 30.0):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.recovery_seconds = recovery_seconds
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_count = 0
+        self.rejected = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+
+    def before_call(self) -> None:
+        """调用前检查；打开状态或半开状态已有探测请求时抛 CircuitOpenError"""
+        if self.state == OPEN:
+            waited = time.monotonic() - self._opened_at
+            if waited < self.recovery_seconds:
+                self.rejected += 1
+                raise CircuitOpenError(self.name, self.recovery_seconds - waited)
+            self._transition(HALF_OPEN)
+        if self.state == HALF_OPEN:
+            if self._probe_in_flight:
+                self.rejected += 1
+                raise CircuitOpenError(self.name, 0)
+            self._probe_in_flight = True
+
+    def record_success(self) -> None:
+        self.consecutive_failures = 0
+        self._probe_in_flight = False
+        if self.state != CLOSED:
+            self._transition(CLOSED)
+
+    def record_failure(self) -> None:
+        self.consecutive_failures += 1
+        self._probe_in_flight = False
+        if self.state == HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            self._opened_at = time.monotonic()
+            if self.state != OPEN:
+                self.opened_count += 1
+                self._transition(OPEN)
+
+    def release(self) -> None:
+        """调用被取消（如对冲请求输掉）或以非瞬时错误结束，不计成功也不计失败；只释放半开状态的探测名额"""
+        self._probe_in_flight = False
+
+    def _transition(self, state: str) -> None:
+        logger.warning(
+            "circuit_state_changed name=%s from=%s to=%s consecutive_failures=%s",
+            self.name,
+            self.state,
+            state,
+            self.consecutive_failures,
+        )
+        self.state = state
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "opened_count": self.opened_count,
+            "rejected": self.rejected,
+        }
+
+
+class RetryPolicy:
+    def __init__(
+        self,
+        max_attempts: int = 3,
+        base_delay: float = 0.5,
+        max_delay: float = 8.0,
+        budget_seconds: float = 60.0,
+    ):
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budget_seconds = budget_seconds
+        self.retries = 0
+
+    def backoff(self, attempt: int, error: Exception) -> float:
+        """第 attempt 次失败后的等待秒数：429 的 Retry-After 优先，否则 full jitter"""
+        hinted = retry_after_seconds(error)
+        if hinted is not None:
+            return hinted
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+    async def call(
+        self,
+        func: Callable[[], Awaitable[T]],
+        breaker: Optional[CircuitBreaker] = None,
+        request_id: str = "-",
+    ) -> T:
+        """
+        执行 func，瞬时错误时重试；每次尝试前检查熔断器
+
+        每次尝试的等待时间不超过剩余预算；非瞬时错误（400 / 401 / 402 等）不重试也不计入熔断。
+        """
+        deadline = time.monotonic() + self.budget_seconds
+        attempt = 0
+        while True:
+            attempt += 1
+            if breaker is not None:
+                breaker.before_call()
+            remaining = deadline - time.monotonic()
+            try:
+                result = await asyncio.wait_for(func(), timeout=max(0.001, remaining))
+            except asyncio.CancelledError:
+                if breaker is not None:
+                    breaker.release()
+                raise
+            except Exception as e:
+                if isinstance(e, asyncio.TimeoutError):
+                    error: Exception = RetryBudgetExceeded(f"OpenRouter 调用超出总时长预算 {self.budget_seconds:.0f} 秒")
+                    error.__cause__ = e
+                else:
+                    error = e
+                transient = is_transient(error)
+                if breaker is not None:
+                    if transient:
+                        breaker.record_failure()
+                    else:
+                        # 4xx 说明不了上游是否健康：不清零连续失败数，半开状态也不据此关闭
+                        breaker.release()
+                delay = self.backoff(attempt, error)
+                if not transient or attempt >= self.max_attempts or delay >= deadline - time.monotonic():
+                    raise error
+                remaining = deadline - time.monotonic()
+                self.retries += 1
+                logger.warning(
+                    "vlm_retry request_id=%s name=%s attempt=%s status=%s delay_ms=%s remaining_ms=%s error=%s",
+                    request_id,
+                    breaker.name if breaker is not None else "-",
+                    attempt,
+                    status_code_of(error),
+                    round(delay * 1000),
+                    round(remaining * 1000),
+                    type(error).__name__,
+                )
+                await asyncio.sleep(delay)
+                continue
+            if breaker is not None:
+                breaker.record_success()
+            return result
@@ -0,0 +1,107 @@
+"""
+结果缓存 - 按图片内容寻址的有界 LRU 缓存，避免重复扫描同一商品时重复调用 VLM
+"""
+
+from __future__ import annotations
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Optional
+
+
+def image_digest(image_data: bytes) -> str:
+    """计算解码后图片字节的内容哈希"""
+    return hashlib.sha256(image_data).hexdigest()
+
+
+def build_cache_key(digest: str, model_name: str, prompt_version: str) -> str:
+    """缓存键 = 图片哈希 + 模型名 + 提示词版本，任一变化都会使旧结果失效"""
+    return f"{digest}:{model_name}:{prompt_version}"
+
+
+@dataclass
+class _CacheEntry:
+    value: Any
+    size_bytes: int
+    expires_at: float
+
+
+class ResultCache:
+    """有界内存 LRU 缓存，同时按条目数、总字节数和 TTL 淘汰"""
+
+    def __init__(self, max_entries: int, max_bytes: int, ttl_seconds: float):
+        self.max_entries = max(0, max_entries)
+        self.max_bytes = max(0, max_bytes)
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: OrderedDict[str, _CacheEntry] = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 and self.max_bytes > 0 and self.ttl_seconds > 0
+
+    def get(self, key: str, record_stats: bool = True) -> Optional[Any]:
+        """读取缓存；record_stats=False 用于探测候选键（如近似重复查找），不计入命中率"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at <= time.monotonic():
+                self._remove(key)
+                entry = None
+            if entry is None:
+                if record_stats:
+                    self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            if record_stats:
+                self.hits += 1
+            return entry.value
+
+    def record_hit(self) -> None:
+        with self._lock:
+            self.hits += 1
+
+    def record_miss(self) -> None:
+        with self._lock:
+            self.misses += 1
+
+    def put(self, key: str, value: Any, size_bytes: int) -> bool:
+        """写入缓存；单条超过总容量时不缓存，返回是否写入成功"""
+        if not self.enabled or size_bytes > self.max_bytes:
+            return False
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = _CacheEntry(
+                value=value,
+                size_bytes=size_bytes,
+                expires_at=time.monotonic() + self.ttl_seconds,
+            )
+            self._total_bytes += size_bytes
+            while len(self._entries) > self.max_entries or self._total_bytes > self.max_bytes:
+                oldest_key = next(iter(self._entries))
+                self._remove(oldest_key)
+                self.evictions += 1
+        return True
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key)
+        self._total_bytes -= entry.size_bytes
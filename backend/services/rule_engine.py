@@ -0,0 +1,123 @@
+"""
+规则引擎 - 不调用 VLM，基于 OCR 配料表和内置知识库生成分析结果
+
+流程：
+1. 从 OCR 文字中取出配料表并拆分为配料名（与 OCR 事后校验共用解析逻辑）
+2. 每个配料通过添加剂索引（services/additive_index.py）匹配知识库中的添加剂 / 过敏原条目
+3. 按与 VLM 提示词一致的分级规则计算 health_score，生成 risks、详情和替代建议
+
+结果是确定性的：同一段 OCR 文字总是得到同一个结果。
+"""
+
+from __future__ import annotations
+
+import logging
+
+from services.additive_index import LEVEL_ORDER, AdditiveKnowledgeBase, KBEntry, risk_name
+from services.ocr_validation import extract_ingredient_section, split_ingredients
+from services.runtime_logging import elapsed_ms, now_ms
+from services.vlm_service import AnalyzeResponse, IngredientDetail, RiskItem
+
+logger = logging.getLogger(__name__)
+
+RULE_ENGINE_CONFIDENCE = 0.6
+
+_UNHEALTHY_LEVELS = {"High", "Moderate"}
+# 与提示词一致：健康成分占比 ≥80% 为 A，50-79% 为 B，30-49% 为 C，10-29% 为 D，<10% 为 E
+_GRADE_THRESHOLDS = ((80, "A"), (50, "B"), (30, "C"), (10, "D"))
+_GRADES = "ABCDE"
+_SUMMARY_LABELS = {"A": "Excellent", "B": "Good", "C": "Fair", "D": "Poor", "E": "Very Poor"}
+
+
+def _error_response(message: str, error_type: str = "parse_error") -> AnalyzeResponse:
+    return AnalyzeResponse(
+        health_score="",
+        summary="",
+        risks=[],
+        full_ingredients=[],
+        alternatives=[],
+        error=message,
+        error_type=error_type,
+    )
+
+
+def _grade(healthy_percent: int, has_high_risk: bool) -> str:
+    grade = "E"
+    for threshold, candidate in _GRADE_THRESHOLDS:
+        if healthy_percent >= threshold:
+            grade = candidate
+            break
+    if has_high_risk and grade != "E":
+        # 含高风险成分时降一级
+        grade = _GRADES[_GRADES.index(grade) + 1]
+    return grade
+
+
+class RuleEngine:
+    """基于 OCR 文字和知识库的确定性分析"""
+
+    def __init__(self, knowledge_base: AdditiveKnowledgeBase):
+        self.kb = knowledge_base
+
+    def analyze(self, ocr_text: str, request_id: str = "-") -> AnalyzeResponse:
+        start_ms = now_ms()
+        if not ocr_text or not ocr_text.strip():
+            logger.info("rule_engine_no_text request_id=%s", request_id)
+            return _error_response("未识别到标签文字，请上传更清晰的商品标签图片")
+        section = extract_ingredient_section(ocr_text)
+        ingredients = split_ingredients(section) if section is not None else []
+        if not ingredients:
+            logger.info("rule_engine_no_ingredients request_id=%s text_len=%s", request_id, len(ocr_text))
+            return _error_response("未在标签文字中找到配料表，请拍摄包含配料表的一面")
+
+        risks: dict[KBEntry, RiskItem] = {}
+        details: list[IngredientDetail] = []
+        unhealthy = 0
+        for ingredient in ingredients:
+            entries = self.kb.match(ingredient)
+            if not entries:
+                continue
+            if any(entry.level in _UNHEALTHY_LEVELS for entry in entries):
+                unhealthy += 1
+            details.append(IngredientDetail(name=ingredient, description=" ".join(entry.desc for entry in entries)))
+            for entry in entries:
+                if entry not in risks:
+                    risks[entry] = RiskItem(level=entry.level, name=risk_name(ingredient, entry), desc=entry.desc)
+
+        ordered = sorted(risks, key=lambda entry: LEVEL_ORDER.get(entry.level, len(LEVEL_ORDER)))
+        healthy_percent = round(100 * (len(ingredients) - unhealthy) / len(ingredients))
+        health_score = _grade(healthy_percent, any(entry.level == "High" for entry in ordered))
+        result = AnalyzeResponse(
+            health_score=health_score,
+            summary=f"{_SUMMARY_LABELS[health_score]} - {healthy_percent}% Healthy",
+            risks=[risks[entry] for entry in ordered],
+            full_ingredients=ingredients,
+            ingredients_detail=details or None,
+            alternatives=self._alternatives(ordered),
+            confidence=RULE_ENGINE_CONFIDENCE,
+        )
+        logger.info(
+            "rule_engine_done request_id=%s elapsed_ms=%s ingredients=%s matched=%s risks=%s score=%s kb_version=%s",
+            request_id,
+            elapsed_ms(start_ms),
+            len(ingredients),
+            len(details),
+            len(result.risks),
+            health_score,
+            self.kb.version,
+        )
+        return result
+
+    def _alternatives(self, ordered: list[KBEntry]) -> list[str]:
+        alternatives: list[str] = []
+        for entry in ordered:
+            if entry.level not in _UNHEALTHY_LEVELS:
+                continue
+            suggestion = self.kb.alternatives.get(entry.category)
+            if suggestion and suggestion not in alternatives:
+                alternatives.append(suggestion)
+            if len(alternatives) == 2:
+                break
+        if not alternatives and "default" in self.kb.alternatives:
+            alternatives.append(self.kb.alternatives["default"])
+        return alternatives
@@ -2,9 +2,13 @@
 
 from __future__ import annotations
 
+import math
 import os
 import resource
+import threading
 import time
+from collections import deque
+from typing import Optional
 
 
 def now_ms() -> int:
@@ -26,14 +30,193 @@ def _read_status_value(name: str) -> str:
     return "unknown"
 
 
-def memory_snapshot() -> str:
+def _read_memory_status() -> tuple[str, str]:
+    """一次扫描 /proc/self/status 读取 (VmRSS, VmHWM)"""
+    rss = hwm = "unknown"
+    try:
+        with open("/proc/self/status", "r", encoding="utf-8") as status_file:
+            for line in status_file:
+                if line.startswith("VmHWM:"):
+                    hwm = line.split(":", 1)[1].strip()
+                elif line.startswith("VmRSS:"):
+                    rss = line.split(":", 1)[1].strip()
+                    break
+    except OSError:
+        pass
+    return rss, hwm
+
+
+def _kb_value(value: str) -> Optional[int]:
+    return int(value[:-3]) if value.endswith(" kB") else None
+
+
+def read_rss_kb() -> int:
+    """直接读取 /proc 的当前 RSS（KB），不使用采样缓存；用于准入控制等需要即时值的判断"""
+    value = _kb_value(_read_status_value("VmRSS"))
+    return value if value is not None else resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _read_memory_snapshot() -> tuple[str, int]:
+    rss, hwm = _read_memory_status()
     max_rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
-    return (
-        f"pid={os.getpid()} "
-        f"rss={_read_status_value('VmRSS')} "
-        f"hwm={_read_status_value('VmHWM')} "
-        f"maxrss_kb={max_rss_kb}"
-    )
+    current_kb = _kb_value(rss)
+    snapshot = f"pid={os.getpid()} rss={rss} hwm={hwm} maxrss_kb={max_rss_kb}"
+    return snapshot, current_kb if current_kb is not None else max_rss_kb
+
+
+class MemoryWatch:
+    """单个请求的内存观察：开始时的 RSS 和期间采样到的峰值"""
+
+    __slots__ = ("start_kb", "peak_kb")
+
+    def __init__(self, start_kb: int):
+        self.start_kb = start_kb
+        self.peak_kb = start_kb
+
+
+class MemorySampler:
+    """
+    后台线程按固定间隔读取一次 /proc/self/status + getrusage，缓存快照字符串和 RSS
+
+    memory_snapshot() / rss_kb() 在采样线程运行时直接返回缓存值（最多滞后 interval_seconds），
+    不再每行日志读两次 /proc；需要即时值的判断（准入控制的内存检查）使用 read_rss_kb()。
+    同时保留最近 window_seconds 的样本用于峰值和分位数统计，
+    并把每个样本计入进行中请求的 MemoryWatch，得到请求期间的峰值 RSS 增量。
+    用线程而不是 asyncio 任务采样，事件循环被 CPU 密集的解码 / 编码阻塞时仍能采到峰值。
+    """
+
+    def __init__(self, interval_seconds: float = 0.5, window_seconds: float = 300.0):
+        self.interval_seconds = interval_seconds
+        self.window_seconds = window_seconds
+        self.snapshot = ""
+        self.rss_kb = 0
+        self.peak_kb = 0
+        self.samples = 0
+        self._sample_ns = 0
+        self._window: deque[int] = deque(maxlen=max(1, int(window_seconds / interval_seconds)) if interval_seconds > 0 else 1)
+        self._watches: set[MemoryWatch] = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+
+    @property
+    def active(self) -> bool:
+        # fork 出的子进程不继承采样线程，只能直接读取
+        return self._thread is not None and self._pid == os.getpid()
+
+    def sample(self) -> None:
+        start_ns = time.perf_counter_ns()
+        snapshot, current_kb = _read_memory_snapshot()
+        with self._lock:
+            self.snapshot = snapshot
+            self.rss_kb = current_kb
+            self.peak_kb = max(self.peak_kb, current_kb)
+            self._window.append(current_kb)
+            for watch in self._watches:
+                if current_kb > watch.peak_kb:
+                    watch.peak_kb = current_kb
+            self.samples += 1
+            self._sample_ns += time.perf_counter_ns() - start_ns
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval_seconds):
+            self.sample()
+
+    def start(self) -> None:
+        """interval_seconds <= 0 时不启动，memory_snapshot() 保持每次直接读取"""
+        global _sampler
+        if self.interval_seconds <= 0 or self._thread is not None:
+            return
+        self._pid = os.getpid()
+        self.sample()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="memory-sampler", daemon=True)
+        self._thread.start()
+        _sampler = self
+
+    def stop(self) -> None:
+        global _sampler
+        if self._thread is None:
+            return
+        if _sampler is self:
+            _sampler = None
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def watch(self) -> MemoryWatch:
+        """请求开始时调用；结束时必须调用 unwatch()"""
+        watch = MemoryWatch(self.rss_kb if self.active else read_rss_kb())
+        if self.active:
+            with self._lock:
+                self._watches.add(watch)
+        return watch
+
+    def unwatch(self, watch: MemoryWatch) -> None:
+        with self._lock:
+            self._watches.discard(watch)
+
+    def peak_delta_kb(self, watch: MemoryWatch) -> int:
+        """
+        请求期间的峰值 RSS 减去开始时的 RSS（KB），分辨率为一个采样间隔
+
+        并发请求共享同一进程，增量包含同时段其他请求的分配，只能作为上界参考。
+        采样线程未运行时退化为结束时直接读取一次。
+        """
+        current_kb = self.rss_kb if self.active else read_rss_kb()
+        return max(0, max(watch.peak_kb, current_kb) - watch.start_kb)
+
+    def stats(self) -> dict:
+        with self._lock:
+            window = sorted(self._window)
+            samples = self.samples
+            sample_ns = self._sample_ns
+            watches = len(self._watches)
+
+        def percentile(fraction: float) -> Optional[int]:
+            if not window:
+                return None
+            return window[min(len(window) - 1, max(0, math.ceil(len(window) * fraction) - 1))]
+
+        return {
+            "active": self.active,
+            "interval_ms": round(self.interval_seconds * 1000),
+            "window_seconds": self.window_seconds,
+            "samples": samples,
+            "avg_sample_us": round(sample_ns / samples / 1000, 1) if samples else None,
+            "rss_kb": self.rss_kb if self.active else read_rss_kb(),
+            "peak_kb": self.peak_kb,
+            "window_samples": len(window),
+            "window_peak_kb": window[-1] if window else None,
+            "window_p50_kb": percentile(0.5),
+            "window_p95_kb": percentile(0.95),
+            "window_p99_kb": percentile(0.99),
+            "active_watches": watches,
+        }
+
+
+_sampler: Optional[MemorySampler] = None
+
+
+def _active_sampler() -> Optional[MemorySampler]:
+    sampler = _sampler
+    return sampler if sampler is not None and sampler.active else None
+
+
+def rss_kb() -> int:
+    """当前进程常驻内存（KB）；采样线程运行时返回最近一次样本，无法读取 /proc 时退化为峰值 RSS"""
+    sampler = _active_sampler()
+    if sampler is not None:
+        return sampler.rss_kb
+    return read_rss_kb()
+
+
+def memory_snapshot() -> str:
+    sampler = _active_sampler()
+    if sampler is not None:
+        return sampler.snapshot
+    return _read_memory_snapshot()[0]
 
 
 def text_preview(text: str, limit: int = 240) -> str:
@@ -0,0 +1,83 @@
+"""
+Single-flight 请求合并 - 相同键的并发调用只执行一次，其余调用方等待同一个结果
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _InFlightCall:
+    task: asyncio.Task
+    leader_request_id: str
+    waiters: int = 0
+    abandoned: bool = False
+
+
+class SingleFlight:
+    """
+    按键合并并发的异步调用
+
+    - 第一个调用方（leader）创建共享任务，后续相同键的调用方（follower）直接等待该任务
+    - 每个调用方通过 asyncio.shield 等待，单个调用方被取消（如客户端断开）不会影响其他人
+    - 最后一个调用方离开且任务尚未完成时取消共享任务，避免为无人等待的请求继续消耗配额
+    """
+
+    def __init__(self):
+        self._calls: dict[str, _InFlightCall] = {}
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    async def run(
+        self,
+        key: str,
+        factory: Callable[[], Awaitable[Any]],
+        request_id: str = "-",
+    ) -> tuple[Any, Optional[str]]:
+        """
+        执行或加入一次调用
+
+        Returns:
+            (结果, leader_request_id)；当前调用方自己是 leader 时第二项为 None
+        """
+        call = self._calls.get(key)
+        if call is None or call.abandoned:
+            call = _InFlightCall(task=asyncio.ensure_future(factory()), leader_request_id=request_id)
+            self._calls[key] = call
+            call.task.add_done_callback(lambda _task, key=key, call=call: self._forget(key, call))
+            leader_request_id = None
+        else:
+            leader_request_id = call.leader_request_id
+            logger.info(
+                "single_flight_join request_id=%s leader_request_id=%s waiters=%s",
+                request_id,
+                leader_request_id,
+                call.waiters + 1,
+            )
+
+        call.waiters += 1
+        try:
+            result = await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                call.abandoned = True
+                self._forget(key, call)
+                call.task.cancel()
+                logger.info(
+                    "single_flight_cancelled request_id=%s leader_request_id=%s reason=no_waiters",
+                    request_id,
+                    call.leader_request_id,
+                )
+        return result, leader_request_id
+
+    def _forget(self, key: str, call: _InFlightCall) -> None:
+        if self._calls.get(key) is call:
+            del self._calls[key]
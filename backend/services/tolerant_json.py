@@ -0,0 +1,375 @@
+"""
+容错 JSON 解析器 - 单遍、可增量喂入，用于解析模型输出
+
+可处理：
+1. markdown 代码块（```json ... ```）及 JSON 前后的说明文字
+2. // 和 /* */ 注释
+3. 尾随逗号
+4. 单引号字符串、Python 字面量（True / False / None）、未加引号的键
+5. 字符串内未转义的双引号（如 "称为"代糖"的成分"）
+6. 输出被截断（finish_reason=length）：补全未闭合的字符串和容器，丢弃没有值的键
+"""
+
+from __future__ import annotations
+
+import json
+import re
+from typing import Optional
+
+_BARE_RE = re.compile(r"[A-Za-z0-9_.+\-]+")
+_BARE_START = frozenset("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789_.+-")
+_WHITESPACE = " \t\r\n"
+_WHITESPACE_RE = re.compile(r"[ \t\r\n]+")
+_LITERALS = {"true": True, "false": False, "null": None}
+_PYTHON_LITERALS = {"True": True, "False": False, "None": None}
+_ESCAPES = {'"': '"', "'": "'", "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+
+
+class _Frame:
+    __slots__ = ("container", "is_dict", "path", "key", "state")
+
+    def __init__(self, container, path: tuple):
+        self.container = container
+        self.is_dict = isinstance(container, dict)
+        self.path = path
+        self.key: Optional[str] = None
+        # dict: key -> colon -> value -> after；list 不使用
+        self.state = "key"
+
+
+class TolerantJSONParser:
+    """
+    单遍容错 JSON 解析器
+
+    feed() 可多次调用（流式输出逐段喂入），返回本次新完成的、深度不超过 emit_depth 的值：
+    [(path, value), ...]，如 (("health_score",), "B")、(("risks", 0), {...})。
+    close() 结束输入并返回完整结果；输入被截断时尽量补全。
+    repairs 记录解析过程中用到的修复类型，便于统计模型输出质量。
+    """
+
+    def __init__(self, emit_depth: int = 2):
+        self.emit_depth = emit_depth
+        self.repairs: set[str] = set()
+        self._stack: list[_Frame] = []
+        self._root: object = None
+        self._has_root = False
+        self._finished = False
+        self._pending = ""
+        self._quote: Optional[str] = None
+        self._string_parts: list[str] = []
+        self._escape: Optional[str] = None
+        self._surrogate = False
+        self._bare: list[str] = []
+        self._comment: Optional[str] = None
+        self._after_comma = False
+        self._events: list[tuple[tuple, object]] = []
+
+    @property
+    def finished(self) -> bool:
+        return self._finished
+
+    def feed(self, chunk: str) -> list[tuple[tuple, object]]:
+        self._events = []
+        if self._finished:
+            return self._events
+        text = self._pending + chunk
+        self._pending = ""
+        i = 0
+        n = len(text)
+        while i < n and not self._finished:
+            if self._quote is not None:
+                i = self._scan_string(text, i, final=False)
+                continue
+            if self._comment == "line":
+                j = text.find("\n", i)
+                if j < 0:
+                    break
+                self._comment = None
+                i = j + 1
+                continue
+            if self._comment == "block":
+                j = text.find("*/", i)
+                if j < 0:
+                    if text.endswith("*"):
+                        self._pending = "*"
+                    break
+                self._comment = None
+                i = j + 2
+                continue
+            if not self._has_root and not self._stack:
+                i = self._seek_root(text, i)
+                continue
+
+            ch = text[i]
+            if ch in _BARE_START:
+                match = _BARE_RE.match(text, i)
+                self._bare.append(match.group())
+                i = match.end()
+                continue
+            self._flush_bare()
+            if ch in _WHITESPACE:
+                # 缩进等连续空白一次跳过
+                i = _WHITESPACE_RE.match(text, i).end()
+            elif ch == '"' or ch == "'":
+                if ch == "'":
+                    self.repairs.add("single_quote")
+                self._quote = ch
+                i += 1
+            elif ch in "{[":
+                self._open({} if ch == "{" else [])
+                i += 1
+            elif ch in "}]":
+                self._close(ch)
+                i += 1
+            elif ch == ":":
+                if self._stack and self._stack[-1].is_dict and self._stack[-1].state == "colon":
+                    self._stack[-1].state = "value"
+                i += 1
+            elif ch == ",":
+                self._on_comma()
+                i += 1
+            elif ch == "/":
+                if i + 1 >= n:
+                    self._pending = "/"
+                    break
+                nxt = text[i + 1]
+                if nxt == "/" or nxt == "*":
+                    self._comment = "line" if nxt == "/" else "block"
+                    self.repairs.add("comment")
+                    i += 2
+                else:
+                    i += 1
+            else:
+                # 反引号等无意义字符直接跳过
+                i += 1
+        return self._events
+
+    def close(self) -> object:
+        """结束输入，返回解析结果；没有找到任何 JSON 值时抛 ValueError"""
+        if not self._finished:
+            if self._quote is not None:
+                text = self._pending
+                self._pending = ""
+                self._scan_string(text, 0, final=True)
+                if self._quote is not None:
+                    self.repairs.add("truncated")
+                    self._finish_string()
+            self._flush_bare()
+            if self._stack:
+                self.repairs.add("truncated")
+            while self._stack:
+                self._pop()
+            self._finished = True
+        if not self._has_root:
+            raise ValueError("未找到 JSON 对象")
+        return self._root
+
+    def _seek_root(self, text: str, i: int) -> int:
+        starts = [pos for pos in (text.find("{", i), text.find("[", i)) if pos >= 0]
+        if not starts:
+            if text[i:].strip():
+                self.repairs.add("prefix")
+            return len(text)
+        start = min(starts)
+        if text[i:start].strip():
+            self.repairs.add("prefix")
+        self._open({} if text[start] == "{" else [])
+        return start + 1
+
+    def _scan_string(self, text: str, i: int, final: bool) -> int:
+        quote = self._quote
+        n = len(text)
+        while i < n:
+            if self._escape is not None:
+                if self._escape == "":
+                    c = text[i]
+                    i += 1
+                    if c == "u":
+                        self._escape = "u"
+                    else:
+                        self._string_parts.append(_ESCAPES.get(c, c))
+                        self._escape = None
+                else:
+                    take = text[i:i + 5 - len(self._escape)]
+                    self._escape += take
+                    i += len(take)
+                    if len(self._escape) == 5:
+                        try:
+                            code = int(self._escape[1:], 16)
+                            self._surrogate = self._surrogate or 0xD800 <= code <= 0xDFFF
+                            self._string_parts.append(chr(code))
+                        except ValueError:
+                            self._string_parts.append("\\" + self._escape)
+                        self._escape = None
+                continue
+
+            j_quote = text.find(quote, i)
+            j_escape = text.find("\\", i, j_quote if j_quote >= 0 else n)
+            if j_escape >= 0:
+                self._string_parts.append(text[i:j_escape])
+                self._escape = ""
+                i = j_escape + 1
+                continue
+            if j_quote < 0:
+                self._string_parts.append(text[i:])
+                return n
+
+            self._string_parts.append(text[i:j_quote])
+            # 引号后第一个非空白字符是结构符号或注释（// 或 /*）时才认为字符串结束，否则视为字符串内未转义的引号
+            k = j_quote + 1
+            newline = False
+            while k < n and text[k] in _WHITESPACE:
+                newline = newline or text[k] == "\n"
+                k += 1
+            if (k >= n or (text[k] == "/" and k + 1 >= n)) and not final:
+                self._pending = text[j_quote:]
+                return n
+            if (
+                k >= n
+                or text[k] in ",:}]"
+                or (newline and text[k] in "\"'")
+                or text[k:k + 2] in ("//", "/*")
+            ):
+                self._finish_string()
+                return j_quote + 1
+            self.repairs.add("inner_quote")
+            self._string_parts.append(quote)
+            i = j_quote + 1
+        return i
+
+    def _finish_string(self) -> None:
+        value = "".join(self._string_parts)
+        if self._surrogate:
+            value = value.encode("utf-16", "surrogatepass").decode("utf-16", "replace")
+        self._string_parts = []
+        self._quote = None
+        self._escape = None
+        self._surrogate = False
+        self._complete(value, is_string=True)
+
+    def _flush_bare(self) -> None:
+        if not self._bare:
+            return
+        token = "".join(self._bare)
+        self._bare = []
+        if token in _LITERALS:
+            value = _LITERALS[token]
+        elif token in _PYTHON_LITERALS:
+            self.repairs.add("python_literal")
+            value = _PYTHON_LITERALS[token]
+        else:
+            try:
+                value = int(token)
+            except ValueError:
+                try:
+                    value = float(token)
+                except ValueError:
+                    self.repairs.add("bare_word")
+                    value = token
+        self._complete(value, is_string=isinstance(value, str))
+
+    def _open(self, container) -> None:
+        path = self._attach(container)
+        self._stack.append(_Frame(container, path))
+        self._after_comma = False
+
+    def _close(self, ch: str) -> None:
+        want_dict = ch == "}"
+        if not any(frame.is_dict == want_dict for frame in self._stack):
+            return
+        if self._after_comma:
+            self.repairs.add("trailing_comma")
+        while self._stack:
+            frame = self._pop()
+            if frame.is_dict == want_dict:
+                break
+            self.repairs.add("mismatched_bracket")
+        self._after_comma = False
+
+    def _pop(self) -> _Frame:
+        frame = self._stack.pop()
+        if frame.is_dict and frame.key is not None and frame.state != "after":
+            # 截断导致的有键无值，丢弃该键
+            frame.container.pop(frame.key, None)
+        if not self._stack:
+            self._finished = True
+        elif len(frame.path) <= self.emit_depth:
+            self._events.append((frame.path, frame.container))
+        return frame
+
+    def _on_comma(self) -> None:
+        if self._stack:
+            frame = self._stack[-1]
+            if frame.is_dict:
+                frame.state = "key"
+                frame.key = None
+        self._after_comma = True
+
+    def _complete(self, value: object, is_string: bool) -> None:
+        """一个标量值（或键）完成"""
+        self._after_comma = False
+        if not self._stack:
+            return
+        frame = self._stack[-1]
+        if frame.is_dict and frame.state in ("key", "after"):
+            frame.key = value if is_string else str(value)
+            frame.state = "colon"
+            if not is_string:
+                self.repairs.add("bare_key")
+            return
+        path = self._attach(value)
+        if len(path) <= self.emit_depth:
+            self._events.append((path, value))
+
+    def _attach(self, value: object) -> tuple:
+        """把值挂到当前容器上，返回它的路径"""
+        if not self._stack:
+            self._root = value
+            self._has_root = True
+            return ()
+        frame = self._stack[-1]
+        if frame.is_dict:
+            if frame.key is None:
+                # 缺少键（如 {: 1}），丢弃该值
+                return frame.path + ("",)
+            frame.container[frame.key] = value
+            frame.state = "after"
+            return frame.path + (frame.key,)
+        frame.container.append(value)
+        return frame.path + (len(frame.container) - 1,)
+
+
+def extract_fenced_block(text: str) -> str:
+    """
+    取出 markdown 代码块内的内容；没有代码块时原样返回
+
+    模型常在代码块前后附带说明文字（甚至包含花括号），只解析代码块可避免误把说明当作 JSON。
+    代码块未闭合（输出被截断）时取到文本末尾。
+    """
+    start = text.find("```")
+    if start < 0:
+        return text.strip()
+    newline = text.find("\n", start)
+    if newline < 0:
+        return ""
+    end = text.find("```", newline)
+    return text[newline + 1:end if end >= 0 else len(text)].strip()
+
+
+def parse_model_json(text: str) -> tuple[object, str, frozenset[str]]:
+    """
+    解析一段完整的模型输出
+
+    先走 json.loads 快速路径（C 实现，绝大多数规范输出一次成功），失败时用容错解析器单遍解析。
+
+    Returns:
+        (结果, 方法 direct / tolerant, 修复类型集合)；完全无法解析时抛 ValueError
+    """
+    block = extract_fenced_block(text)
+    try:
+        return json.loads(block), "direct", frozenset()
+    except ValueError:
+        pass
+    parser = TolerantJSONParser(emit_depth=0)
+    parser.feed(block)
+    return parser.close(), "tolerant", frozenset(parser.repairs)
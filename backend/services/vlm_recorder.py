@@ -0,0 +1,289 @@
+"""
+VLM 调用的录制 / 回放 - 不访问 OpenRouter 也能用真实的模型输出跑完整条请求路径
+
+- record：照常调用 OpenRouter，每次成功的 Chat Completions 调用追加一行 JSON 到录制文件：
+  请求指纹（调用类型、模型、图片摘要、提示词摘要、max_tokens、是否流式）、原始响应（含 usage 和 finish_reason）、
+  耗时和首 token 延迟；流式调用另外记录每块文字的长度
+- replay：不创建 OpenRouter 客户端，按（图片摘要, 提示词摘要）查找录制的响应返回；同一键录制了多次时轮流返回。
+  latency_scale 为 0 时立即返回，为 1 时按录制的耗时等待（流式按首 token 延迟和剩余时间逐块输出）
+
+图片摘要取自发给模型的 data URL，即编码后的 JPEG；提示词包含 OCR 文字和已识别的风险，
+回放时 OCR_MODE、图片编码参数和添加剂索引需要与录制时一致，否则键不匹配（ReplayMissError，按 api_error 处理）。
+VLMService._create_completion 在 record / replay 模式下改为调用 RecordingClient / ReplayClient.create，重试、熔断和指标照常经过。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import logging
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RECORDING_PATH = Path(__file__).resolve().parents[1] / ".cache" / "vlm_recordings.jsonl"
+
+# 回放流式响应且录制时不是流式调用时，每块的字符数
+_REPLAY_CHUNK_CHARS = 24
+
+
+class ReplayMissError(Exception):
+    """回放模式下没有匹配的录制"""
+
+
+def _sha256(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def request_fingerprint(call: str, model: str, kwargs: dict) -> dict:
+    """请求指纹：文字部分拼接后的摘要为 prompt_sha256，data URL 的摘要为 image_sha256；key 只由这两项决定"""
+    texts: list[str] = []
+    images: list[str] = []
+    for message in kwargs.get("messages", []):
+        content = message.get("content")
+        if isinstance(content, str):
+            texts.append(content)
+            continue
+        for part in content or []:
+            if part.get("type") == "text":
+                texts.append(part.get("text", ""))
+            elif part.get("type") == "image_url":
+                images.append(part.get("image_url", {}).get("url", ""))
+    prompt = "\n".join(texts)
+    prompt_sha256 = _sha256(prompt)
+    image_sha256 = _sha256("\n".join(images)) if images else "-"
+    return {
+        "key": f"{image_sha256[:32]}:{prompt_sha256[:32]}",
+        "call": call,
+        "model": model,
+        "image_sha256": image_sha256,
+        "prompt_sha256": prompt_sha256,
+        "prompt_len": len(prompt),
+        "image_url_len": sum(map(len, images)),
+        "max_tokens": kwargs.get("max_tokens"),
+        "stream": bool(kwargs.get("stream")),
+    }
+
+
+class VLMRecordingStore:
+    """录制文件（JSON Lines）：启动时整体读入内存，追加写在调用方线程中完成"""
+
+    def __init__(self, path: Path | str = DEFAULT_RECORDING_PATH):
+        self.path = Path(path)
+        self._records: dict[str, list[dict]] = {}
+        self._cursor: dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.recorded = 0
+        self.replayed = 0
+        self.misses = 0
+        if self.path.exists():
+            with self.path.open("r", encoding="utf-8") as recording_file:
+                for line in recording_file:
+                    if line.strip():
+                        record = json.loads(line)
+                        self._records.setdefault(record["fingerprint"]["key"], []).append(record)
+
+    def __len__(self) -> int:
+        return sum(len(records) for records in self._records.values())
+
+    def append(self, record: dict) -> None:
+        line = json.dumps(record, ensure_ascii=False, separators=(",", ":"))
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with self.path.open("a", encoding="utf-8") as recording_file:
+                recording_file.write(line + "\n")
+            self._records.setdefault(record["fingerprint"]["key"], []).append(record)
+            self.recorded += 1
+
+    def lookup(self, key: str) -> Optional[dict]:
+        records = self._records.get(key)
+        if not records:
+            self.misses += 1
+            return None
+        index = self._cursor.get(key, 0)
+        self._cursor[key] = index + 1
+        self.replayed += 1
+        return records[index % len(records)]
+
+    def stats(self) -> dict:
+        return {
+            "path": str(self.path),
+            "entries": len(self),
+            "keys": len(self._records),
+            "recorded": self.recorded,
+            "replayed": self.replayed,
+            "misses": self.misses,
+        }
+
+
+def _completion_dict(response: object) -> dict:
+    if hasattr(response, "model_dump"):
+        return response.model_dump(mode="json", exclude_none=True)
+    return json.loads(json.dumps(response, default=lambda value: getattr(value, "__dict__", str(value))))
+
+
+def _chunk_text(chunk: object) -> str:
+    choices = getattr(chunk, "choices", None) or []
+    content = getattr(getattr(choices[0], "delta", None), "content", None) if choices else None
+    return content if isinstance(content, str) else ""
+
+
+class _RecordingStream:
+    """透传流式响应的每一块，流结束后把拼好的完整响应写入录制文件"""
+
+    def __init__(self, stream, store: VLMRecordingStore, fingerprint: dict, start: float):
+        self._stream = stream
+        self._store = store
+        self._fingerprint = fingerprint
+        self._start = start
+        self._parts: list[str] = []
+        self._first_token_ms: Optional[int] = None
+        self._last_chunk: object = None
+        self._finish_reason: Optional[str] = None
+        self._usage: object = None
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            self._last_chunk = chunk
+            if getattr(chunk, "usage", None):
+                self._usage = chunk.usage
+            choices = getattr(chunk, "choices", None) or []
+            if choices and getattr(choices[0], "finish_reason", None):
+                self._finish_reason = choices[0].finish_reason
+            text = _chunk_text(chunk)
+            if text:
+                if self._first_token_ms is None:
+                    self._first_token_ms = round((time.perf_counter() - self._start) * 1000)
+                self._parts.append(text)
+            yield chunk
+        latency_ms = round((time.perf_counter() - self._start) * 1000)
+        response = {
+            "id": getattr(self._last_chunk, "id", None),
+            "object": "chat.completion",
+            "created": getattr(self._last_chunk, "created", int(time.time())),
+            "model": getattr(self._last_chunk, "model", self._fingerprint["model"]),
+            "choices": [
+                {
+                    "index": 0,
+                    "message": {"role": "assistant", "content": "".join(self._parts)},
+                    "finish_reason": self._finish_reason or "stop",
+                }
+            ],
+        }
+        if self._usage is not None:
+            response["usage"] = _completion_dict(self._usage)
+        record = {
+            "fingerprint": self._fingerprint,
+            "recorded_at": time.time(),
+            "latency_ms": latency_ms,
+            "first_token_ms": self._first_token_ms,
+            "chunk_sizes": [len(part) for part in self._parts],
+            "response": response,
+        }
+        await asyncio.to_thread(self._store.append, record)
+
+    async def close(self) -> None:
+        await self._stream.close()
+
+
+class RecordingClient:
+    """包装 AsyncOpenAI：调用照常发出，成功的响应写入录制文件"""
+
+    def __init__(self, client, store: VLMRecordingStore):
+        self._client = client
+        self.store = store
+
+    async def create(self, model: str, call: str, **kwargs):
+        fingerprint = request_fingerprint(call, model, kwargs)
+        start = time.perf_counter()
+        response = await self._client.chat.completions.create(model=model, **kwargs)
+        if kwargs.get("stream"):
+            return _RecordingStream(response, self.store, fingerprint, start)
+        latency_ms = round((time.perf_counter() - start) * 1000)
+        record = {
+            "fingerprint": fingerprint,
+            "recorded_at": time.time(),
+            "latency_ms": latency_ms,
+            "first_token_ms": None,
+            "response": _completion_dict(response),
+        }
+        await asyncio.to_thread(self.store.append, record)
+        return response
+
+
+class _ReplayStream:
+    """按录制的分块（没有时按固定字符数）逐块产出 ChatCompletionChunk，最后一块带 finish_reason，之后是 usage"""
+
+    def __init__(self, record: dict, latency_scale: float):
+        self._record = record
+        self._latency_scale = latency_scale
+
+    async def __aiter__(self):
+        from openai.types.chat import ChatCompletionChunk
+
+        response = self._record["response"]
+        choice = response["choices"][0]
+        text = choice["message"].get("content") or ""
+        sizes = self._record.get("chunk_sizes") or [_REPLAY_CHUNK_CHARS] * (len(text) // _REPLAY_CHUNK_CHARS + 1)
+        base = {
+            "id": response.get("id") or "replay",
+            "object": "chat.completion.chunk",
+            "created": response.get("created", int(time.time())),
+            "model": response.get("model", self._record["fingerprint"]["model"]),
+        }
+        latency_ms = self._record.get("latency_ms") or 0
+        first_ms = self._record.get("first_token_ms") or 0
+        chunk_delay = (latency_ms - first_ms) / max(1, len(sizes)) / 1000 * self._latency_scale
+        if first_ms and self._latency_scale:
+            await asyncio.sleep(first_ms / 1000 * self._latency_scale)
+        offset = 0
+        for size in sizes:
+            if offset >= len(text):
+                break
+            delta = {"role": "assistant", "content": text[offset:offset + size]}
+            offset += size
+            yield ChatCompletionChunk.model_validate(
+                {**base, "choices": [{"index": 0, "delta": delta, "finish_reason": None}]}
+            )
+            if chunk_delay > 0:
+                await asyncio.sleep(chunk_delay)
+        yield ChatCompletionChunk.model_validate(
+            {**base, "choices": [{"index": 0, "delta": {}, "finish_reason": choice.get("finish_reason") or "stop"}]}
+        )
+        if response.get("usage"):
+            yield ChatCompletionChunk.model_validate({**base, "choices": [], "usage": response["usage"]})
+
+    async def close(self) -> None:
+        return None
+
+
+class ReplayClient:
+    """从录制文件返回响应，不发出网络请求"""
+
+    def __init__(self, store: VLMRecordingStore, latency_scale: float = 0.0):
+        self.store = store
+        self.latency_scale = max(0.0, latency_scale)
+
+    async def create(self, model: str, call: str, **kwargs):
+        from openai.types.chat import ChatCompletion
+
+        fingerprint = request_fingerprint(call, model, kwargs)
+        record = self.store.lookup(fingerprint["key"])
+        if record is None:
+            logger.warning(
+                "vlm_replay_miss call=%s model=%s key=%s prompt_len=%s",
+                call,
+                model,
+                fingerprint["key"],
+                fingerprint["prompt_len"],
+            )
+            raise ReplayMissError(f"回放录制中没有匹配的 OpenRouter 响应（key={fingerprint['key']}）")
+        if kwargs.get("stream"):
+            return _ReplayStream(record, self.latency_scale)
+        if self.latency_scale and record.get("latency_ms"):
+            await asyncio.sleep(record["latency_ms"] / 1000 * self.latency_scale)
+        return ChatCompletion.model_validate(record["response"])
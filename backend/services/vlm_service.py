@@ -3,30 +3,92 @@ VLM 服务 - 使用 OpenRouter 多模态模型进行成分分析
 """
 
 import os
+import asyncio
+import json
 import logging
+import sqlite3
 import base64
+import importlib.util
 import io
-import httpx
+import sys
+import threading
+from functools import partial
 from PIL import Image
-from typing import Optional
-from pydantic import BaseModel
+from typing import TYPE_CHECKING, AsyncIterator, Optional
+from pydantic import BaseModel, ValidationError
+from services.description_cache import IngredientDescriptionCache, normalize_ingredient_name
+from services.env_config import read_choice_env, read_float_env, read_int_env
+from services.model_router import ModelRouter
+from services.resilience import CircuitBreaker, CircuitOpenError, RetryBudgetExceeded, RetryPolicy, status_code_of
+from services.metrics import IN_FLIGHT, JSON_PARSE, JSON_REPAIRS, OPENROUTER_CALLS, OPENROUTER_TOKENS, observe_ms
+from services.tolerant_json import TolerantJSONParser, parse_model_json
 from services.runtime_logging import elapsed_ms, memory_snapshot, now_ms, text_preview
+from services.logging_setup import add_request_counts, add_request_fields, detail_enabled
+from services.vlm_recorder import (
+    DEFAULT_RECORDING_PATH,
+    RecordingClient,
+    ReplayClient,
+    ReplayMissError,
+    VLMRecordingStore,
+)
+
+if TYPE_CHECKING:
+    import httpx
 
 logger = logging.getLogger(__name__)
 
-# 尝试导入 OpenAI SDK（用于调用 OpenRouter OpenAI-Compatible API）
-try:
-    from openai import OpenAI
-    OPENROUTER_SDK_AVAILABLE = True
-except ImportError:
-    OPENROUTER_SDK_AVAILABLE = False
+# OpenAI SDK（用于调用 OpenRouter OpenAI-Compatible API）和 langsmith 导入时只检查是否安装：
+# 导入 openai 约需 0.7 秒，推迟到创建客户端时（服务启动后的预热线程或第一次调用），不计入冷启动
+OPENROUTER_SDK_AVAILABLE = importlib.util.find_spec("openai") is not None
+if not OPENROUTER_SDK_AVAILABLE:
     logger.warning("OpenAI SDK 未安装，请运行: pip install openai")
+LANGSMITH_AVAILABLE = importlib.util.find_spec("langsmith") is not None
+
+
+def _openrouter_api_errors() -> tuple[type[Exception], ...]:
+    """连接失败、超时、限流 / 配额不足、5xx 等都归为 api_error；openai 尚未导入时不可能出现这些异常"""
+    openai = sys.modules.get("openai")
+    if openai is None:
+        return ()
+    return (openai.APIConnectionError, openai.APIStatusError)
 
-try:
-    from langsmith.wrappers import wrap_openai
-    LANGSMITH_AVAILABLE = True
-except ImportError:
-    LANGSMITH_AVAILABLE = False
+
+# 提示词或响应结构变化时递增，使结果缓存中的旧条目自动失效
+PROMPT_VERSION = "v3"
+
+# full_ingredients 的两种写法：inline 由模型为每个成分写说明；compact 只要成分名，说明来自成分说明缓存
+_INLINE_INGREDIENT_RULES = """5. **完整成分列表 (full_ingredients)**：
+   - 必须列出产品中的所有成分
+   - 每个成分应包含：
+     * name: 成分名称
+     * description: 详细的科学解释、健康影响、适用人群建议
+   - 即使是安全成分，也要提供简要说明
+"""
+_COMPACT_INGREDIENT_RULES = """5. **完整成分列表 (full_ingredients)**：
+   - 必须列出产品中的所有成分
+   - 只返回成分名称字符串（如果包含 E 编号，请保留），不要写 description，成分说明由系统另行补充
+"""
+_INLINE_INGREDIENT_EXAMPLE = """  "full_ingredients": [
+    {
+      "name": "Organic Oats",
+      "description": "有机燕麦，富含膳食纤维和复合碳水化合物，有助于维持血糖稳定。适合大多数人群，是优质的全谷物来源。"
+    },
+    {
+      "name": "Honey",
+      "description": "天然甜味剂，含有抗氧化物质和微量矿物质。虽然天然，但仍为糖类，糖尿病患者应控制摄入量。"
+    }
+  ],
+"""
+_COMPACT_INGREDIENT_EXAMPLE = """  "full_ingredients": ["Organic Oats", "Honey"],
+"""
+# 这些错误类型说明模型调用本身失败（而不是模型判断图片无效），多模型路由时换下一个模型
+_FAILED_CALL_ERROR_TYPES = frozenset({"api_error", "parse_error", "unknown_error"})
+
+_DESCRIBE_PROMPT = """你是一位专业的食品营养学家。请为下面列表中的每个食品成分写一段简短说明（1-2 句：科学解释、健康影响、适用人群建议）。
+严格返回一个 JSON 对象，不要输出其他文字：键为成分名称（与列表中的写法完全一致），值为说明。
+
+成分列表：
+"""
 
 
 class RiskItem(BaseModel):
@@ -55,64 +117,173 @@ class AnalyzeResponse(BaseModel):
 class VLMService:
     """VLM 服务类，使用 OpenRouter 多模态模型进行成分分析"""
     
-    def __init__(self):
+    def __init__(self, description_cache: Optional[IngredientDescriptionCache] = None):
         self.api_key = None
         self.client = None
-        self.model_name = os.getenv(
-            "OPENROUTER_MODEL",
-            "nvidia/nemotron-nano-12b-v2-vl:free",
+        # 设置后 full_ingredients 只要成分名，说明从缓存读取，未收录的成分再单独请求模型生成
+        self.description_cache = description_cache
+        self.describe_max_names = read_int_env("INGREDIENT_DESCRIBE_MAX_NAMES", 20)
+        # OPENROUTER_MODELS 为按优先级排列的模型列表（逗号分隔），第一个是主模型；未设置时只用 OPENROUTER_MODEL
+        self.models = [
+            model.strip() for model in os.getenv("OPENROUTER_MODELS", "").split(",") if model.strip()
+        ] or [os.getenv("OPENROUTER_MODEL", "nvidia/nemotron-nano-12b-v2-vl:free")]
+        self.model_name = self.models[0]
+        # 结果缓存键中的模型部分：路由配置变化时旧结果失效
+        self.route_name = ",".join(self.models)
+        self.router: ModelRouter[AnalyzeResponse] = ModelRouter(
+            self.models,
+            hedge_quantile=read_float_env("VLM_HEDGE_QUANTILE", 0.9),
+            default_delay=read_float_env("VLM_HEDGE_DEFAULT_DELAY_SECONDS", 10.0),
+            min_delay=read_float_env("VLM_HEDGE_MIN_DELAY_SECONDS", 1.0),
+            min_samples=read_int_env("VLM_HEDGE_MIN_SAMPLES", 20),
         )
+        # 瞬时错误带抖动重试（SDK 自带的重试关闭，避免两层重试叠加）；每个模型一个熔断器
+        self.retry_policy = RetryPolicy(
+            max_attempts=read_int_env("VLM_RETRY_MAX_ATTEMPTS", 3),
+            base_delay=read_float_env("VLM_RETRY_BASE_DELAY_SECONDS", 0.5),
+            max_delay=read_float_env("VLM_RETRY_MAX_DELAY_SECONDS", 8.0),
+            budget_seconds=read_float_env("VLM_RETRY_BUDGET_SECONDS", 60.0),
+        )
+        self.breakers = {
+            model: CircuitBreaker(
+                model,
+                failure_threshold=read_int_env("VLM_BREAKER_FAILURE_THRESHOLD", 5),
+                recovery_seconds=read_float_env("VLM_BREAKER_RECOVERY_SECONDS", 30.0),
+            )
+            for model in self.models
+        }
         self.base_url = os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1")
+        # 原始 JPEG 满足以下限制时直接透传给模型，跳过解码 + 重新编码
+        self.passthrough_max_dimension = read_int_env("VLM_PASSTHROUGH_MAX_DIMENSION", 1600)
+        self.passthrough_max_bytes = read_int_env("VLM_PASSTHROUGH_MAX_BYTES", 1024 * 1024)
         
-        if OPENROUTER_SDK_AVAILABLE:
-            # 从环境变量获取 API Key
+        self.http_client: "httpx.AsyncClient | None" = None
+        # live 直接调用 OpenRouter；record 照常调用并把响应写入录制文件；replay 只从录制文件返回响应（不需要 API Key）
+        self.backend_mode = read_choice_env("VLM_BACKEND_MODE", "live", ("live", "record", "replay"))
+        self.recorder: RecordingClient | ReplayClient | None = None
+        
+        if self.backend_mode == "replay":
+            store = VLMRecordingStore(os.getenv("VLM_RECORDING_PATH", "").strip() or DEFAULT_RECORDING_PATH)
+            self.recorder = ReplayClient(store, latency_scale=read_float_env("VLM_REPLAY_LATENCY_SCALE", 0.0))
+            logger.info(
+                "vlm_replay_enabled path=%s entries=%s latency_scale=%s",
+                store.path,
+                len(store),
+                self.recorder.latency_scale,
+            )
+        elif OPENROUTER_SDK_AVAILABLE:
+            # 从环境变量获取 API Key；客户端在 ensure_client 中创建
             self.api_key = os.getenv("OPENROUTER_API_KEY")
-            if self.api_key:
-                default_headers = {}
-                site_url = os.getenv("OPENROUTER_SITE_URL", "").strip()
-                app_name = os.getenv("OPENROUTER_APP_NAME", "IngrediScan AI").strip()
-                if site_url:
-                    default_headers["HTTP-Referer"] = site_url
-                if app_name:
-                    default_headers["X-Title"] = app_name
-
-                client_kwargs = {
-                    "base_url": self.base_url,
-                    "api_key": self.api_key,
-                }
-                if default_headers:
-                    client_kwargs["default_headers"] = default_headers
+            if not self.api_key:
+                logger.warning("未设置 OPENROUTER_API_KEY 环境变量")
+        else:
+            logger.warning("OpenRouter SDK 不可用")
+        self._client_lock = threading.Lock()
+        self._client_initialized = False
 
+    def ensure_client(self) -> bool:
+        """
+        创建 OpenRouter 客户端（第一次调用时导入 openai）；线程安全
+
+        服务启动后由预热线程调用；预热完成前到达的请求经 asyncio.to_thread 等待同一把锁，不阻塞事件循环。
+        只在创建成功（或配置上本来就没有客户端）后置位；导入或创建失败时保持 False，下一个请求会在锁上重试。
+
+        Returns:
+            是否已完成初始化
+        """
+        with self._client_lock:
+            if not self._client_initialized:
+                self._client_initialized = self._create_client()
+            return self._client_initialized
+
+    def _create_client(self) -> bool:
+        """返回 False 表示创建失败、之后应重试"""
+        if self.backend_mode == "replay" or not OPENROUTER_SDK_AVAILABLE or not self.api_key:
+            return True
+        from openai import AsyncOpenAI
+
+        default_headers = {}
+        site_url = os.getenv("OPENROUTER_SITE_URL", "").strip()
+        app_name = os.getenv("OPENROUTER_APP_NAME", "IngrediScan AI").strip()
+        if site_url:
+            default_headers["HTTP-Referer"] = site_url
+        if app_name:
+            default_headers["X-Title"] = app_name
+
+        client_kwargs = {
+            "base_url": self.base_url,
+            "api_key": self.api_key,
+            "max_retries": 0,
+        }
+        if default_headers:
+            client_kwargs["default_headers"] = default_headers
+
+        try:
+            self.http_client = self._build_http_client()
+            self.client = AsyncOpenAI(**client_kwargs, http_client=self.http_client)
+            logger.info("OpenRouter API Key 已配置，模型: %s", self.route_name)
+            self._enable_langsmith_if_needed()
+        except Exception as e:
+            # 某些环境下 ALL_PROXY=socks://... 会导致 httpx 抛 Unknown scheme 错误
+            if "Unknown scheme for proxy URL" in str(e):
+                logger.warning(
+                    "检测到代理配置不兼容，已改为忽略系统代理变量并重试 OpenRouter 客户端初始化"
+                )
                 try:
-                    self.client = OpenAI(**client_kwargs)
-                    logger.info("OpenRouter API Key 已配置，模型: %s", self.model_name)
+                    self.http_client = self._build_http_client(trust_env=False)
+                    self.client = AsyncOpenAI(**client_kwargs, http_client=self.http_client)
+                    logger.info(
+                        "OpenRouter 客户端已在禁用环境代理模式下初始化成功，模型: %s",
+                        self.model_name,
+                    )
                     self._enable_langsmith_if_needed()
-                except Exception as e:
-                    # 某些环境下 ALL_PROXY=socks://... 会导致 httpx 抛 Unknown scheme 错误
-                    if "Unknown scheme for proxy URL" in str(e):
-                        logger.warning(
-                            "检测到代理配置不兼容，已改为忽略系统代理变量并重试 OpenRouter 客户端初始化"
-                        )
-                        try:
-                            self.client = OpenAI(
-                                **client_kwargs,
-                                http_client=httpx.Client(trust_env=False),
-                            )
-                            logger.info(
-                                "OpenRouter 客户端已在禁用环境代理模式下初始化成功，模型: %s",
-                                self.model_name,
-                            )
-                            self._enable_langsmith_if_needed()
-                        except Exception as e2:
-                            self.client = None
-                            logger.error("OpenRouter 客户端初始化失败: %s", e2)
-                    else:
-                        self.client = None
-                        logger.error("OpenRouter 客户端初始化失败: %s", e)
+                except Exception as e2:
+                    self.client = None
+                    logger.error("OpenRouter 客户端初始化失败: %s", e2)
+                    return False
             else:
-                logger.warning("未设置 OPENROUTER_API_KEY 环境变量")
-        else:
-            logger.warning("OpenRouter SDK 不可用")
+                self.client = None
+                logger.error("OpenRouter 客户端初始化失败: %s", e)
+                return False
+
+        if self.backend_mode == "record" and self.client is not None:
+            store = VLMRecordingStore(os.getenv("VLM_RECORDING_PATH", "").strip() or DEFAULT_RECORDING_PATH)
+            self.recorder = RecordingClient(self.client, store)
+            logger.info("vlm_record_enabled path=%s entries=%s", store.path, len(store))
+        return True
+
+    def _build_http_client(self, trust_env: bool = True) -> "httpx.AsyncClient":
+        """构建所有 OpenRouter 请求共享的异步连接池"""
+        import httpx
+
+        max_connections = read_int_env("OPENROUTER_MAX_CONNECTIONS", 20)
+        max_keepalive = read_int_env("OPENROUTER_MAX_KEEPALIVE_CONNECTIONS", 10)
+        keepalive_expiry = read_float_env("OPENROUTER_KEEPALIVE_EXPIRY_SECONDS", 30.0)
+        timeout_seconds = read_float_env("OPENROUTER_TIMEOUT_SECONDS", 60.0)
+        connect_timeout = read_float_env("OPENROUTER_CONNECT_TIMEOUT_SECONDS", 10.0)
+        logger.info(
+            "vlm_http_pool_config max_connections=%s max_keepalive=%s keepalive_expiry=%s timeout=%s trust_env=%s",
+            max_connections,
+            max_keepalive,
+            keepalive_expiry,
+            timeout_seconds,
+            trust_env,
+        )
+        return httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive,
+                keepalive_expiry=keepalive_expiry,
+            ),
+            timeout=httpx.Timeout(timeout_seconds, connect=connect_timeout),
+            trust_env=trust_env,
+        )
+
+    async def aclose(self) -> None:
+        """关闭共享连接池（应用退出时调用）"""
+        if self.http_client is not None:
+            await self.http_client.aclose()
+            self.http_client = None
 
     def _enable_langsmith_if_needed(self) -> None:
         tracing_flag = os.getenv("LANGSMITH_TRACING", "").strip().lower()
@@ -128,6 +299,8 @@ class VLMService:
             return
 
         try:
+            from langsmith.wrappers import wrap_openai
+
             self.client = wrap_openai(self.client)
             logger.info(
                 "LangSmith tracing 已启用，project=%s",
@@ -136,130 +309,101 @@ class VLMService:
         except Exception as e:
             logger.error("LangSmith 包装 OpenAI 客户端失败: %s", e)
     
-    def _image_to_base64(self, image: Image.Image) -> str:
-        """将 PIL Image 转换为 Base64 字符串"""
+    def _image_to_base64(self, image: Image.Image, max_dimension: Optional[int] = None) -> str:
+        """将 PIL Image 转换为 Base64 字符串（超过 max_dimension 时先等比缩小）"""
         # 确保图片为 RGB 模式（JPEG 不支持 RGBA）
         if image.mode != "RGB":
             image = image.convert("RGB")
+        if max_dimension and max(image.size) > max_dimension:
+            image = image.copy()
+            image.thumbnail((max_dimension, max_dimension), Image.Resampling.LANCZOS)
         buffered = io.BytesIO()
         image.save(buffered, format="JPEG", quality=85)
         img_base64 = base64.b64encode(buffered.getvalue()).decode('utf-8')
         return img_base64
+
+    def _can_passthrough(self, image: Image.Image, image_bytes: Optional[bytes]) -> bool:
+        """原始字节已是尺寸和体积都在限制内的 JPEG 时可直接透传"""
+        return (
+            image_bytes is not None
+            and image.format == "JPEG"
+            and image.mode in ("RGB", "L")
+            and max(image.size) <= self.passthrough_max_dimension
+            and len(image_bytes) <= self.passthrough_max_bytes
+        )
+
+    def _encode_image(self, image: Image.Image, image_bytes: Optional[bytes] = None) -> tuple[str, str]:
+        """
+        生成发送给模型的 Base64 图片
+
+        Returns:
+            (Base64 字符串, 编码路径 passthrough / transcode)
+        """
+        if self._can_passthrough(image, image_bytes):
+            return base64.b64encode(image_bytes).decode("ascii"), "passthrough"
+        return self._image_to_base64(image, max_dimension=self.passthrough_max_dimension), "transcode"
     
     def _parse_json_response(self, text: str, request_id: str = "-") -> dict:
         """
         健壮的 JSON 解析器，具有高容错率
         
-        处理以下情况：
-        1. JSON 被 markdown 代码块包裹 (```json ... ```)
-        2. JSON 中包含单引号而非双引号
+        先尝试 json.loads（去掉 markdown 代码块后），失败时交给单遍容错解析器，处理：
+        1. JSON 被 markdown 代码块包裹或前后有说明文字
+        2. JSON 中包含单引号、Python 字面量或字符串内未转义的双引号
         3. JSON 中包含尾随逗号
         4. JSON 中包含注释
-        5. JSON 格式不完整但可修复
+        5. 输出被截断，JSON 不完整但可补全
         """
-        import json
-        import re
-        
-        # 1. 移除 markdown 代码块标记
-        text = re.sub(r'```json\s*', '', text)
-        text = re.sub(r'```\s*$', '', text)
-        text = text.strip()
-        
-        # 2. 尝试直接解析
         try:
-            result = json.loads(text)
-            logger.info("vlm_json_parse_done request_id=%s method=direct %s", request_id, memory_snapshot())
-            return result
-        except json.JSONDecodeError:
-            pass
-        
-        # 3. 提取 JSON 对象（匹配最外层的大括号）
-        json_match = re.search(r'\{[\s\S]*\}', text)
-        if json_match:
-            json_str = json_match.group(0)
+            result, method, repairs = parse_model_json(text)
+        except ValueError as e:
+            result, method, repairs = None, "failed", frozenset()
+            error = e
         else:
-            json_str = text
-        
-        # 4. 修复常见的 JSON 问题
-        # 4.1 移除单行注释
-        json_str = re.sub(r'//.*?$', '', json_str, flags=re.MULTILINE)
-        # 4.2 移除多行注释
-        json_str = re.sub(r'/\*[\s\S]*?\*/', '', json_str)
-        # 4.3 移除尾随逗号（在对象和数组的最后一个元素后）
-        json_str = re.sub(r',(\s*[}\]])', r'\1', json_str)
-        
-        # 4.4 尝试解析修复后的 JSON
-        try:
-            result = json.loads(json_str)
-            logger.info("vlm_json_parse_done request_id=%s method=cleaned %s", request_id, memory_snapshot())
-            return result
-        except json.JSONDecodeError:
-            pass
-        
-        # 5. 更激进的修复：将单引号替换为双引号（但要小心处理字符串内容）
-        # 使用正则表达式匹配字符串内容，避免破坏字符串内的单引号
-        def fix_quotes(match):
-            content = match.group(1)
-            # 如果内容包含双引号，需要转义
-            content = content.replace('"', '\\"')
-            return f'"{content}"'
-        
-        # 匹配单引号字符串
-        json_str = re.sub(r"'([^']*)'", fix_quotes, json_str)
-        # 再次移除尾随逗号
-        json_str = re.sub(r',(\s*[}\]])', r'\1', json_str)
-        
-        try:
-            result = json.loads(json_str)
-            logger.info("vlm_json_parse_done request_id=%s method=quote_fix %s", request_id, memory_snapshot())
-            return result
-        except json.JSONDecodeError as e:
-            logger.warning(
-                "vlm_json_parse_retry request_id=%s error=%s raw_len=%s raw_preview=%s %s",
+            error = "顶层不是 JSON 对象"
+        return self._checked_parse_result(result, method, repairs, text, request_id, error)
+
+    def _checked_parse_result(
+        self,
+        result: object,
+        method: str,
+        repairs: frozenset,
+        text: str,
+        request_id: str,
+        error: object = None,
+    ) -> dict:
+        if isinstance(result, dict):
+            JSON_PARSE.inc(method)
+            add_request_fields(parse_method=method)
+            for repair in repairs:
+                JSON_REPAIRS.inc(repair)
+            logger.info(
+                "vlm_json_parse_done request_id=%s method=%s repairs=%s %s",
                 request_id,
-                e,
-                len(text or ""),
-                text_preview(text, 500),
+                method,
+                ",".join(sorted(repairs)) or "-",
                 memory_snapshot(),
             )
-            # 6. 最后尝试：使用 ast.literal_eval（仅当 JSON 格式接近 Python 字典时）
-            try:
-                import ast
-                # 将单引号字典转换为双引号 JSON
-                safe_str = text.replace("'", '"')
-                # 尝试解析为 Python 字面量
-                if safe_str.strip().startswith('{'):
-                    # 使用 eval 作为最后手段（仅限受控环境）
-                    # 注意：在生产环境中应该避免使用 eval
-                    # 这里仅作为容错手段
-                    try:
-                        result = ast.literal_eval(text.replace('true', 'True').replace('false', 'False').replace('null', 'None'))
-                        # 转换回标准 JSON 格式
-                        parsed = json.loads(json.dumps(result))
-                        logger.info("vlm_json_parse_done request_id=%s method=ast_literal_eval %s", request_id, memory_snapshot())
-                        return parsed
-                    except:
-                        pass
-            except Exception as e2:
-                logger.error("vlm_json_parse_ast_failed request_id=%s error=%s %s", request_id, e2, memory_snapshot())
-            
-            # 如果所有方法都失败，记录错误并返回包含错误信息的字典
-            logger.error(
-                "vlm_json_parse_failed request_id=%s error=%s raw_len=%s raw_preview=%s %s",
-                request_id,
-                e,
-                len(text or ""),
-                text_preview(text, 700),
-                memory_snapshot(),
-            )
-            # 返回错误信息，而不是空字典
-            return {
-                "error": "数据解析失败，可能是图片类型不正确或 API 返回格式异常，请重新上传清晰的商品标签图片",
-                "error_type": "parse_error"
-            }
+            return result
+
+        # 如果所有方法都失败，记录错误并返回包含错误信息的字典
+        JSON_PARSE.inc("failed")
+        logger.error(
+            "vlm_json_parse_failed request_id=%s error=%s raw_len=%s raw_preview=%s %s",
+            request_id,
+            error,
+            len(text or ""),
+            text_preview(text, 700),
+            memory_snapshot(),
+        )
+        # 返回错误信息，而不是空字典
+        return {
+            "error": "数据解析失败，可能是图片类型不正确或 API 返回格式异常，请重新上传清晰的商品标签图片",
+            "error_type": "parse_error"
+        }
     
-    def _build_prompt(self, ocr_text: str) -> str:
-        """构建发送给 VLM 的提示词"""
+    def _build_prompt(self, ocr_text: str, known_risks: Optional[list[RiskItem]] = None) -> str:
+        """构建发送给 VLM 的提示词；known_risks 为添加剂索引已识别的风险成分"""
         prompt = """你是一位专业的食品营养学家。请根据提供的商品包装图片和 OCR 文字，识别所有成分。
 
 **重要：图片类型判断（宽松标准）**
@@ -298,13 +442,7 @@ class VLMService:
    - 简短的科学解释
    - 适用人群建议
 
-5. **完整成分列表 (full_ingredients)**：
-   - 必须列出产品中的所有成分
-   - 每个成分应包含：
-     * name: 成分名称
-     * description: 详细的科学解释、健康影响、适用人群建议
-   - 即使是安全成分，也要提供简要说明
-
+{INGREDIENT_RULES}
 6. **提供 1-2 个更健康的替代品建议**
 
 请以 JSON 格式返回结果，严格遵循以下结构：
@@ -325,17 +463,7 @@ class VLMService:
       "desc": "天然甜味剂，但含糖量高。糖尿病患者应监控摄入量。"
     }
   ],
-  "full_ingredients": [
-    {
-      "name": "Organic Oats",
-      "description": "有机燕麦，富含膳食纤维和复合碳水化合物，有助于维持血糖稳定。适合大多数人群，是优质的全谷物来源。"
-    },
-    {
-      "name": "Honey",
-      "description": "天然甜味剂，含有抗氧化物质和微量矿物质。虽然天然，但仍为糖类，糖尿病患者应控制摄入量。"
-    }
-  ],
-  "alternatives": ["Natural Stevia Oats", "Unsweetened Granola"]
+{INGREDIENT_EXAMPLE}  "alternatives": ["Natural Stevia Oats", "Unsweetened Granola"]
 }
 
 **如果图片不是商品标签图，返回：**
@@ -346,11 +474,28 @@ class VLMService:
 
 如果 OCR 文字为空或模糊，请仅通过视觉分析图片中的成分信息。"""
         
+        if self.description_cache is not None:
+            prompt = prompt.replace("{INGREDIENT_RULES}", _COMPACT_INGREDIENT_RULES).replace(
+                "{INGREDIENT_EXAMPLE}", _COMPACT_INGREDIENT_EXAMPLE
+            )
+        else:
+            prompt = prompt.replace("{INGREDIENT_RULES}", _INLINE_INGREDIENT_RULES).replace(
+                "{INGREDIENT_EXAMPLE}", _INLINE_INGREDIENT_EXAMPLE
+            )
+
         if ocr_text and ocr_text.strip():
             logger.debug(f"OCR 提取的文字内容: {ocr_text[:200]}...")
             prompt += f"\n\nOCR 提取的文字内容：\n{ocr_text}"
         else:
             prompt += "\n\n注意：OCR 未能提取到文字，请仅通过视觉分析图片。"
+
+        if known_risks:
+            known_lines = "\n".join(f"- {risk.name}: {risk.level}" for risk in known_risks)
+            prompt += (
+                "\n\n以下风险成分已由添加剂知识库识别，系统会直接写入 risks，"
+                "请不要在 risks 中重复列出，只补充知识库未覆盖的风险成分（full_ingredients 仍需列出全部成分）：\n"
+                f"{known_lines}"
+            )
         
         return prompt
 
@@ -382,11 +527,229 @@ class VLMService:
 
         return str(content)
     
+    async def _backend_ready(self) -> bool:
+        if self.backend_mode == "replay":
+            return self.recorder is not None
+        if not self._client_initialized:
+            try:
+                await asyncio.to_thread(self.ensure_client)
+            except Exception as e:
+                # 如导入 openai 失败：本次按不可用处理，下一个请求重试
+                logger.error("vlm_client_init_failed error_type=%s error=%s", type(e).__name__, e)
+        return self.client is not None
+
+    def _unavailable_response(self, request_id: str) -> AnalyzeResponse:
+        logger.error("vlm_unavailable request_id=%s reason=missing_client_or_key %s", request_id, memory_snapshot())
+        return AnalyzeResponse(
+            health_score="",
+            summary="",
+            risks=[],
+            full_ingredients=[],
+            alternatives=[],
+            error="VLM 服务不可用：请检查 OPENROUTER_API_KEY 和 OpenRouter 客户端配置",
+            error_type="api_error",
+        )
+
+    def _prepare_messages(
+        self,
+        image: Image.Image,
+        ocr_text: str,
+        request_id: str,
+        image_bytes: Optional[bytes],
+        known_risks: Optional[list[RiskItem]] = None,
+    ) -> list[dict]:
+        """编码图片、构建提示词，返回 Chat Completions 的 messages"""
+        # 转换图片为 Base64
+        step_ms = now_ms()
+        img_base64, encode_path = self._encode_image(image, image_bytes)
+        observe_ms("encode", elapsed_ms(step_ms))
+        logger.info(
+            "vlm_image_encoded request_id=%s elapsed_ms=%s encode_path=%s image_base64_len=%s image_size=%s ocr_text_len=%s ocr_preview=%s %s",
+            request_id,
+            elapsed_ms(step_ms),
+            encode_path,
+            len(img_base64),
+            image.size,
+            len(ocr_text or ""),
+            text_preview(ocr_text) if detail_enabled() else "-",
+            memory_snapshot(),
+        )
+        # 构建提示词
+        step_ms = now_ms()
+        prompt = self._build_prompt(ocr_text, known_risks)
+        observe_ms("prompt", elapsed_ms(step_ms))
+        logger.info(
+            "vlm_prompt_ready request_id=%s prompt_len=%s known_risks=%s model=%s base_url=%s %s",
+            request_id,
+            len(prompt),
+            len(known_risks or []),
+            self.model_name,
+            self.base_url,
+            memory_snapshot(),
+        )
+        return [
+            {
+                "role": "user",
+                "content": [
+                    {
+                        "type": "text",
+                        "text": prompt,
+                    },
+                    {
+                        "type": "image_url",
+                        "image_url": {
+                            "url": f"data:image/jpeg;base64,{img_base64}"
+                        },
+                    }
+                ]
+            }
+        ]
+
+    def _build_analyze_response(self, result_data: dict, request_id: str, total_start_ms: int) -> AnalyzeResponse:
+        """把解析后的模型 JSON 转换为 AnalyzeResponse"""
+        # 检查解析结果是否为空（解析失败）
+        if not result_data:
+            logger.error("vlm_parse_empty request_id=%s %s", request_id, memory_snapshot())
+            return AnalyzeResponse(
+                health_score="",
+                summary="",
+                risks=[],
+                full_ingredients=[],
+                alternatives=[],
+                error="数据解析失败，请尝试重新上传图片或检查图片是否为商品标签图",
+                error_type="parse_error"
+            )
+        
+        # 检查是否有错误信息（图片类型错误等）- 优先检查
+        if result_data.get("error"):
+            error_msg = result_data.get("error", "分析失败")
+            error_type = result_data.get("error_type", "unknown_error")
+            logger.info(
+                "vlm_model_error request_id=%s error_type=%s error=%s total_elapsed_ms=%s %s",
+                request_id,
+                error_type,
+                text_preview(error_msg),
+                elapsed_ms(total_start_ms),
+                memory_snapshot(),
+            )
+            return AnalyzeResponse(
+                health_score="",
+                summary="",
+                risks=[],
+                full_ingredients=[],
+                alternatives=[],
+                error=error_msg,
+                error_type=error_type
+            )
+        
+        # 处理 full_ingredients：可能是字符串列表或对象列表
+        full_ingredients = []
+        ingredients_detail = []
+        for item in result_data.get("full_ingredients", []):
+            ingredient = self._ingredient_detail(item)
+            full_ingredients.append(ingredient.name)
+            if ingredient.description:
+                ingredients_detail.append(ingredient)
+        
+        # 转换为响应模型
+        response_data = AnalyzeResponse(
+            health_score=result_data.get("health_score", "C"),
+            summary=result_data.get("summary", "Unknown"),
+            risks=[self._risk_item(risk) for risk in result_data.get("risks", [])],
+            full_ingredients=full_ingredients,
+            ingredients_detail=ingredients_detail if ingredients_detail else None,
+            alternatives=result_data.get("alternatives", []),
+            confidence=result_data.get("confidence", 0.8),
+            error=None,
+            error_type=None
+        )
+        logger.info(
+            "vlm_done request_id=%s total_elapsed_ms=%s score=%s risks=%s ingredients=%s alternatives=%s %s",
+            request_id,
+            elapsed_ms(total_start_ms),
+            response_data.health_score,
+            len(response_data.risks),
+            len(response_data.full_ingredients),
+            len(response_data.alternatives),
+            memory_snapshot(),
+        )
+        return response_data
+
+    def _risk_item(self, risk: object) -> RiskItem:
+        if isinstance(risk, dict):
+            return RiskItem(
+                level=risk.get("level", "Low"),
+                name=risk.get("name", str(risk)),
+                desc=risk.get("desc", ""),
+            )
+        return RiskItem(level="Low", name=str(risk), desc="")
+
+    def _ingredient_detail(self, item: object) -> IngredientDetail:
+        if isinstance(item, dict):
+            # 如果是对象，提取名称和描述
+            name = item.get("name", str(item))
+            description = item.get("description", item.get("desc", ""))
+            return IngredientDetail(name=name, description=description or None)
+        # 如果是字符串，直接使用
+        return IngredientDetail(name=item if isinstance(item, str) else str(item))
+
+    def _exception_response(self, e: Exception, request_id: str) -> AnalyzeResponse:
+        logger.error(
+            "vlm_failed request_id=%s error=%s %s",
+            request_id,
+            e,
+            memory_snapshot(),
+            exc_info=True,
+        )
+        # 失败时返回错误信息，而不是模拟数据
+        error_message = str(e)
+        lowered = error_message.lower()
+        if isinstance(e, _openrouter_api_errors()) or "api" in lowered or "openrouter" in lowered or "status code" in lowered:
+            error_type = "api_error"
+        elif "JSON 解析" in error_message or "解析" in error_message:
+            error_type = "parse_error"
+        else:
+            error_type = "unknown_error"
+        
+        return AnalyzeResponse(
+            health_score="",
+            summary="",
+            risks=[],
+            full_ingredients=[],
+            alternatives=[],
+            error=f"分析失败：{error_message}",
+            error_type=error_type
+        )
+
+    def _parse_result_text(self, result_text: str, request_id: str) -> dict:
+        logger.info(
+            "vlm_response_text_ready request_id=%s text_len=%s text_preview=%s %s",
+            request_id,
+            len(result_text),
+            text_preview(result_text, 700) if detail_enabled() else "-",
+            memory_snapshot(),
+        )
+        
+        # 提取并解析 JSON（使用健壮的解析器）
+        parse_start_ms = now_ms()
+        result_data = self._parse_json_response(result_text, request_id=request_id)
+        observe_ms("parse", elapsed_ms(parse_start_ms))
+        logger.info(
+            "vlm_parse_done request_id=%s elapsed_ms=%s keys=%s %s",
+            request_id,
+            elapsed_ms(parse_start_ms),
+            list(result_data.keys()) if isinstance(result_data, dict) else type(result_data).__name__,
+            memory_snapshot(),
+        )
+        return result_data
+
     async def analyze_ingredients(
         self,
         image: Image.Image,
         ocr_text: str = "",
-        request_id: str = "-"
+        request_id: str = "-",
+        image_bytes: Optional[bytes] = None,
+        known_risks: Optional[list[RiskItem]] = None,
     ) -> AnalyzeResponse:
         """
         分析产品成分
@@ -394,77 +757,54 @@ class VLMService:
         Args:
             image: PIL Image 对象
             ocr_text: OCR 提取的文字
+            image_bytes: 上传的原始图片字节；满足透传条件时直接发送，避免重新编码
+            known_risks: 添加剂索引已识别的风险成分，写入提示词让模型只补充遗漏项
             
         Returns:
             AnalyzeResponse 对象
         """
-        if not OPENROUTER_SDK_AVAILABLE or not self.api_key or not self.client:
-            logger.error("vlm_unavailable request_id=%s reason=missing_client_or_key %s", request_id, memory_snapshot())
-            return AnalyzeResponse(
-                health_score="",
-                summary="",
-                risks=[],
-                full_ingredients=[],
-                alternatives=[],
-                error="VLM 服务不可用：请检查 OPENROUTER_API_KEY 和 OpenRouter 客户端配置",
-                error_type="api_error",
-            )
+        if not await self._backend_ready():
+            return self._unavailable_response(request_id)
         
         try:
             total_start_ms = now_ms()
-            # 转换图片为 Base64
-            step_ms = now_ms()
-            img_base64 = self._image_to_base64(image)
-            logger.info(
-                "vlm_image_encoded request_id=%s elapsed_ms=%s image_base64_len=%s image_size=%s ocr_text_len=%s ocr_preview=%s %s",
-                request_id,
-                elapsed_ms(step_ms),
-                len(img_base64),
-                image.size,
-                len(ocr_text or ""),
-                text_preview(ocr_text),
-                memory_snapshot(),
-            )
-            # 构建提示词
-            prompt = self._build_prompt(ocr_text)
-            logger.info(
-                "vlm_prompt_ready request_id=%s prompt_len=%s model=%s base_url=%s %s",
-                request_id,
-                len(prompt),
-                self.model_name,
-                self.base_url,
-                memory_snapshot(),
+            messages = self._prepare_messages(image, ocr_text, request_id, image_bytes, known_risks)
+            # 配置了多个模型时，主模型超过其 p90 耗时仍未返回或调用失败，就向下一个模型发出对冲请求
+            response_data, model = await self.router.run(
+                lambda model: self._analyze_with_model(model, messages, request_id, total_start_ms),
+                is_valid=lambda result: result.error_type not in _FAILED_CALL_ERROR_TYPES,
+                request_id=request_id,
             )
+            add_request_fields(model=model)
+            return await self._fill_descriptions(response_data, request_id)
             
+        except Exception as e:
+            return self._exception_response(e, request_id)
+
+    async def _analyze_with_model(
+        self,
+        model: str,
+        messages: list[dict],
+        request_id: str,
+        total_start_ms: int,
+    ) -> AnalyzeResponse:
+        """用指定模型完成一次分析调用（不含成分说明填充）；异常转换为带 error_type 的结果"""
+        try:
             # 调用 OpenRouter API（OpenAI-compatible Chat Completions）
-            logger.info("vlm_openrouter_start request_id=%s model=%s %s", request_id, self.model_name, memory_snapshot())
-            messages = [
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": prompt,
-                        },
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/jpeg;base64,{img_base64}"
-                            },
-                        }
-                    ]
-                }
-            ]
-            
+            logger.info("vlm_openrouter_start request_id=%s model=%s %s", request_id, model, memory_snapshot())
             api_start_ms = now_ms()
-            response = self.client.chat.completions.create(
-                model=self.model_name,
+            response = await self._create_completion(
+                model,
+                request_id,
+                "analyze",
                 messages=messages,
                 max_tokens=2000
             )
+            observe_ms("openrouter", elapsed_ms(api_start_ms))
             logger.info(
-                "vlm_openrouter_done request_id=%s elapsed_ms=%s response_id=%s response_model=%s finish_reason=%s usage=%s %s",
+                "vlm_openrouter_done request_id=%s model=%s elapsed_ms=%s response_id=%s response_model=%s finish_reason=%s usage=%s %s",
                 request_id,
+                model,
                 elapsed_ms(api_start_ms),
                 getattr(response, "id", None),
                 getattr(response, "model", None),
@@ -472,6 +812,7 @@ class VLMService:
                 getattr(response, "usage", None),
                 memory_snapshot(),
             )
+            self._log_usage(request_id, "analyze", getattr(response, "usage", None), model=model)
 
             if not response.choices:
                 raise Exception("API 响应为空，未返回候选结果")
@@ -490,147 +831,303 @@ class VLMService:
                 )
                 raise Exception("API 响应格式异常，无法提取文本内容")
             
+            result_data = self._parse_result_text(result_text, request_id)
+            return self._build_analyze_response(result_data, request_id, total_start_ms)
+            
+        except Exception as e:
+            return self._exception_response(e, request_id)
+
+    async def _create_completion(self, model: str, request_id: str, call: str, **kwargs):
+        """Chat Completions 调用，经过重试策略和该模型的熔断器；按最终结果计数（重试不单独计数）"""
+        IN_FLIGHT.inc("openrouter")
+        outcome = "ok"
+        try:
+            if self.recorder is not None:
+                create = partial(self.recorder.create, model, call, **kwargs)
+            else:
+                create = partial(self.client.chat.completions.create, model=model, **kwargs)
+            return await self.retry_policy.call(
+                create,
+                breaker=self.breakers.get(model),
+                request_id=request_id,
+            )
+        except CircuitOpenError:
+            outcome = "circuit_open"
+            raise
+        except ReplayMissError:
+            outcome = "replay_miss"
+            raise
+        except RetryBudgetExceeded:
+            outcome = "budget_exceeded"
+            raise
+        except asyncio.CancelledError:
+            outcome = "cancelled"
+            raise
+        except Exception as e:
+            outcome = str(status_code_of(e) or "error")
+            raise
+        finally:
+            IN_FLIGHT.dec("openrouter")
+            OPENROUTER_CALLS.inc(model, call, outcome)
+
+    def stats(self) -> dict:
+        """各模型的路由计数、延迟分位数和熔断器状态，以及累计重试次数"""
+        routing = self.router.stats()
+        return {
+            "backend_mode": self.backend_mode,
+            "recording": self.recorder.store.stats() if self.recorder is not None else None,
+            "retries": self.retry_policy.retries,
+            "models": {
+                model: {**routing[model], "circuit": self.breakers[model].stats()} for model in self.models
+            },
+        }
+
+    async def stream_analyze_ingredients(
+        self,
+        image: Image.Image,
+        ocr_text: str = "",
+        request_id: str = "-",
+        image_bytes: Optional[bytes] = None,
+        known_risks: Optional[list[RiskItem]] = None,
+    ) -> AsyncIterator[tuple[str, object]]:
+        """
+        流式分析产品成分（stream=True），边生成边产出结构化事件
+
+        依次产出 (事件类型, 数据)：
+        - ("health_score", str) / ("summary", str)
+        - ("risk", RiskItem)：每个风险项
+        - ("ingredient", IngredientDetail)：每个成分
+        - ("alternatives", list[str])
+        - ("result", AnalyzeResponse)：最终完整结果，总是最后一个事件
+        """
+        if not await self._backend_ready():
+            yield "result", self._unavailable_response(request_id)
+            return
+
+        stream = None
+        try:
+            total_start_ms = now_ms()
+            messages = self._prepare_messages(image, ocr_text, request_id, image_bytes, known_risks)
+            add_request_fields(model=self.model_name)
+
             logger.info(
-                "vlm_response_text_ready request_id=%s text_len=%s text_preview=%s %s",
+                "vlm_openrouter_stream_start request_id=%s model=%s %s",
                 request_id,
-                len(result_text),
-                text_preview(result_text, 700),
+                self.model_name,
                 memory_snapshot(),
             )
-            
-            # 提取并解析 JSON（使用健壮的解析器）
-            parse_start_ms = now_ms()
-            result_data = self._parse_json_response(result_text, request_id=request_id)
+            api_start_ms = now_ms()
+            # 只有建立流之前的失败会重试，已经开始输出的流不重试
+            stream = await self._create_completion(
+                self.model_name,
+                request_id,
+                "analyze_stream",
+                messages=messages,
+                max_tokens=2000,
+                stream=True,
+                stream_options={"include_usage": True},
+            )
+
+            parser = TolerantJSONParser(emit_depth=2)
+            text_parts: list[str] = []
+            first_token_ms = None
+            finish_reason = None
+            usage = None
+            async for chunk in stream:
+                if getattr(chunk, "usage", None):
+                    usage = chunk.usage
+                if not chunk.choices:
+                    continue
+                choice = chunk.choices[0]
+                finish_reason = choice.finish_reason or finish_reason
+                delta_text = self._extract_response_text(getattr(choice.delta, "content", None))
+                if not delta_text:
+                    continue
+                if first_token_ms is None:
+                    first_token_ms = elapsed_ms(api_start_ms)
+                text_parts.append(delta_text)
+                for path, value in parser.feed(delta_text):
+                    event = self._stream_event(path, value)
+                    if event is not None:
+                        yield event
+
             logger.info(
-                "vlm_parse_done request_id=%s elapsed_ms=%s keys=%s %s",
+                "vlm_openrouter_stream_done request_id=%s elapsed_ms=%s first_token_ms=%s finish_reason=%s usage=%s %s",
                 request_id,
-                elapsed_ms(parse_start_ms),
-                list(result_data.keys()) if isinstance(result_data, dict) else type(result_data).__name__,
+                elapsed_ms(api_start_ms),
+                first_token_ms,
+                finish_reason,
+                usage,
                 memory_snapshot(),
             )
-            
-            # 检查解析结果是否为空（解析失败）
-            if not result_data:
-                logger.error("vlm_parse_empty request_id=%s %s", request_id, memory_snapshot())
-                return AnalyzeResponse(
-                    health_score="",
-                    summary="",
-                    risks=[],
-                    full_ingredients=[],
-                    alternatives=[],
-                    error="数据解析失败，请尝试重新上传图片或检查图片是否为商品标签图",
-                    error_type="parse_error"
-                )
-            
-            # 检查是否有错误信息（图片类型错误等）- 优先检查
-            if result_data.get("error"):
-                error_msg = result_data.get("error", "分析失败")
-                error_type = result_data.get("error_type", "unknown_error")
-                logger.info(
-                    "vlm_model_error request_id=%s error_type=%s error=%s total_elapsed_ms=%s %s",
-                    request_id,
-                    error_type,
-                    text_preview(error_msg),
-                    elapsed_ms(total_start_ms),
-                    memory_snapshot(),
-                )
-                return AnalyzeResponse(
-                    health_score="",
-                    summary="",
-                    risks=[],
-                    full_ingredients=[],
-                    alternatives=[],
-                    error=error_msg,
-                    error_type=error_type
-                )
-            
-            # 如果解析结果为空字典，说明解析失败
-            if result_data == {}:
-                logger.error("vlm_parse_empty_dict request_id=%s %s", request_id, memory_snapshot())
-                return AnalyzeResponse(
-                    health_score="",
-                    summary="",
-                    risks=[],
-                    full_ingredients=[],
-                    alternatives=[],
-                    error="数据解析失败，可能是图片类型不正确，请上传清晰的商品标签图片",
-                    error_type="parse_error"
-                )
-            
-            # 处理 full_ingredients：可能是字符串列表或对象列表
-            full_ingredients_raw = result_data.get("full_ingredients", [])
-            full_ingredients = []
-            ingredients_detail = []
-            
-            for item in full_ingredients_raw:
-                if isinstance(item, dict):
-                    # 如果是对象，提取名称和描述
-                    name = item.get("name", str(item))
-                    description = item.get("description", item.get("desc", ""))
-                    full_ingredients.append(name)
-                    if description:
-                        ingredients_detail.append(IngredientDetail(name=name, description=description))
-                elif isinstance(item, str):
-                    # 如果是字符串，直接使用
-                    full_ingredients.append(item)
-                else:
-                    name = str(item)
-                    full_ingredients.append(name)
-            
-            # 转换为响应模型
-            response_data = AnalyzeResponse(
-                health_score=result_data.get("health_score", "C"),
-                summary=result_data.get("summary", "Unknown"),
-                risks=[
-                    RiskItem(**risk) if isinstance(risk, dict) else RiskItem(
-                        level=risk.get("level", "Low") if isinstance(risk, dict) else "Low",
-                        name=risk.get("name", str(risk)) if isinstance(risk, dict) else str(risk),
-                        desc=risk.get("desc", "") if isinstance(risk, dict) else ""
-                    ) for risk in result_data.get("risks", [])
-                ],
-                full_ingredients=full_ingredients,
-                ingredients_detail=ingredients_detail if ingredients_detail else None,
-                alternatives=result_data.get("alternatives", []),
-                confidence=result_data.get("confidence", 0.8),
-                error=None,
-                error_type=None
-            )
+            observe_ms("openrouter", elapsed_ms(api_start_ms))
+            self._log_usage(request_id, "analyze_stream", usage)
+
+            result_text = "".join(text_parts).strip()
+            if not result_text:
+                raise Exception("API 响应格式异常，无法提取文本内容")
             logger.info(
-                "vlm_done request_id=%s total_elapsed_ms=%s score=%s risks=%s ingredients=%s alternatives=%s %s",
+                "vlm_response_text_ready request_id=%s text_len=%s text_preview=%s %s",
                 request_id,
-                elapsed_ms(total_start_ms),
-                response_data.health_score,
-                len(response_data.risks),
-                len(response_data.full_ingredients),
-                len(response_data.alternatives),
+                len(result_text),
+                text_preview(result_text, 700) if detail_enabled() else "-",
                 memory_snapshot(),
             )
-            return response_data
-            
+            # 流式过程中已增量解析完毕，这里只需收尾，不再重新解析全文
+            try:
+                result = parser.close()
+            except ValueError:
+                result = None
+            if isinstance(result, dict) and ("health_score" in result or "error" in result):
+                result_data = self._checked_parse_result(
+                    result, "stream", frozenset(parser.repairs), result_text, request_id
+                )
+            else:
+                # 代码块前的说明文字里出现花括号等情况，退回整段解析
+                result_data = self._parse_json_response(result_text, request_id=request_id)
+            response_data = self._build_analyze_response(result_data, request_id, total_start_ms)
+            yield "result", await self._fill_descriptions(response_data, request_id)
+
         except Exception as e:
-            logger.error(
-                "vlm_failed request_id=%s error=%s %s",
+            yield "result", self._exception_response(e, request_id)
+        finally:
+            if stream is not None:
+                await stream.close()
+
+    def _stream_event(self, path: tuple, value: object) -> Optional[tuple[str, object]]:
+        """把增量解析出的字段转换为对外事件；其余字段忽略（以最终结果为准）"""
+        if len(path) == 1:
+            key = path[0]
+            if key in ("health_score", "summary") and isinstance(value, str):
+                return key, value
+            if key == "alternatives" and isinstance(value, list):
+                return "alternatives", value
+            return None
+        try:
+            if path[0] == "risks":
+                return "risk", self._risk_item(value)
+            if path[0] == "full_ingredients":
+                ingredient = self._ingredient_detail(value)
+                if ingredient.description is None and self.description_cache is not None:
+                    ingredient.description = self.description_cache.get_many([ingredient.name]).get(ingredient.name)
+                return "ingredient", ingredient
+        except ValidationError:
+            return None
+        return None
+
+    async def _fill_descriptions(self, result: AnalyzeResponse, request_id: str) -> AnalyzeResponse:
+        """
+        compact 模式下用成分说明缓存填充 ingredients_detail
+
+        缓存未收录的成分（最多 INGREDIENT_DESCRIBE_MAX_NAMES 个）合并为一次纯文本请求生成说明并写回缓存；
+        该请求失败时这些成分没有说明，不影响分析结果。
+        """
+        if self.description_cache is None or result.error or not result.full_ingredients:
+            return result
+        step_ms = now_ms()
+        cache = self.description_cache
+        cached = cache.get_many(result.full_ingredients)
+        # 模型没有遵守提示词、仍然写了说明时，直接收录
+        provided = {
+            detail.name: detail.description
+            for detail in result.ingredients_detail or []
+            if detail.description and detail.name not in cached
+        }
+        unseen: dict[str, str] = {}
+        for name in result.full_ingredients:
+            key = normalize_ingredient_name(name)
+            if key and name not in cached and name not in provided and key not in unseen:
+                unseen[key] = name
+        to_describe = list(unseen.values())[: self.describe_max_names]
+        generated = await self._describe_ingredients(to_describe, request_id) if to_describe else {}
+
+        new_descriptions = {**provided, **generated}
+        try:
+            await asyncio.to_thread(self._store_descriptions, new_descriptions, list(cached))
+        except sqlite3.Error as e:
+            logger.warning("description_cache_write_failed request_id=%s error=%s", request_id, e)
+
+        known = {normalize_ingredient_name(name): text for name, text in {**cached, **new_descriptions}.items()}
+        details = [
+            IngredientDetail(name=name, description=known[normalize_ingredient_name(name)])
+            for name in result.full_ingredients
+            if normalize_ingredient_name(name) in known
+        ]
+        logger.info(
+            "vlm_descriptions_filled request_id=%s elapsed_ms=%s ingredients=%s cached=%s provided=%s generated=%s missing=%s",
+            request_id,
+            elapsed_ms(step_ms),
+            len(result.full_ingredients),
+            len(cached),
+            len(provided),
+            len(generated),
+            len(result.full_ingredients) - len(details),
+        )
+        return result.model_copy(update={"ingredients_detail": details or None})
+
+    def _store_descriptions(self, descriptions: dict[str, str], hit_names: list[str]) -> None:
+        if descriptions:
+            self.description_cache.put_many(descriptions, source=self.model_name)
+        if hit_names:
+            self.description_cache.record_hits(hit_names)
+
+    async def _describe_ingredients(self, names: list[str], request_id: str) -> dict[str, str]:
+        """纯文本请求：为缓存未收录的成分生成说明，返回 {成分名: 说明}"""
+        step_ms = now_ms()
+        try:
+            response = await self._create_completion(
+                self.model_name,
                 request_id,
-                e,
-                memory_snapshot(),
-                exc_info=True,
+                "describe",
+                messages=[{"role": "user", "content": _DESCRIBE_PROMPT + json.dumps(names, ensure_ascii=False)}],
+                max_tokens=min(2000, 200 + 120 * len(names)),
             )
-            # 失败时返回错误信息，而不是模拟数据
-            error_message = str(e)
-            lowered = error_message.lower()
-            if "api" in lowered or "openrouter" in lowered or "status code" in lowered:
-                error_type = "api_error"
-            elif "JSON 解析" in error_message or "解析" in error_message:
-                error_type = "parse_error"
-            else:
-                error_type = "unknown_error"
-            
-            return AnalyzeResponse(
-                health_score="",
-                summary="",
-                risks=[],
-                full_ingredients=[],
-                alternatives=[],
-                error=f"分析失败：{error_message}",
-                error_type=error_type
+            self._log_usage(request_id, "describe", getattr(response, "usage", None))
+            text = self._extract_response_text(response.choices[0].message.content) if response.choices else ""
+            data, _, _ = parse_model_json(text)
+        except Exception as e:
+            logger.warning(
+                "vlm_describe_failed request_id=%s names=%s elapsed_ms=%s error=%s",
+                request_id,
+                len(names),
+                elapsed_ms(step_ms),
+                e,
             )
+            return {}
+        if not isinstance(data, dict):
+            logger.warning("vlm_describe_failed request_id=%s names=%s error=not_an_object", request_id, len(names))
+            return {}
+        # 模型返回的键可能大小写、括注与请求不同，按规范化名称对齐
+        by_key = {normalize_ingredient_name(str(key)): value for key, value in data.items() if isinstance(value, str)}
+        described = {
+            name: by_key[normalize_ingredient_name(name)]
+            for name in names
+            if by_key.get(normalize_ingredient_name(name))
+        }
+        observe_ms("describe", elapsed_ms(step_ms))
+        logger.info(
+            "vlm_describe_done request_id=%s elapsed_ms=%s names=%s described=%s",
+            request_id,
+            elapsed_ms(step_ms),
+            len(names),
+            len(described),
+        )
+        return described
+
+    def _log_usage(self, request_id: str, call: str, usage: object, model: Optional[str] = None) -> None:
+        """按调用类型记录 token 用量，便于对比 inline / cache 两种说明模式的输出 token"""
+        model = model or self.model_name
+        for kind in ("prompt", "completion"):
+            tokens = getattr(usage, f"{kind}_tokens", None)
+            if tokens:
+                OPENROUTER_TOKENS.inc(model, call, kind, amount=tokens)
+                add_request_counts(**{f"{kind}_tokens": tokens})
+        logger.info(
+            "vlm_usage request_id=%s call=%s descriptions=%s prompt_tokens=%s completion_tokens=%s total_tokens=%s",
+            request_id,
+            call,
+            "inline" if self.description_cache is None else "cache",
+            getattr(usage, "prompt_tokens", None),
+            getattr(usage, "completion_tokens", None),
+            getattr(usage, "total_tokens", None),
+        )